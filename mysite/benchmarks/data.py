@@ -0,0 +1,266 @@
+import datetime
+import random
+from dataclasses import dataclass, field
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.text import slugify
+
+from health.models import HealthDiary
+from health.services import rebuild_health_analytics
+from meals_tracker.models import Meal, MealCategory, RecipePortion, IngredientAmount
+from recipe.models import (
+    Ingredient, Ingredient_Unit, IngredientSearchTerm, Recipe, Recipe_Ingredient
+)
+from recipe.selectors import ingredient_get_search_terms, unit_get_default
+from users.models import Group, StravaActivity, StravaApi
+
+BENCHMARK_PASSWORD = 'benchmark'
+CATEGORIES = ('breakfast', 'lunch', 'dinner', 'snack')
+FOODS = ('apple', 'banana', 'bread', 'rice', 'pasta', 'chicken', 'beef', 'salmon',
+         'tofu', 'cheese', 'milk', 'yogurt', 'egg', 'oats', 'lentils', 'beans',
+         'tomato', 'potato', 'carrot', 'spinach', 'broccoli', 'pepper', 'onion')
+ADJECTIVES = ('fresh', 'dried', 'smoked', 'baked', 'raw', 'organic', 'frozen',
+              'roasted', 'boiled', 'sweet', 'spicy', 'light', 'whole', 'wild')
+
+
+@dataclass
+class BenchmarkScale:
+    users: int
+    group_size: int
+    ingredients: int
+    recipes_per_user: int
+    ingredients_per_recipe: int
+    # users having meals and diaries for every day of history
+    active_users: int
+    days: int
+    meals_per_day: int
+
+
+SCALES = {
+    'small': BenchmarkScale(
+        users=20, group_size=5, ingredients=500, recipes_per_user=5,
+        ingredients_per_recipe=4, active_users=5, days=30, meals_per_day=3),
+    'medium': BenchmarkScale(
+        users=500, group_size=50, ingredients=20000, recipes_per_user=10,
+        ingredients_per_recipe=6, active_users=20, days=365, meals_per_day=3),
+    'large': BenchmarkScale(
+        users=5000, group_size=250, ingredients=100000, recipes_per_user=20,
+        ingredients_per_recipe=8, active_users=50, days=3 * 365, meals_per_day=4),
+}
+
+
+@dataclass
+class BenchmarkData:
+    """ objects created by generator which scenarios work on """
+    users: list
+    recipes: dict[int, list[int]]
+    ingredients: list[int]
+    categories: list[int]
+    unit: int
+    start_date: datetime.date
+    end_date: datetime.date
+    dates: list[datetime.date] = field(init=False)
+
+    def __post_init__(self) -> None:
+        days = (self.end_date - self.start_date).days
+        self.dates = [self.start_date + datetime.timedelta(days=day) for day in range(days + 1)]
+
+
+class BenchmarkDataGenerator:
+    """ fill database with deterministic, seeded synthetic data. Rows are
+    inserted with bulk queries and explicit ids, so related rows can be
+    created without reading them back """
+
+    BATCH_SIZE = 2000
+
+    def __init__(self, scale: BenchmarkScale, seed: int = 0,
+                 end_date: datetime.date = None) -> None:
+        self.scale = scale
+        self.random = random.Random(seed)
+        self.end_date = end_date or datetime.date.today()
+        self.start_date = self.end_date - datetime.timedelta(days=scale.days - 1)
+
+    @transaction.atomic
+    def generate(self) -> BenchmarkData:
+        unit = unit_get_default()
+        categories = [MealCategory.objects.get_or_create(name=name)[0].id
+                      for name in CATEGORIES]
+        users = self._create_users()
+        ingredients = self._create_ingredients(users, unit.id)
+        recipes = self._create_recipes(users, ingredients, unit.id)
+        active_users = users[:self.scale.active_users]
+        for user_id in active_users:
+            self._create_history(user_id, recipes[user_id], ingredients, categories, unit.id)
+        self._reset_sequences()
+        active_users = list(get_user_model().objects.filter(id__in=active_users).order_by('id'))
+        for user in active_users:
+            rebuild_health_analytics(user)
+        return BenchmarkData(
+            users=active_users,
+            recipes={user.id: recipes[user.id] for user in active_users},
+            ingredients=ingredients,
+            categories=categories,
+            unit=unit.id,
+            start_date=self.start_date,
+            end_date=self.end_date,
+        )
+
+    def _create_users(self) -> list[int]:
+        """ create users, their groups and strava connections. Users are split
+        into chunks of group_size, first user of chunk has all of them in group """
+        password = make_password(BENCHMARK_PASSWORD)
+        first_id = self._next_id(get_user_model())
+        users = [get_user_model()(
+            id=first_id + i,
+            email=f'benchmark{first_id + i}@example.com',
+            name=f'benchmark{first_id + i}',
+            password=password,
+            age=self.random.randint(18, 70),
+            height=self.random.randint(150, 200),
+            weight=self.random.randint(50, 110),
+        ) for i in range(self.scale.users)]
+        self._insert(users)
+        ids = [user.id for user in users]
+        groups = self._insert([Group(founder_id=id, name=f'benchmark{id}\'s group')
+                               for id in ids])
+        group_by_founder = {group.founder_id: group.id for group in groups}
+        members = []
+        for start in range(0, len(ids), self.scale.group_size):
+            chunk = ids[start:start + self.scale.group_size]
+            members.extend(Group.members.through(
+                group_id=group_by_founder[chunk[0]], myuser_id=id) for id in chunk)
+            members.extend(Group.members.through(
+                group_id=group_by_founder[id], myuser_id=id) for id in chunk[1:])
+        self._insert(members)
+        self._insert([StravaApi(user_id=id) for id in ids])
+        return ids
+
+    def _create_ingredients(self, users: list[int], unit: int) -> list[int]:
+        """ create ingredients owned by random users, each with default unit
+        and indexed search terms """
+        ingredients = []
+        first_id = self._next_id(Ingredient)
+        for i in range(self.scale.ingredients):
+            user = self.random.choice(users)
+            name = f'{self.random.choice(ADJECTIVES)} {self.random.choice(FOODS)} {first_id + i}'
+            ingredients.append(Ingredient(
+                user_id=user,
+                name=name,
+                slug=f'{slugify(name)}-user-{user}',
+                type=Ingredient.SOLID,
+                calories=self.random.randint(10, 900),
+                proteins=round(self.random.uniform(0, 40), 1),
+                carbohydrates=round(self.random.uniform(0, 80), 1),
+                fats=round(self.random.uniform(0, 60), 1),
+            ))
+        self._insert(ingredients)
+        ids = [ingredient.id for ingredient in ingredients]
+        self._insert([Ingredient_Unit(ingredient_id=id, unit_id=unit, grams_in_one_unit=100)
+                      for id in ids])
+        # ingredients are new, so their search terms are inserted without
+        # comparing them with indexed ones like IndexIngredient does
+        self._insert([IngredientSearchTerm(ingredient_id=ingredient.id, kind=kind, term=term)
+                      for ingredient in ingredients
+                      for kind, term in sorted(ingredient_get_search_terms(ingredient))])
+        return ids
+
+    def _create_recipes(self, users: list[int], ingredients: list[int],
+                        unit: int) -> dict[int, list[int]]:
+        """ create recipes of every user, return their ids by user id """
+        recipes_by_user = {}
+        chunk_size = max(1, self.BATCH_SIZE // self.scale.recipes_per_user)
+        for start in range(0, len(users), chunk_size):
+            recipes = []
+            for user in users[start:start + chunk_size]:
+                recipes.extend(Recipe(
+                    user_id=user,
+                    name=f'recipe {number}',
+                    slug=f'recipe-{number}',
+                    portions=self.random.randint(1, 6),
+                    prepare_time=self.random.randint(5, 120),
+                    calories=self.random.randint(200, 3000),
+                ) for number in range(self.scale.recipes_per_user))
+            self._insert(recipes)
+            self._insert([Recipe_Ingredient(
+                recipe_id=recipe.id,
+                ingredient_id=ingredient,
+                unit_id=unit,
+                amount=self.random.randint(1, 5) * 50,
+            ) for recipe in recipes for ingredient in self.random.sample(
+                ingredients, min(len(ingredients), self.scale.ingredients_per_recipe))])
+            for recipe in recipes:
+                recipes_by_user.setdefault(recipe.user_id, []).append(recipe.id)
+        return recipes_by_user
+
+    def _create_history(self, user: int, recipes: list[int], ingredients: list[int],
+                        categories: list[int], unit: int) -> None:
+        """ create meals, strava activity and diary of user for every day
+        between dates """
+        meals, portions, amounts, activities, diaries = [], [], [], [], []
+        first_id = self._next_id(Meal)
+        weight = self.random.uniform(60, 100)
+        for day in range(self.scale.days):
+            date = self.start_date + datetime.timedelta(days=day)
+            day_calories = 0
+            for number in range(self.scale.meals_per_day):
+                meal_id = first_id + len(meals)
+                recipe_calories = self.random.randint(200, 800)
+                ingredient_calories = self.random.randint(50, 300)
+                meals.append(Meal(
+                    id=meal_id, user_id=user, date=date,
+                    category_id=categories[number % len(categories)],
+                    calories=recipe_calories + ingredient_calories))
+                portions.append(RecipePortion(
+                    meal_id=meal_id, recipe_id=self.random.choice(recipes), portion=1,
+                    calories=recipe_calories))
+                amounts.append(IngredientAmount(
+                    meal_id=meal_id, ingredient_id=self.random.choice(ingredients),
+                    unit_id=unit, amount=100, calories=ingredient_calories))
+                day_calories += recipe_calories + ingredient_calories
+            weight += self.random.uniform(-0.3, 0.3)
+            activities.append(StravaActivity(
+                user_id=user, strava_id=user * 100000 + day, name='run',
+                calories=self.random.randint(0, 900), date=date))
+            diaries.append(HealthDiary(
+                user_id=user, date=date, slug=slugify(date),
+                weight=round(weight, 1),
+                sleep_length=datetime.time(self.random.randint(5, 9), self.random.randint(0, 59)),
+                rest_heart_rate=self.random.randint(45, 75),
+                calories=day_calories,
+                burned_calories=activities[-1].calories,
+            ))
+        Meal.objects.bulk_create(meals, batch_size=self.BATCH_SIZE)
+        self._insert(portions)
+        self._insert(amounts)
+        self._insert(activities)
+        self._insert(diaries)
+
+    def _insert(self, objects: list) -> list:
+        """ bulk insert objects of single model, setting ids when not given """
+        if not objects:
+            return objects
+        model = type(objects[0])
+        next_id = self._next_id(model)
+        for offset, obj in enumerate(objects):
+            if obj.id is None:
+                obj.id = next_id + offset
+        model.objects.bulk_create(objects, batch_size=self.BATCH_SIZE)
+        return objects
+
+    @staticmethod
+    def _next_id(model) -> int:
+        return (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+    @staticmethod
+    def _reset_sequences() -> None:
+        """ move database sequences after explicitly inserted ids """
+        models = [get_user_model(), Group, Group.members.through, StravaApi, Ingredient,
+                  Ingredient_Unit, IngredientSearchTerm, Recipe, Recipe_Ingredient, Meal,
+                  RecipePortion, IngredientAmount, StravaActivity, HealthDiary]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
@@ -0,0 +1,106 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from benchmarks.data import SCALES, BenchmarkDataGenerator
+from benchmarks.runner import compare_with_baseline, load_report, run_scenario, save_report
+from benchmarks.scenarios import SCENARIOS, ScenarioContext
+
+BASELINES_DIR = Path(__file__).resolve().parent.parent.parent / 'baselines'
+
+
+class Command(BaseCommand):
+    """ generate synthetic data in test database, run scenarios on it and
+    compare latency and queries with baseline of the same scale """
+
+    help = 'Run benchmark scenarios and compare them with baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES.keys(), default='small')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            choices=[scenario.name for scenario in SCENARIOS],
+                            help='run only given scenario, can be repeated')
+        parser.add_argument('--baseline', type=Path,
+                            help='baseline file, defaults to baselines/<scale>.json')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='overwrite baseline with results')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='allowed relative p95 latency growth')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('At least one iteration is required')
+        baseline_path = options['baseline'] or BASELINES_DIR / f'{options["scale"]}.json'
+        scenarios = [scenario for scenario in SCENARIOS
+                     if not options['scenarios'] or scenario.name in options['scenarios']]
+
+        # enabled debug toolbar renders its panels on every request, which
+        # would dominate measured latency
+        middleware = [name for name in settings.MIDDLEWARE
+                      if not name.startswith('debug_toolbar')]
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(MIDDLEWARE=middleware):
+                report = self._run(scenarios, options)
+        finally:
+            teardown_databases(databases, verbosity=0)
+            teardown_test_environment()
+
+        baseline = load_report(baseline_path) if baseline_path.exists() else {}
+        self._print_report(report, baseline)
+        if options['save_baseline']:
+            save_report(report, baseline_path)
+            self.stdout.write(self.style.SUCCESS(f'Saved baseline {baseline_path}'))
+            return
+        if not baseline:
+            message = (f'Baseline {baseline_path} does not exist, nothing was compared. '
+                       'Save it with --save-baseline')
+            if options['fail_on_regression']:
+                raise CommandError(message)
+            self.stderr.write(self.style.ERROR(message))
+            return
+        regressions = compare_with_baseline(report, baseline, options['tolerance'])
+        for regression in regressions:
+            self.stdout.write(self.style.WARNING(f'Regression {regression}'))
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} regressions against {baseline_path}')
+
+    def _run(self, scenarios: list, options: dict) -> dict:
+        """ generate data and run scenarios on it, return report """
+        self.stdout.write(f'Generating {options["scale"]} data set...')
+        data = BenchmarkDataGenerator(SCALES[options['scale']], options['seed']).generate()
+        context = ScenarioContext(data, options['seed'])
+        report = {
+            'scale': options['scale'],
+            'seed': options['seed'],
+            'database': connection.vendor,
+            'scenarios': {},
+        }
+        for scenario in scenarios:
+            report['scenarios'][scenario.name] = run_scenario(
+                scenario, context, options['iterations'], options['warmup'])
+        return report
+
+    def _print_report(self, report: dict, baseline: dict) -> None:
+        self.stdout.write(f'{"scenario":<26}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+                          f'{"queries":>9}{"base p95":>10}{"base q":>8}')
+        for name, result in report['scenarios'].items():
+            base = baseline.get('scenarios', {}).get(name, {})
+            self.stdout.write(
+                f'{name:<26}{result["p50_ms"]:>10.2f}{result["p95_ms"]:>10.2f}'
+                f'{result["p99_ms"]:>10.2f}{result["queries_max"]:>9}'
+                f'{base.get("p95_ms", "-"):>10}{base.get("queries_max", "-"):>8}')
@@ -0,0 +1,74 @@
+import json
+import math
+import time
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from benchmarks.scenarios import Scenario, ScenarioContext
+
+
+def run_scenario(scenario: Scenario, context: ScenarioContext,
+                 iterations: int, warmup: int = 0) -> dict:
+    """ run scenario as random user iterations times, every iteration in
+    rolled back transaction so all of them see the same data. Return
+    latency percentiles in milliseconds and numbers of SQL queries """
+    timings, queries = [], []
+    for iteration in range(warmup + iterations):
+        context.switch_user()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                scenario.run(context)
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        if iteration >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+    return {
+        'iterations': iterations,
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'queries_p50': percentile(queries, 50),
+        'queries_max': max(queries),
+    }
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """ return nearest-rank percentile of values """
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def compare_with_baseline(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """ return descriptions of scenarios which are slower than baseline p95
+    by more than tolerance part, or run more queries than baseline """
+    regressions = []
+    for name, result in report['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: p95 {result["p95_ms"]}ms, baseline {base["p95_ms"]}ms')
+        if result['queries_max'] > base['queries_max']:
+            regressions.append(
+                f'{name}: {result["queries_max"]} queries, baseline {base["queries_max"]}')
+    return regressions
+
+
+def load_report(path: Path) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_report(report: dict, path: Path) -> None:
+    """ save report with stable formatting, so changes show up as small diffs """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+        file.write('\n')
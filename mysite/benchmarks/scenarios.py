@@ -0,0 +1,125 @@
+import random
+from dataclasses import dataclass
+from typing import Callable
+
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from benchmarks.data import ADJECTIVES, FOODS, BenchmarkData
+from health.models import HealthDiary
+from health.services import (
+    AddStatistics,
+    AddStatisticsDto,
+    UpdateDiaryNutrition,
+    UpdateDiaryNutritionDto,
+)
+from meals_tracker.services import CreateMeal, CreateMealDto
+
+
+class ScenarioContext:
+    """ state shared by scenario iterations: generated data, seeded random
+    and API client authenticated as random active user """
+
+    def __init__(self, data: BenchmarkData, seed: int = 0) -> None:
+        self.data = data
+        self.random = random.Random(seed)
+        self.client = APIClient()
+        self.user = None
+
+    def switch_user(self) -> None:
+        self.user = self.random.choice(self.data.users)
+        self.client.force_authenticate(self.user)
+
+    def get(self, url: str, params: dict = None) -> None:
+        response = self.client.get(url, params)
+        if response.status_code >= 400:
+            raise AssertionError(f'GET {url} returned {response.status_code}')
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    run: Callable[[ScenarioContext], None]
+
+
+def recipes_list(context: ScenarioContext) -> None:
+    context.get(reverse('recipe:recipe-list'))
+
+
+def ingredients_list(context: ScenarioContext) -> None:
+    offset = context.random.randrange(max(1, len(context.data.ingredients) - 10))
+    context.get(reverse('recipe:ingredient-list'), {'offset': offset})
+
+
+def ingredients_list_cursor(context: ScenarioContext) -> None:
+    context.get(reverse('recipe:ingredient-list'), {'pagination': 'cursor'})
+
+
+def ingredient_search(context: ScenarioContext) -> None:
+    query = f'{context.random.choice(ADJECTIVES)} {context.random.choice(FOODS)[:-1]}'
+    context.get(reverse('recipe:ingredient-search'), {'q': query})
+
+
+def meals_list(context: ScenarioContext) -> None:
+    context.get(reverse('meals_tracker:meal-create'),
+                {'date': context.random.choice(context.data.dates)})
+
+
+def meals_list_expanded(context: ScenarioContext) -> None:
+    context.get(reverse('meals_tracker:meal-create'), {
+        'date': context.random.choice(context.data.dates),
+        'expand': 'recipes,ingredients'})
+
+
+def health_diary_detail(context: ScenarioContext) -> None:
+    date = context.random.choice(context.data.dates)
+    context.get(reverse('health:health-diary-detail', kwargs={'slug': str(date)}))
+
+
+def create_meal_service(context: ScenarioContext) -> None:
+    CreateMeal().create(CreateMealDto(
+        user=context.user,
+        date=context.random.choice(context.data.dates),
+        category=context.random.choice(context.data.categories),
+        recipes=[{'recipe': context.random.choice(context.data.recipes[context.user.id]),
+                  'portion': 1}],
+        ingredients=[{'ingredient': context.random.choice(context.data.ingredients),
+                      'unit': context.data.unit, 'amount': 100}],
+    ))
+
+
+def add_statistics_service(context: ScenarioContext) -> None:
+    diary = HealthDiary.objects.get(
+        user=context.user, date=context.random.choice(context.data.dates))
+    AddStatistics().add(diary, AddStatisticsDto(
+        weight=round(context.random.uniform(60, 100), 1)))
+
+
+def update_diary_nutrition_service(context: ScenarioContext) -> None:
+    UpdateDiaryNutrition().update(UpdateDiaryNutritionDto(
+        user=context.user,
+        date=context.random.choice(context.data.dates),
+        nutrients={'calories': context.random.randint(100, 800)},
+    ))
+
+
+SCENARIOS = [
+    Scenario('recipes-list', 'RecipesApi first page of own and group recipes', recipes_list),
+    Scenario('ingredients-list', 'IngredientsApi page at random offset', ingredients_list),
+    Scenario('ingredients-list-cursor', 'IngredientsApi first cursor page',
+             ingredients_list_cursor),
+    Scenario('ingredient-search', 'IngredientSearchApi ingredients matching partial name',
+             ingredient_search),
+    Scenario('meals-list', 'MealsApi meals of random day', meals_list),
+    Scenario('meals-list-expanded', 'MealsApi meals of random day with recipes and ingredients',
+             meals_list_expanded),
+    Scenario('health-diary-detail', 'HealthDiaryDetailApi diary of random day',
+             health_diary_detail),
+    Scenario('create-meal', 'CreateMeal service with recipe and ingredient',
+             create_meal_service),
+    Scenario('add-statistics', 'AddStatistics service changing weight of past day',
+             add_statistics_service),
+    Scenario('update-diary-nutrition', 'UpdateDiaryNutrition service of random day',
+             update_diary_nutrition_service),
+]
@@ -0,0 +1,66 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from benchmarks.data import BenchmarkScale, BenchmarkDataGenerator
+from benchmarks.runner import compare_with_baseline, percentile, run_scenario
+from benchmarks.scenarios import SCENARIOS, ScenarioContext
+from health.models import HealthAnalytics, HealthDiary
+from meals_tracker.models import Meal
+from recipe.models import Ingredient, IngredientSearchTerm, Recipe
+from recipe.selectors import ingredient_search
+from users.models import Group
+
+SCALE = BenchmarkScale(users=6, group_size=3, ingredients=30, recipes_per_user=2,
+                       ingredients_per_recipe=3, active_users=2, days=5, meals_per_day=2)
+
+
+class BenchmarkTests(TestCase):
+
+    def setUp(self):
+        self.data = BenchmarkDataGenerator(
+            SCALE, seed=1, end_date=datetime.date(2021, 3, 10)).generate()
+
+    def test_generating_data_of_given_scale(self) -> None:
+        self.assertEqual(get_user_model().objects.count(), SCALE.users)
+        self.assertEqual(Ingredient.objects.count(), SCALE.ingredients)
+        self.assertEqual(Recipe.objects.count(), SCALE.users * SCALE.recipes_per_user)
+        self.assertEqual(Meal.objects.count(),
+                         SCALE.active_users * SCALE.days * SCALE.meals_per_day)
+        self.assertEqual(HealthDiary.objects.count(), SCALE.active_users * SCALE.days)
+        self.assertEqual(HealthAnalytics.objects.count(), SCALE.active_users * SCALE.days)
+        leader = Group.objects.get(founder=self.data.users[0])
+        self.assertEqual(leader.members.count(), SCALE.group_size)
+        self.assertEqual(self.data.dates[0], datetime.date(2021, 3, 6))
+        ingredient = Ingredient.objects.get(id=self.data.ingredients[0])
+        self.assertTrue(IngredientSearchTerm.objects.filter(ingredient=ingredient).exists())
+        self.assertIn(ingredient, ingredient_search(ingredient.name))
+
+    def test_running_every_scenario_without_changing_data(self) -> None:
+        context = ScenarioContext(self.data, seed=1)
+        meals = Meal.objects.count()
+        for scenario in SCENARIOS:
+            result = run_scenario(scenario, context, iterations=3, warmup=1)
+            self.assertEqual(result['iterations'], 3)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['queries_max'], 0)
+        self.assertEqual(Meal.objects.count(), meals)
+
+    def test_comparing_report_with_baseline(self) -> None:
+        baseline = {'scenarios': {
+            'meals-list': {'p95_ms': 10, 'queries_max': 2},
+            'recipes-list': {'p95_ms': 10, 'queries_max': 4},
+        }}
+        report = {'scenarios': {
+            'meals-list': {'p95_ms': 11, 'queries_max': 3},
+            'recipes-list': {'p95_ms': 13, 'queries_max': 4},
+            'create-meal': {'p95_ms': 100, 'queries_max': 100},
+        }}
+        regressions = compare_with_baseline(report, baseline, tolerance=0.2)
+        self.assertEqual(regressions, [
+            'meals-list: 3 queries, baseline 2',
+            'recipes-list: p95 13ms, baseline 10ms',
+        ])
+        self.assertEqual(percentile([5, 1, 4, 2, 3], 50), 3)
+        self.assertEqual(percentile([5, 1, 4, 2, 3], 99), 5)
@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from health.services import rebuild_health_analytics
+
+
+class Command(BaseCommand):
+    """ calculate materialized health analytics from diaries of given or
+    all users, used after deploy and to repair analytics """
+
+    help = 'Rebuild health analytics from diaries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='rebuild only analytics of this user')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(healthdiary__isnull=False).distinct()
+        if options['email']:
+            users = get_user_model().objects.filter(email=options['email'])
+            if not users.exists():
+                raise CommandError('User does not exist')
+        days = 0
+        for user in users.iterator():
+            days += rebuild_health_analytics(user)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt analytics of {days} days'))
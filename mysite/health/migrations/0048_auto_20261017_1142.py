@@ -0,0 +1,68 @@
+# Generated by Django 3.1.7 on 2026-10-17 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0047_auto_20211005_1245'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthdiary',
+            name='calcium',
+            field=models.FloatField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='healthdiary',
+            name='carbohydrates',
+            field=models.FloatField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='healthdiary',
+            name='fats',
+            field=models.FloatField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='healthdiary',
+            name='fiber',
+            field=models.FloatField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='healthdiary',
+            name='iron',
+            field=models.FloatField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='healthdiary',
+            name='magnesium',
+            field=models.FloatField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='healthdiary',
+            name='potassium',
+            field=models.FloatField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='healthdiary',
+            name='proteins',
+            field=models.FloatField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='healthdiary',
+            name='selenium',
+            field=models.FloatField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='healthdiary',
+            name='sodium',
+            field=models.FloatField(blank=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='healthdiary',
+            name='zinc',
+            field=models.FloatField(blank=True, default=0),
+        ),
+    ]
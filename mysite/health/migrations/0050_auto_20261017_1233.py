@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-17 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0049_healthdiary_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='healthdiary',
+            index=models.Index(fields=['user', 'date'], name='health_heal_user_id_3a40ee_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.1.7 on 2026-10-17 12:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('health', '0050_auto_20261017_1233'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HealthAnalytics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('weight', models.FloatField(null=True)),
+                ('rest_heart_rate', models.PositiveSmallIntegerField(null=True)),
+                ('sleep_length', models.PositiveIntegerField(null=True)),
+                ('calories', models.PositiveIntegerField(default=0)),
+                ('burned_calories', models.PositiveIntegerField(default=0)),
+                ('weight_trend', models.FloatField(null=True)),
+                ('total_days', models.PositiveIntegerField(default=0)),
+                ('total_weight', models.FloatField(default=0)),
+                ('weight_days', models.PositiveIntegerField(default=0)),
+                ('total_rest_heart_rate', models.PositiveIntegerField(default=0)),
+                ('rest_heart_rate_days', models.PositiveIntegerField(default=0)),
+                ('total_sleep_length', models.PositiveBigIntegerField(default=0)),
+                ('sleep_length_days', models.PositiveIntegerField(default=0)),
+                ('total_calories', models.PositiveBigIntegerField(default=0)),
+                ('calories_days', models.PositiveIntegerField(default=0)),
+                ('total_burned_calories', models.PositiveBigIntegerField(default=0)),
+                ('burned_calories_days', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='health_analytics', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.7 on 2026-10-17 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0051_healthanalytics'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='healthanalytics',
+            name='calories',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='healthanalytics',
+            name='total_calories',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='healthdiary',
+            name='calories',
+            field=models.FloatField(blank=True, default=0, verbose_name='calories'),
+        ),
+    ]
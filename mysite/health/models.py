@@ -8,6 +8,11 @@ from django.conf import settings
 
 class HealthDiary(models.Model):
 
+    # nutrients summed from meals, kept with full precision
+    NUTRITION_FIELDS = ('calories', 'proteins', 'carbohydrates', 'fats', 'fiber',
+                        'sodium', 'potassium', 'calcium', 'iron', 'magnesium',
+                        'selenium', 'zinc')
+
     date = models.DateField(default=datetime.date.today)
     slug = models.SlugField(blank=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
@@ -17,10 +22,21 @@ class HealthDiary(models.Model):
     sleep_length = models.TimeField(null=True, blank=True)
     rest_heart_rate = models.PositiveSmallIntegerField(
         null=True, blank=True, default=0, verbose_name='heart rate')
-    calories = models.PositiveIntegerField(blank=True, default=0,
-                                           verbose_name='calories')
+    calories = models.FloatField(blank=True, default=0, verbose_name='calories')
     burned_calories = models.PositiveSmallIntegerField(blank=True, default=0)
+    proteins = models.FloatField(blank=True, default=0)
+    carbohydrates = models.FloatField(blank=True, default=0)
+    fats = models.FloatField(blank=True, default=0)
+    fiber = models.FloatField(blank=True, default=0)
+    sodium = models.FloatField(blank=True, default=0)
+    potassium = models.FloatField(blank=True, default=0)
+    calcium = models.FloatField(blank=True, default=0)
+    iron = models.FloatField(blank=True, default=0)
+    magnesium = models.FloatField(blank=True, default=0)
+    selenium = models.FloatField(blank=True, default=0)
+    zinc = models.FloatField(blank=True, default=0)
     last_update = models.PositiveIntegerField(default=time.time)
+    updated_at = models.DateTimeField(auto_now=True)
     daily_thoughts = models.TextField(
         max_length=2000, blank=True, null=True)
 
@@ -29,6 +45,7 @@ class HealthDiary(models.Model):
 
     class Meta:
         unique_together = ('date', 'user')
+        indexes = [models.Index(fields=['user', 'date'])]
 
     def save(self, *args, **kwargs):
         """ override for slug creation """
@@ -42,3 +59,40 @@ class HealthDiary(models.Model):
         if isinstance(self.sleep_length, str):
             self.sleep_length = datetime.strptime(
                 self.sleep_length, '%H:%M:%S')
+
+
+class HealthAnalytics(models.Model):
+    """ materialized statistics of diary for single day. Besides daily values
+    it keeps running totals since first diary of user, so averages of any
+    window are difference of totals of its last day and day before it """
+
+    TRACKED_FIELDS = ('weight', 'rest_heart_rate', 'sleep_length',
+                      'calories', 'burned_calories')
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, related_name='health_analytics')
+    date = models.DateField()
+    weight = models.FloatField(null=True)
+    rest_heart_rate = models.PositiveSmallIntegerField(null=True)
+    # in seconds
+    sleep_length = models.PositiveIntegerField(null=True)
+    calories = models.FloatField(default=0)
+    burned_calories = models.PositiveIntegerField(default=0)
+    weight_trend = models.FloatField(null=True)
+    total_days = models.PositiveIntegerField(default=0)
+    total_weight = models.FloatField(default=0)
+    weight_days = models.PositiveIntegerField(default=0)
+    total_rest_heart_rate = models.PositiveIntegerField(default=0)
+    rest_heart_rate_days = models.PositiveIntegerField(default=0)
+    total_sleep_length = models.PositiveBigIntegerField(default=0)
+    sleep_length_days = models.PositiveIntegerField(default=0)
+    total_calories = models.FloatField(default=0)
+    calories_days = models.PositiveIntegerField(default=0)
+    total_burned_calories = models.PositiveBigIntegerField(default=0)
+    burned_calories_days = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'date')
+
+    def __str__(self):
+        return f'{self.user_id} {self.date}'
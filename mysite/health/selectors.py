@@ -1,12 +1,27 @@
 from typing import Iterable
+from collections import deque
 import datetime
 
 from django.db import models
-from django.db.models import Avg
+from django.db.models import (
+    Min, Max, Avg, Count, F, Q, FloatField, ExpressionWrapper, Subquery, OuterRef, Exists
+)
+from django.db.models.functions import (
+    TruncDay, TruncWeek, TruncMonth, ExtractHour, ExtractMinute, ExtractSecond
+)
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 
-from health.models import HealthDiary
+from health.models import HealthDiary, HealthAnalytics
+from users.models import StravaActivity, StravaApi, StravaSyncJob
+from mysite import settings
+
+# trunc function and approximate length in days of every series bucket
+SERIES_BUCKETS = {
+    'day': (TruncDay, 1),
+    'week': (TruncWeek, 7),
+    'month': (TruncMonth, 28),
+}
 
 
 def health_diary_get(user: get_user_model, date: datetime) -> HealthDiary:
@@ -15,6 +30,29 @@ def health_diary_get(user: get_user_model, date: datetime) -> HealthDiary:
     return obj
 
 
+def health_diary_get_version(user: get_user_model, date: str) -> dict:
+    """ return values identifying version of diary detail in single query:
+    diary updated_at, number and latest updated_at of stored activities,
+    whether user is connected to strava and state of synchronization job.
+    Return None if diary does not exist """
+    validate_date(date)
+    activities = StravaActivity.objects.filter(
+        user=OuterRef('user'), date__date=OuterRef('date')).order_by().values('user')
+    job = StravaSyncJob.objects.filter(user=OuterRef('user'), date=OuterRef('date'))
+    return HealthDiary.objects.filter(user=user, date=date).annotate(
+        activities_count=Subquery(activities.annotate(count=Count('id')).values('count')),
+        activities_updated_at=Subquery(
+            activities.annotate(updated_at=Max('updated_at')).values('updated_at')),
+        strava_connected=Exists(StravaApi.objects.filter(user=OuterRef('user')).exclude(
+            access_token='').exclude(refresh_token='').exclude(expires_at=0).exclude(
+            expires_at__isnull=True)),
+        job_status=Subquery(job.values('status')),
+        job_last_synced_at=Subquery(job.values('last_synced_at')),
+        job_run_after=Subquery(job.values('run_after')),
+    ).values('id', 'updated_at', 'activities_count', 'activities_updated_at',
+             'strava_connected', 'job_status', 'job_last_synced_at', 'job_run_after').first()
+
+
 def health_diary_list(user: get_user_model) -> Iterable[HealthDiary]:
     return HealthDiary.objects.filter(user=user).order_by('-date')
 
@@ -37,6 +75,83 @@ def get_all_values_for_given_field(user: get_user_model, slug: str) -> HealthDia
     return HealthDiary.objects.filter(user=user).values(field_name)
 
 
+def get_statistic_series(user: get_user_model, slug: str, start: datetime.date = None,
+                         end: datetime.date = None, bucket: str = 'day',
+                         window: int = None) -> dict:
+    """ return field values between dates resampled into day, week or month buckets,
+    time fields are returned in seconds """
+    field = HealthDiary._meta.get_field(_map_slug_to_health_diary_field(slug))
+    end = end or datetime.date.today()
+    start = start or end - datetime.timedelta(days=settings.HEALTH_SERIES_DEFAULT_DAYS)
+    if start > end:
+        raise ValidationError('Start date must be before end date')
+    if bucket not in SERIES_BUCKETS:
+        raise ValidationError(f'{bucket} is not valid bucket')
+    trunc, bucket_days = SERIES_BUCKETS[bucket]
+    if (end - start).days // bucket_days + 1 > settings.HEALTH_SERIES_MAX_POINTS:
+        raise ValidationError(
+            f'Date range is too long for {bucket} buckets, use shorter range or bigger bucket')
+
+    value = _get_series_value_expression(field)
+    points = list(HealthDiary.objects.filter(
+        user=user, date__gte=start, date__lte=end, **{f'{field.name}__isnull': False}
+    ).annotate(bucket=trunc('date')).values('bucket').annotate(
+        min=Min(value), max=Max(value), avg=Avg(value), count=Count('id')
+    ).order_by('bucket'))
+
+    sums = []
+    for point in points:
+        point['date'] = point.pop('bucket')
+        sums.append(point['avg'] * point['count'])
+        point['avg'] = round(point['avg'], 2)
+    if window:
+        _add_rolling_average(points, sums, bucket, window)
+    return {
+        'name': field.name,
+        'bucket': bucket,
+        'from': start,
+        'to': end,
+        'points': points,
+    }
+
+
+def _get_series_value_expression(field: models.Field) -> ExpressionWrapper:
+    """ return expression with numeric value of field, time fields are converted to seconds """
+    if isinstance(field, models.TimeField):
+        value = (ExtractHour(field.name) * 3600 + ExtractMinute(field.name) * 60
+                 + ExtractSecond(field.name))
+    else:
+        value = F(field.name)
+    return ExpressionWrapper(value, output_field=FloatField())
+
+
+def _get_window_start(date: datetime.date, bucket: str, window: int) -> datetime.date:
+    """ return date of first bucket of window which ends with bucket of given date """
+    if bucket == 'month':
+        month = date.year * 12 + date.month - window
+        return datetime.date(month // 12, month % 12 + 1, 1)
+    return date - datetime.timedelta(days=SERIES_BUCKETS[bucket][1] * (window - 1))
+
+
+def _add_rolling_average(points: list[dict], sums: list[float], bucket: str,
+                         window: int) -> None:
+    """ add average of values of last window calendar buckets to every point,
+    buckets are weighted by number of values. Buckets without values do not
+    stretch the window """
+    values = deque()
+    total = count = 0
+    for point, value_sum in zip(points, sums):
+        values.append((point['date'], value_sum, point['count']))
+        total += value_sum
+        count += point['count']
+        start = _get_window_start(point['date'], bucket, window)
+        while values[0][0] < start:
+            _, old_sum, old_count = values.popleft()
+            total -= old_sum
+            count -= old_count
+        point['rolling_avg'] = round(total / count, 2)
+
+
 def _map_slug_to_health_diary_field(slug: str) -> str:
     """ map verbose name of field to model field name and return it """
     approved_fields = _get_fields_allowed_for_calculations()
@@ -61,12 +176,33 @@ def _get_fields_allowed_for_calculations() -> list[models]:
 
 def get_weekly_avg_stats(user: get_user_model) -> dict:
     """ return avarage values for statistics """
-    week_ago_date = datetime.date.today() - datetime.timedelta(days=7)
-    stats = HealthDiary.objects.filter(user=user).filter(date__gte=week_ago_date).aggregate(
-        weight=Avg('weight'),
-        rest_heart_rate=Avg('rest_heart_rate'),
-        sleep_length=Avg('sleep_length'),
-        calories=Avg('calories'),
-        burned_calories=Avg('burned_calories'),
-        )
+    today = datetime.date.today()
+    return get_health_analytics(user, today - datetime.timedelta(days=7), today)
+
+
+def get_health_analytics(user: get_user_model, start: datetime.date,
+                         end: datetime.date) -> dict:
+    """ return averages, energy balance and weight trend between dates. Both
+    boundary rows of materialized analytics are read in single query """
+    if start > end:
+        raise ValidationError('Start date must be before end date')
+    rows = HealthAnalytics.objects.filter(user=user, date__lte=end).order_by('-date')
+    last = rows.values('id')[:1]
+    before = rows.filter(date__lt=start).values('id')[:1]
+    boundaries = sorted(HealthAnalytics.objects.filter(
+        Q(id=Subquery(last)) | Q(id=Subquery(before))), key=lambda row: row.date)
+    last = boundaries[-1] if boundaries else None
+    before = boundaries[0] if boundaries and boundaries[0].date < start else None
+
+    def total(name: str) -> float:
+        if last is None:
+            return 0
+        return getattr(last, name) - (getattr(before, name) if before else 0)
+
+    stats = {'from': start, 'to': end, 'days': total('total_days')}
+    for field in HealthAnalytics.TRACKED_FIELDS:
+        days = total(f'{field}_days')
+        stats[field] = round(total(f'total_{field}') / days, 2) if days else None
+    stats['energy_balance'] = total('total_calories') - total('total_burned_calories')
+    stats['weight_trend'] = last.weight_trend if last else None
     return stats
@@ -23,11 +23,31 @@ class HealthDiaryDetailSerializer(serializers.ModelSerializer):
     """ serializer for retreiving HealthDiary objects"""
 
     activities = serializers.SerializerMethodField()
+    strava_sync = serializers.SerializerMethodField()
 
     class Meta:
         model = HealthDiary
         exclude = ('last_update', )
 
+    def to_representation(self, instance) -> dict:
+        """ round nutrients, which are stored with full precision """
+        ret = super().to_representation(instance)
+        for field in HealthDiary.NUTRITION_FIELDS:
+            ret[field] = round(ret[field], 2)
+        ret['calories'] = round(ret['calories'])
+        return ret
+
+    def get_strava_sync(self, obj):
+        """ return state of activities synchronization with strava, provided
+        in context as 'strava_sync' job """
+        job = self.context.get('strava_sync')
+        if job is None:
+            return None
+        return {
+            'status': job.get_status_display(),
+            'last_synced_at': job.last_synced_at,
+        }
+
     def get_activities(self, obj):
         """ get activities for given day """
 
@@ -38,8 +58,6 @@ class HealthDiaryDetailSerializer(serializers.ModelSerializer):
                 return None
         activities = users_selectors.get_activities(
             user=obj.user, date=obj.date)
-        for activity in activities:
-            obj.burned_calories += activity.calories
         return StravaActivitySerializer(activities, many=True).data
 
 
@@ -50,3 +68,22 @@ class AddStatisticsSerializer(serializers.Serializer):
     sleep_length = serializers.TimeField(required=False)
     rest_heart_rate = serializers.IntegerField(required=False)
     daily_thoughts = serializers.CharField(required=False, allow_blank=True)
+
+
+class DateRangeInputSerializer(serializers.Serializer):
+    """ serializing from and to dates query params """
+
+    to = serializers.DateField(required=False)
+
+    def get_fields(self) -> dict:
+        """ add field named as python keyword """
+        fields = super().get_fields()
+        fields['from'] = serializers.DateField(required=False)
+        return fields
+
+
+class HealthStatisticSeriesInputSerializer(DateRangeInputSerializer):
+    """ serializing health statistic series query params """
+
+    bucket = serializers.ChoiceField(['day', 'week', 'month'], default='day')
+    window = serializers.IntegerField(min_value=2, max_value=366, required=False)
@@ -4,10 +4,12 @@ import time
 from dataclasses import dataclass
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
 
-from health.models import HealthDiary
-from health import selectors
-from meals_tracker.selectors import meal_list
+from health.models import HealthDiary, HealthAnalytics
+from mysite import settings
+from users import selectors as users_selectors
 
 
 @dataclass
@@ -41,18 +43,201 @@ class AddStatistics:
             if new_value:
                 setattr(diary, attr, new_value)
         diary.save()
+        update_health_analytics(diary.user, diary.date)
 
 
-class RecalculateDiaryCaloriesIntake:
-    """ Service called from meals_tracker signals only """
+@dataclass
+class UpdateDiaryNutritionDto:
+    user: get_user_model
+    date: datetime.date
+    nutrients: dict[str, float]
+
+
+class UpdateDiaryNutrition:
+    """ Service called from meals_tracker services only. Apply difference
+    of nutrients to diary for given day in single UPDATE. Values are kept
+    with full precision, drift is repaired by rebuild_diary_nutrition
+    command """
+
+    def update(self, dto: UpdateDiaryNutritionDto) -> None:
+        changes = {}
+        for field, value in dto.nutrients.items():
+            if value:
+                changes[field] = F(field) + value
+        if not changes:
+            return
+        diary = HealthDiary.objects.get_or_create(
+            user=dto.user, date=dto.date)[0]
+        HealthDiary.objects.filter(id=diary.id).update(
+            updated_at=datetime.datetime.now(), **changes)
+        update_health_analytics(dto.user, dto.date)
+
+
+@dataclass
+class UpdateDiaryBurnedCaloriesDto:
+    user: get_user_model
+    date: datetime.date
+    burned_calories: int
+
+
+class UpdateDiaryBurnedCalories:
+    """ Service called from strava services only. Set calories burned in
+    stored activities of the day, diary is created when it does not exist """
 
-    def recalculate(self, user: get_user_model, date: datetime.date) -> None:
-        diary = selectors.health_diary_get(user=user, date=date)
-        diary.calories = self._get_calories_from_meals(user, date)
+    @transaction.atomic
+    def update(self, dto: UpdateDiaryBurnedCaloriesDto) -> None:
+        diary = HealthDiary.objects.filter(user=dto.user, date=dto.date).first()
+        if (diary.burned_calories if diary else 0) == dto.burned_calories:
+            return
+        if diary is None:
+            diary = HealthDiary.objects.create(user=dto.user, date=dto.date)
+        HealthDiary.objects.filter(id=diary.id).update(
+            burned_calories=dto.burned_calories, updated_at=datetime.datetime.now())
+        update_health_analytics(dto.user, dto.date)
+
+
+@transaction.atomic
+def reconcile_diary_nutrition(user: get_user_model, daily: dict[datetime.date, dict[str, float]],
+                              dry_run: bool = False) -> list[datetime.date]:
+    """ set nutrients of user diaries to given daily sums, diaries missing
+    for days with meals are created. Return dates of diaries which differed,
+    with dry_run they are not corrected """
+    diaries = {diary.date: diary for diary in HealthDiary.objects.filter(user=user)}
+    corrected = []
+    for date in sorted(diaries.keys() | daily.keys()):
+        expected = {field: daily.get(date, {}).get(field, 0)
+                    for field in HealthDiary.NUTRITION_FIELDS}
+        diary = diaries.get(date)
+        if diary is not None and all(abs(getattr(diary, field) - value) < 1e-6
+                                     for field, value in expected.items()):
+            continue
+        corrected.append(date)
+        if dry_run:
+            continue
+        diary = diary or HealthDiary(user=user, date=date)
+        for field, value in expected.items():
+            setattr(diary, field, value)
         diary.save()
+    if corrected and not dry_run:
+        rebuild_health_analytics(user)
+    return corrected
+
+
+@transaction.atomic
+def update_health_analytics(user: get_user_model, date: datetime.date) -> None:
+    """ apply change of diary to materialized analytics. Running totals of
+    given and following days are shifted in single UPDATE, weight trend is
+    recalculated from given day only when weight changed """
+    # analytics of user are updated one at a time to keep totals consistent
+    get_user_model().objects.select_for_update().filter(id=user.id).first()
+    diary = HealthDiary.objects.get(user=user, date=date)
+    values = _get_analytics_values(diary)
+    analytics = HealthAnalytics.objects.filter(user=user, date=date).first()
+    changes = {}
+    if analytics is None:
+        analytics = _create_empty_analytics(user, date)
+        previous = dict.fromkeys(HealthAnalytics.TRACKED_FIELDS)
+        changes['total_days'] = F('total_days') + 1
+    else:
+        previous = {field: getattr(analytics, field) for field in HealthAnalytics.TRACKED_FIELDS}
+    for field in HealthAnalytics.TRACKED_FIELDS:
+        old, new = previous[field], values[field]
+        if (new or 0) != (old or 0):
+            changes[f'total_{field}'] = F(f'total_{field}') + ((new or 0) - (old or 0))
+        if (new is None) != (old is None):
+            changes[f'{field}_days'] = F(f'{field}_days') + (1 if old is None else -1)
+    HealthAnalytics.objects.filter(id=analytics.id).update(**values)
+    if changes:
+        HealthAnalytics.objects.filter(user=user, date__gte=date).update(**changes)
+    if values['weight'] != previous['weight']:
+        _update_weight_trend(user, date)
+
+
+@transaction.atomic
+def rebuild_health_analytics(user: get_user_model) -> int:
+    """ calculate analytics of user from all diaries, burned calories of
+    diaries are first set from stored activities. Return number of days """
+    _reconcile_burned_calories(user)
+    rows = []
+    totals = {}
+    for diary in HealthDiary.objects.filter(user=user).order_by('date'):
+        values = _get_analytics_values(diary)
+        totals['total_days'] = totals.get('total_days', 0) + 1
+        for field, value in values.items():
+            if value is not None:
+                totals[f'total_{field}'] = totals.get(f'total_{field}', 0) + value
+                totals[f'{field}_days'] = totals.get(f'{field}_days', 0) + 1
+        rows.append(HealthAnalytics(user=user, date=diary.date, **values, **totals))
+    _calculate_weight_trend(rows, None)
+    HealthAnalytics.objects.filter(user=user).delete()
+    HealthAnalytics.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def _reconcile_burned_calories(user: get_user_model) -> None:
+    """ set burned calories of user diaries to sum of calories of stored
+    activities, diaries missing for days with activities are created """
+    burned = users_selectors.get_activities_calories(user)
+    diaries = {diary.date: diary for diary in HealthDiary.objects.filter(user=user)}
+    now = datetime.datetime.now()
+    changed = []
+    for date, diary in diaries.items():
+        if diary.burned_calories != burned.get(date, 0):
+            diary.burned_calories = burned.get(date, 0)
+            diary.updated_at = now
+            changed.append(diary)
+    HealthDiary.objects.bulk_update(changed, ['burned_calories', 'updated_at'],
+                                    batch_size=500)
+    HealthDiary.objects.bulk_create([
+        HealthDiary(user=user, date=date, burned_calories=calories)
+        for date, calories in burned.items() if date not in diaries and calories],
+        batch_size=500)
+
+
+def _get_analytics_values(diary: HealthDiary) -> dict:
+    """ return values of diary tracked by analytics """
+    values = {field: getattr(diary, field) for field in HealthAnalytics.TRACKED_FIELDS}
+    # diary defaults heart rate to 0 when it was not measured
+    values['rest_heart_rate'] = values['rest_heart_rate'] or None
+    sleep_length = values['sleep_length']
+    if sleep_length is not None:
+        values['sleep_length'] = (sleep_length.hour * 3600 + sleep_length.minute * 60
+                                  + sleep_length.second)
+    return values
+
+
+def _create_empty_analytics(user: get_user_model, date: datetime.date) -> HealthAnalytics:
+    """ create analytics without values of the day, with totals of previous day """
+    previous = HealthAnalytics.objects.filter(
+        user=user, date__lt=date).order_by('-date').first()
+    totals = {}
+    if previous is not None:
+        totals['total_days'] = previous.total_days
+        for field in HealthAnalytics.TRACKED_FIELDS:
+            totals[f'total_{field}'] = getattr(previous, f'total_{field}')
+            totals[f'{field}_days'] = getattr(previous, f'{field}_days')
+    return HealthAnalytics.objects.create(
+        user=user, date=date, calories=0, burned_calories=0, **totals)
+
+
+def _update_weight_trend(user: get_user_model, date: datetime.date) -> None:
+    """ recalculate weight trend of given and following days """
+    trend = HealthAnalytics.objects.filter(
+        user=user, date__lt=date, weight_trend__isnull=False
+    ).order_by('-date').values_list('weight_trend', flat=True).first()
+    rows = list(HealthAnalytics.objects.filter(user=user, date__gte=date).order_by('date'))
+    _calculate_weight_trend(rows, trend)
+    HealthAnalytics.objects.bulk_update(rows, ['weight_trend'])
+
 
-    def _get_calories_from_meals(user: get_user_model, date: datetime) -> list[int]:
-        return sum(list(meal_list(user, date).values_list('calories', flat=True))) or 0
+def _calculate_weight_trend(rows: list[HealthAnalytics], trend: float) -> None:
+    """ set exponentially smoothed weight on ordered rows, starting from given
+    trend, days without weight keep trend of previous day """
+    smoothing = settings.HEALTH_WEIGHT_TREND_SMOOTHING
+    for row in rows:
+        if row.weight is not None:
+            trend = row.weight if trend is None else trend + smoothing * (row.weight - trend)
+        row.weight_trend = None if trend is None else round(trend, 2)
 
 
 #
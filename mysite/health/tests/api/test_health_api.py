@@ -1,7 +1,10 @@
 import datetime
+from unittest.mock import patch
 
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
@@ -9,12 +12,18 @@ from rest_framework import status
 from health import selectors
 
 HEALTH_DIARY_LIST = reverse('health:health-diary-list')
+HEALTH_ANALYTICS = reverse('health:analytics')
+WEEKLY_SUMMARY = reverse('health:weekly-summary')
 
 
 def health_statistic_url(name: str) -> reverse:
     return reverse('health:health-statistic', kwargs={'name': name})
 
 
+def health_statistic_series_url(name: str) -> reverse:
+    return reverse('health:health-statistic-series', kwargs={'name': name})
+
+
 def health_diary_detail_url(slug: str) -> reverse:
     return reverse('health:health-diary-detail', kwargs={'slug': slug})
 
@@ -82,12 +91,74 @@ class HealthApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res.data), 2)
 
+    def test_listing_diaries_with_cursor_pagination(self) -> None:
+        for days in range(3):
+            self._create_diary(self.user, date=self.today-datetime.timedelta(days))
+
+        res = self.client.get(HEALTH_DIARY_LIST, {'pagination': 'cursor', 'limit': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNone(res.data['count'])
+        self.assertIn(str(self.today), res.data['results'][0]['self'])
+
+        res = self.client.get(res.data['next'])
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertIn(str(self.today - datetime.timedelta(2)),
+                      res.data['results'][0]['self'])
+        self.assertIsNone(res.data['next'])
+
+    @patch('users.selectors.get_activities_from_strava')
+    def test_retrieve_diary_schedules_strava_sync_instead_of_calling_strava(self, mock) -> None:
+        strava = self.user.strava
+        strava.access_token = 'access'
+        strava.refresh_token = 'refresh'
+        strava.expires_at = 123
+        strava.save()
+        diary = self._create_diary(self.user)
+
+        res = self.client.get(health_diary_detail_url(diary.slug))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['strava_sync']['status'], 'pending')
+        mock.assert_not_called()
+
+    def test_retrieving_diary_again_does_not_write(self) -> None:
+        strava = self.user.strava
+        strava.access_token = 'access'
+        strava.refresh_token = 'refresh'
+        strava.expires_at = 123
+        strava.save()
+        diary = self._create_diary(self.user)
+        self.client.get(health_diary_detail_url(diary.slug))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(health_diary_detail_url(diary.slug))
+
+        self.assertEqual(res.data['strava_sync']['status'], 'pending')
+        self.assertFalse([query for query in queries.captured_queries
+                          if not query['sql'].startswith('SELECT')])
+
     def test_retrieve_diary(self) -> None:
         diary = self._create_diary(self.user)
         res = self.client.get(health_diary_detail_url(diary.slug))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data['id'], diary.id)
 
+    def test_retrieve_unchanged_diary_returns_not_modified(self) -> None:
+        diary = self._create_diary(self.user)
+        etag = self.client.get(health_diary_detail_url(diary.slug))['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(health_diary_detail_url(diary.slug), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(res.has_header('Last-Modified'))
+        self.assertEqual(len(queries), 1)
+
+        self.client.post(health_diary_detail_url(diary.slug), {'weight': 74.3})
+        res = self.client.get(health_diary_detail_url(diary.slug), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['weight'], 74.3)
+
     def test_retreving_given_statistic_success(self) -> None:
         self._create_diary(self.user)
         self._create_diary(self.user, date=self.today-datetime.timedelta(1))
@@ -96,3 +167,100 @@ class HealthApiTests(TestCase):
         res = self.client.get(health_statistic_url(statistic_name))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res.data), 2)
+
+    def _create_weight_history(self, start: datetime.date, weights: list) -> None:
+        for day, weight in enumerate(weights):
+            diary = self._create_diary(self.user, start + datetime.timedelta(day))
+            diary.weight = weight
+            diary.sleep_length = datetime.time(7, 30) if weight else None
+            diary.save()
+
+    def test_retrieving_statistic_series_in_weekly_buckets(self) -> None:
+        monday = datetime.date(2021, 3, 1)
+        self._create_weight_history(monday, [80, 82, None, 81, 80, 79, 78, 77, 76])
+
+        res = self.client.get(health_statistic_series_url('weight'), {
+            'from': monday, 'to': monday + datetime.timedelta(13), 'bucket': 'week'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        points = res.data['points']
+        self.assertEqual(len(points), 2)
+        self.assertEqual(points[0]['date'], monday)
+        self.assertEqual((points[0]['min'], points[0]['max']), (78, 82))
+        self.assertEqual(points[0]['count'], 6)
+        self.assertEqual(points[0]['avg'], 80)
+        self.assertEqual(points[1]['avg'], 76.5)
+
+    def test_retrieving_statistic_series_with_rolling_average(self) -> None:
+        start = datetime.date(2021, 3, 1)
+        self._create_weight_history(start, [80, 82, 84, 86])
+        self._create_diary(self.user, start - datetime.timedelta(1))
+
+        res = self.client.get(health_statistic_series_url('weight'), {
+            'from': start, 'to': start + datetime.timedelta(3), 'window': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([point['rolling_avg'] for point in res.data['points']],
+                         [80, 81, 83, 85])
+
+    def test_rolling_average_window_of_calendar_buckets_weighted_by_count(self) -> None:
+        start = datetime.date(2021, 3, 1)
+        self._create_weight_history(start, [80, None, None, 86, 90, 91])
+
+        res = self.client.get(health_statistic_series_url('weight'), {
+            'from': start, 'to': start + datetime.timedelta(5), 'window': 2})
+
+        self.assertEqual([point['rolling_avg'] for point in res.data['points']],
+                         [80, 86, 88, 90.5])
+
+        self._create_weight_history(start + datetime.timedelta(7), [70])
+        res = self.client.get(health_statistic_series_url('weight'), {
+            'from': start, 'to': start + datetime.timedelta(13), 'bucket': 'week',
+            'window': 2})
+
+        # second week has one value, weeks are not averaged as two equal values
+        self.assertEqual([point['rolling_avg'] for point in res.data['points']],
+                         [86.75, 83.4])
+
+    def test_retrieving_time_statistic_series_in_seconds(self) -> None:
+        start = datetime.date(2021, 3, 1)
+        self._create_weight_history(start, [80, 81])
+
+        res = self.client.get(health_statistic_series_url('sleep_length'), {
+            'from': start, 'to': start + datetime.timedelta(1), 'bucket': 'month'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['points'][0]['avg'], 27000)
+
+    def test_retrieving_statistic_series_with_invalid_range_failed(self) -> None:
+        url = health_statistic_series_url('weight')
+        res = self.client.get(url, {'from': self.today, 'to': self.today - datetime.timedelta(1)})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(url, {'from': self.today - datetime.timedelta(365 * 5)})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(url, {'from': self.today - datetime.timedelta(365 * 5),
+                                    'bucket': 'week'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(health_statistic_series_url('daily_thoughts'))
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieving_analytics_of_last_week_and_given_window(self) -> None:
+        self.client.post(health_diary_detail_url(str(self.today)), {'weight': 80})
+        yesterday = self.today - datetime.timedelta(1)
+        self.client.post(health_diary_detail_url(str(yesterday)), {'weight': 81})
+
+        res = self.client.get(HEALTH_ANALYTICS)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['days'], 2)
+        self.assertEqual(res.data['weight'], 80.5)
+
+        res = self.client.get(HEALTH_ANALYTICS, {'from': yesterday, 'to': yesterday})
+        self.assertEqual(res.data['weight'], 81)
+        self.assertEqual(res.data['weight_trend'], 81)
+
+        res = self.client.get(WEEKLY_SUMMARY)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['weight'], 80.5)
@@ -9,9 +9,13 @@ from unittest.mock import patch
 from health.services import (
     AddStatisticsDto,
     AddStatistics,
-    RecalculateDiaryCaloriesIntake,
+    UpdateDiaryNutritionDto,
+    UpdateDiaryNutrition,
+    rebuild_health_analytics,
 )
-from health.models import HealthDiary
+from health.models import HealthDiary, HealthAnalytics
+from health.selectors import get_health_analytics
+from users.models import StravaActivity
 
 
 class HealthServicesTests(TestCase):
@@ -46,13 +50,26 @@ class HealthServicesTests(TestCase):
         service.add(diary, dto)
         self.assertEqual(diary.weight, dto.weight)
 
-    @patch('health.services.RecalculateDiaryCaloriesIntake._get_calories_from_meals')
-    def test_RecalculateDiaryCaloriesIntake_service(self, mock) -> None:
-        mock.return_value = 2000
+    def test_UpdateDiaryNutrition_service(self) -> None:
         diary = self._create_diary()
-        service = RecalculateDiaryCaloriesIntake()
-        service.recalculate(self.user, self.today)
-        diary.calories = 2000
+        service = UpdateDiaryNutrition()
+        service.update(UpdateDiaryNutritionDto(
+            user=self.user, date=self.today,
+            nutrients={'calories': 2000.4, 'proteins': 100}))
+        service.update(UpdateDiaryNutritionDto(
+            user=self.user, date=self.today,
+            nutrients={'calories': -500, 'proteins': -150}))
+        diary.refresh_from_db()
+        # full precision is kept and drift below zero is not hidden
+        self.assertAlmostEqual(diary.calories, 1500.4)
+        self.assertEqual(diary.proteins, -50)
+
+    def test_UpdateDiaryNutrition_service_creates_missing_diary(self) -> None:
+        date = self.today - datetime.timedelta(days=3)
+        UpdateDiaryNutrition().update(UpdateDiaryNutritionDto(
+            user=self.user, date=date, nutrients={'calories': 300}))
+        diary = HealthDiary.objects.get(user=self.user, date=date)
+        self.assertEqual(diary.calories, 300)
 
     def test_AddStatistics_with_invalid_weigth(self) -> None:
         with self.assertRaises(ValidationError):
@@ -68,3 +85,63 @@ class HealthServicesTests(TestCase):
         with self.assertRaises(ValidationError):
             AddStatisticsDto(rest_heart_rate=-1)
             AddStatisticsDto(rest_heart_rate=231)
+
+    def _add_statistics(self, date: datetime.date, **kwargs) -> None:
+        diary = HealthDiary.objects.get_or_create(user=self.user, date=date)[0]
+        AddStatistics().add(diary, AddStatisticsDto(**kwargs))
+
+    def _get_analytics(self) -> list[dict]:
+        fields = [field.name for field in HealthAnalytics._meta.fields if field.name != 'id']
+        return list(HealthAnalytics.objects.filter(
+            user=self.user).order_by('date').values(*fields))
+
+    def test_analytics_are_updated_incrementally(self) -> None:
+        day = self.today - datetime.timedelta(days=10)
+        self._add_statistics(day, weight=80, sleep_length='07:00:00')
+        self._add_statistics(day + datetime.timedelta(2), weight=82, rest_heart_rate=50)
+        UpdateDiaryNutrition().update(UpdateDiaryNutritionDto(
+            user=self.user, date=day + datetime.timedelta(2), nutrients={'calories': 2000}))
+        # changes of past days shift totals of following days
+        self._add_statistics(day + datetime.timedelta(1), weight=81)
+        UpdateDiaryNutrition().update(UpdateDiaryNutritionDto(
+            user=self.user, date=day, nutrients={'calories': 1500}))
+        self._add_statistics(day, weight=79)
+
+        incremental = self._get_analytics()
+        rebuild_health_analytics(self.user)
+        self.assertEqual(incremental, self._get_analytics())
+        last = incremental[-1]
+        self.assertEqual((last['total_days'], last['weight_days']), (3, 3))
+        self.assertEqual(last['total_calories'], 3500)
+        self.assertEqual(last['sleep_length_days'], 1)
+        self.assertEqual(last['weight_trend'], 79.48)
+
+    def test_get_health_analytics_of_window(self) -> None:
+        day = self.today - datetime.timedelta(days=10)
+        for offset, weight in enumerate([80, 81, 82, 83]):
+            self._add_statistics(day + datetime.timedelta(offset), weight=weight)
+            UpdateDiaryNutrition().update(UpdateDiaryNutritionDto(
+                user=self.user, date=day + datetime.timedelta(offset),
+                nutrients={'calories': 2000}))
+        # calories of activities stored before are set to diary by rebuild
+        StravaActivity.objects.create(user=self.user, strava_id=1, name='run',
+                                      calories=500, date=day + datetime.timedelta(2))
+        rebuild_health_analytics(self.user)
+        self.assertEqual(HealthDiary.objects.get(
+            user=self.user, date=day + datetime.timedelta(2)).burned_calories, 500)
+
+        with self.assertNumQueries(1):
+            stats = get_health_analytics(
+                self.user, day + datetime.timedelta(1), day + datetime.timedelta(2))
+        self.assertEqual(stats['days'], 2)
+        self.assertEqual(stats['weight'], 81.5)
+        self.assertEqual(stats['calories'], 2000)
+        self.assertEqual(stats['energy_balance'], 3500)
+        self.assertIsNone(stats['rest_heart_rate'])
+
+        stats = get_health_analytics(self.user, self.today - datetime.timedelta(2), self.today)
+        self.assertEqual(stats['days'], 0)
+        self.assertIsNone(stats['weight'])
+        self.assertIsNotNone(stats['weight_trend'])
+        with self.assertRaises(ValidationError):
+            get_health_analytics(self.user, self.today, day)
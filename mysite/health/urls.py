@@ -12,6 +12,9 @@ urlpatterns = [
     path('bmi/', views.BMIRetrieveApi().as_view(), name='bmi-get'),
     path('statistics/<name>', views.HealthStatisticApi.as_view(),
          name='health-statistic'),
+    path('statistics/<name>/series', views.HealthStatisticSeriesApi.as_view(),
+         name='health-statistic-series'),
+    path('analytics/', views.HealthAnalyticsApi.as_view(), name='analytics'),
     path('weekly-summary/', views.HealthWeeklySummary.as_view(),
          name='weekly-summary'),
     path('', views.Dashboard.as_view(), name='dashboard')
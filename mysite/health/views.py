@@ -1,3 +1,5 @@
+import datetime
+
 from rest_framework import status, authentication, permissions
 from rest_framework.response import Response
 from rest_framework.request import Request
@@ -7,12 +9,20 @@ from rest_framework.reverse import reverse
 
 from mysite.views import BaseAuthPermClass
 from mysite.exceptions import ApiErrorsMixin
+from mysite.conditional import get_etag, get_not_modified_response, set_validators
+from mysite.drf_pagination import (
+    LimitOffsetPagination,
+    CursorPagination,
+    get_paginated_response,
+)
 from health import serializers, selectors
 from health.services import (
     AddStatisticsDto,
     AddStatistics,
 )
 from users import selectors as users_selectors
+from users.models import StravaSyncJob
+from users.services import schedule_strava_sync
 
 
 class Dashboard(APIView):
@@ -29,6 +39,7 @@ class Dashboard(APIView):
             'weight': reverse('health:health-statistic', kwargs={'name': 'weight'}, request=request),
             'sleep_length': reverse('health:health-statistic', kwargs={'name': 'sleep_length'}, request=request),
             'rest_heart_rate': reverse('health:health-statistic', kwargs={'name': 'rest_heart_rate'}, request=request),
+            'analytics': reverse('health:analytics', request=request),
 
         }
         return Response(data=data, status=status.HTTP_200_OK)
@@ -65,10 +76,42 @@ class HealthDiaryDetailApi(BaseHealthView):
         return Response(status=status.HTTP_200_OK, headers=headers)
 
     def get(self, request, *args, **kwargs):
+        """ conditional request is answered from single query, unless strava
+        synchronization of the day has to be scheduled """
         date = kwargs.get('slug')
+        version = selectors.health_diary_get_version(request.user, date)
+        if version is not None and not self._is_strava_sync_needed(version):
+            response = get_not_modified_response(request, self._get_etag(version))
+            if response is not None:
+                return response
         diary = selectors.health_diary_get(request.user, date)
-        serializer = serializers.HealthDiaryDetailSerializer(diary)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        job = schedule_strava_sync(request.user, diary.date)
+        etag = self._get_etag(selectors.health_diary_get_version(request.user, date))
+        serializer = serializers.HealthDiaryDetailSerializer(
+            diary, context={'strava_sync': job})
+        return set_validators(Response(data=serializer.data, status=status.HTTP_200_OK), etag)
+
+    @staticmethod
+    def _get_etag(version: dict) -> str:
+        """ Last-Modified is not sent, state of strava synchronization in
+        response has no timestamp of its every change """
+        synced = version['strava_connected'] and version['job_status'] is not None
+        return get_etag('diary', version['id'], version['updated_at'],
+                        version['activities_count'] or 0, version['activities_updated_at'],
+                        synced and version['job_status'],
+                        synced and version['job_last_synced_at'])
+
+    @staticmethod
+    def _is_strava_sync_needed(version: dict) -> bool:
+        """ check if strava synchronization job of the day has to be created
+        or rescheduled """
+        if not version['strava_connected']:
+            return False
+        if version['job_status'] is None:
+            return True
+        return users_selectors.is_strava_sync_due(StravaSyncJob(
+            status=version['job_status'], last_synced_at=version['job_last_synced_at'],
+            run_after=version['job_run_after']))
 
     def _prepare_dto(self, request: Request) -> AddStatisticsDto:
         serializer = serializers.AddStatisticsSerializer(data=request.data)
@@ -83,12 +126,22 @@ class HealthDiaryDetailApi(BaseHealthView):
 
 
 class HealthDiaryApi(BaseHealthView):
+    class Pagination(LimitOffsetPagination):
+        default_limit = None
+
+    class CursorPagination(CursorPagination):
+        ordering = ('-date', '-id')
 
     def get(self, request, *args, **kwargs):
         all_diaries = selectors.health_diary_list(user=request.user)
-        serializer = serializers.HealthDiarySerializer(
-            all_diaries, many=True, context=self.get_serializer_context())
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        return get_paginated_response(
+            pagination_class=self.Pagination,
+            cursor_pagination_class=self.CursorPagination,
+            serializer_class=serializers.HealthDiarySerializer,
+            queryset=all_diaries,
+            request=request,
+            view=self
+        )
 
 
 class BMIRetrieveApi(BaseHealthView):
@@ -111,6 +164,34 @@ class HealthStatisticApi(BaseHealthView):
         return Response(data=list(all_field_values), status=status.HTTP_200_OK)
 
 
+class HealthStatisticSeriesApi(BaseHealthView):
+    """ API for retrieving health statistic resampled between dates """
+
+    def get(self, request, *args, **kwargs):
+        """ return statistic min, max and average values in buckets """
+        serializer = serializers.HealthStatisticSeriesInputSerializer(
+            data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        series = selectors.get_statistic_series(
+            request.user, kwargs.get('name'), start=data.get('from'), end=data.get('to'),
+            bucket=data['bucket'], window=data.get('window'))
+        return Response(data=series, status=status.HTTP_200_OK)
+
+
+class HealthAnalyticsApi(BaseHealthView):
+    """ API for retrieving health analytics of any window """
+
+    def get(self, request, *args, **kwargs):
+        """ return averages, energy balance and weight trend, last week by default """
+        serializer = serializers.DateRangeInputSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        end = serializer.validated_data.get('to') or datetime.date.today()
+        start = serializer.validated_data.get('from') or end - datetime.timedelta(days=7)
+        analytics = selectors.get_health_analytics(request.user, start, end)
+        return Response(data=analytics, status=status.HTTP_200_OK)
+
+
 class HealthWeeklySummary(BaseHealthView):
     """ API for retrieving weekly summary """
 
@@ -0,0 +1,62 @@
+import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+
+from meals_tracker.models import Meal, RecipePortion, IngredientAmount
+from meals_tracker.selectors import meal_recipe_portion_nutrients, meal_item_nutrients_fields
+from recipe.selectors import (
+    ingredient_annotate_grams_in_one_unit,
+    ingredient_calculate_item_nutrients,
+)
+
+
+class Command(BaseCommand):
+    """ calculate and store nutrients of existing meal recipes and
+    ingredients, processing rows in chunks ordered by id """
+
+    help = 'Backfill nutrients stored on meal recipes and ingredients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        recipes = self._backfill(
+            RecipePortion.objects.select_related('recipe'),
+            lambda item: meal_recipe_portion_nutrients(item.recipe, item.portion),
+            chunk_size
+        )
+        ingredients = self._backfill(
+            ingredient_annotate_grams_in_one_unit(IngredientAmount.objects.all()),
+            ingredient_calculate_item_nutrients,
+            chunk_size
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {recipes} meal recipes and {ingredients} meal ingredients'))
+
+    def _backfill(self, queryset, calculate, chunk_size: int) -> int:
+        """ update rows of queryset chunk by chunk, return number of updated rows """
+        fields = meal_item_nutrients_fields(queryset.model)
+        updated = 0
+        last_id = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id).order_by('id')[:chunk_size])
+            if not chunk:
+                return updated
+            calculated = []
+            for item in chunk:
+                try:
+                    nutrients = calculate(item)
+                except ValidationError as e:
+                    self.stderr.write(
+                        f'Skipping {item._meta.model_name} {item.id}: {e.messages[0]}')
+                    continue
+                for field in fields:
+                    setattr(item, field, nutrients[field])
+                calculated.append(item)
+            queryset.model.objects.bulk_update(calculated, fields)
+            Meal.objects.filter(id__in={item.meal_id for item in calculated}).update(
+                updated_at=datetime.datetime.now())
+            updated += len(calculated)
+            last_id = chunk[-1].id
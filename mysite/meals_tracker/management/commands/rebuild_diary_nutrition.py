@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.core.management.base import BaseCommand, CommandError
+
+from meals_tracker.services import rebuild_diary_nutrition
+
+
+class Command(BaseCommand):
+    """ reconcile nutrients of health diaries with nutrients stored on meal
+    items of given or all users. Run after backfill_meal_items_nutrients,
+    after deploy and to repair drifted diaries """
+
+    help = 'Rebuild nutrition of health diaries from meals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='rebuild only diaries of this user')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report diaries which differ from meals')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(
+            Q(healthdiary__isnull=False) | Q(meal__isnull=False)).distinct()
+        if options['email']:
+            users = get_user_model().objects.filter(email=options['email'])
+            if not users.exists():
+                raise CommandError('User does not exist')
+        corrected = 0
+        for user in users.iterator():
+            dates = rebuild_diary_nutrition(user, options['dry_run'])
+            for date in dates:
+                self.stdout.write(f'{user.email} {date} differs from meals')
+            corrected += len(dates)
+        action = 'Found' if options['dry_run'] else 'Corrected'
+        self.stdout.write(self.style.SUCCESS(f'{action} {corrected} diaries'))
@@ -0,0 +1,53 @@
+# Generated by Django 3.1.7 on 2026-10-17 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals_tracker', '0022_auto_20211130_0945'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='calories',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='carbohydrates',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='fats',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='proteins',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipeportion',
+            name='calories',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipeportion',
+            name='carbohydrates',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipeportion',
+            name='fats',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipeportion',
+            name='proteins',
+            field=models.FloatField(default=0),
+        ),
+    ]
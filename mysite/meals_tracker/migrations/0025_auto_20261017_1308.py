@@ -0,0 +1,53 @@
+# Generated by Django 3.1.7 on 2026-10-17 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals_tracker', '0024_meal_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='calcium',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='fiber',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='iron',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='magnesium',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='potassium',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='selenium',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='sodium',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='zinc',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -20,6 +20,7 @@ class Meal(models.Model):
     recipes = models.ManyToManyField(Recipe, through='RecipePortion')
     ingredients = models.ManyToManyField(
         Ingredient, through='IngredientAmount')
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         """ string representation """
@@ -38,6 +39,10 @@ class RecipePortion(models.Model):
                              related_name='recipe_portion', null=False)
     portion = models.PositiveSmallIntegerField(default=1)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, null=False)
+    calories = models.FloatField(default=0)
+    proteins = models.FloatField(default=0)
+    carbohydrates = models.FloatField(default=0)
+    fats = models.FloatField(default=0)
 
     class Meta:
         constraints = [
@@ -57,6 +62,18 @@ class IngredientAmount(models.Model):
                                    null=False)
     unit = models.ForeignKey(Unit, on_delete=models.CASCADE, null=False)
     amount = models.PositiveSmallIntegerField(null=False)
+    calories = models.FloatField(default=0)
+    proteins = models.FloatField(default=0)
+    carbohydrates = models.FloatField(default=0)
+    fats = models.FloatField(default=0)
+    fiber = models.FloatField(default=0)
+    sodium = models.FloatField(default=0)
+    potassium = models.FloatField(default=0)
+    calcium = models.FloatField(default=0)
+    iron = models.FloatField(default=0)
+    magnesium = models.FloatField(default=0)
+    selenium = models.FloatField(default=0)
+    zinc = models.FloatField(default=0)
 
     def __str__(self):
         return self.amount + self.unit.name
@@ -3,32 +3,90 @@ from typing import Iterable
 
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch, Sum, Count, Max
+from django.db.models.query import QuerySet
 
 from meals_tracker.models import Meal, MealCategory, RecipePortion, IngredientAmount
+from recipe.models import Recipe, Ingredient, Unit
+from recipe.selectors import (
+    NUTRIENTS,
+    RECIPE_NUTRIENTS,
+    recipe_list,
+    ingredient_get_unit_mappings,
+    ingredient_calculate_item_nutrients,
+    ingredient_annotate_grams_in_one_unit,
+)
+from recipe.models import Recipe_Ingredient
 
 
-def meal_list(user: get_user_model, date: datetime = None):
+MEAL_EXPANDABLE_FIELDS = ('recipes', 'ingredients')
+
+
+def meal_list(user: get_user_model, date: datetime = None, expand: Iterable[str] = ()):
+    if not date:
+        date = datetime.datetime.today()
+    else:
+        meal_validate_date(date)
+    return meal_prefetch_items(Meal.objects.filter(user=user, date=date), expand)
+
+
+def meal_list_version(user: get_user_model, date: datetime = None,
+                      expand: Iterable[str] = ()) -> dict:
+    """ return number of meals and latest updated_at of meals, and of
+    recipes and ingredients embedded in response, in single query """
     if not date:
         date = datetime.datetime.today()
     else:
         meal_validate_date(date)
-    return Meal.objects.filter(user=user, date=date)
+    stamps = {'updated_at': Max('updated_at')}
+    if 'recipes' in expand:
+        stamps['recipes_updated_at'] = Max('recipes__updated_at')
+    if 'ingredients' in expand:
+        stamps['ingredients_updated_at'] = Max('ingredients__updated_at')
+    return Meal.objects.filter(user=user, date=date).aggregate(
+        count=Count('id', distinct=True), **stamps)
 
 
-def meal_get(user: get_user_model, id: int) -> Meal:
+def meal_get(user: get_user_model, id: int, expand: Iterable[str] = ()) -> Meal:
     try:
         id = int(id)
     except ValueError:
         raise ValidationError(f'Incorrect id: {id} for meal ')
     try:
-        return Meal.objects.get(user=user, id=id)
+        return meal_prefetch_items(Meal.objects.all(), expand).get(user=user, id=id)
     except Meal.DoesNotExist:
         raise ObjectDoesNotExist(f'Meal with id {id} does not exists!')
 
 
+def meal_prefetch_items(meals: QuerySet, expand: Iterable[str]) -> QuerySet:
+    """ prefetch meal recipes and ingredients which are going to be
+    embedded in response, so number of queries does not depend on meals """
+    if 'recipes' in expand:
+        meals = meals.prefetch_related(Prefetch(
+            'recipe_portion',
+            queryset=RecipePortion.objects.select_related('recipe')))
+    if 'ingredients' in expand:
+        meals = meals.prefetch_related(Prefetch(
+            'ingredientamount_set',
+            queryset=IngredientAmount.objects.select_related('ingredient', 'unit')))
+    return meals.select_related('category')
+
+
+def meal_validate_expand(expand: str = None) -> list[str]:
+    """ return list of fields to be embedded in meals response """
+    if not expand:
+        return []
+    fields = expand.split(',')
+    for field in fields:
+        if field not in MEAL_EXPANDABLE_FIELDS:
+            raise ValidationError(
+                f'Cannot expand {field}, available: {", ".join(MEAL_EXPANDABLE_FIELDS)}')
+    return fields
+
+
 def meal_get_recipes(user: get_user_model, id: int) -> Iterable[RecipePortion]:
     meal = meal_get(user, id)
-    return meal.recipe_portion.all().prefetch_related('recipe')
+    return meal.recipe_portion.all().select_related('recipe')
 
 
 def meal_get_recipes_detail(meal: Meal, id: int) -> RecipePortion:
@@ -50,7 +108,7 @@ def meal_get_ingredients_detail(meal: Meal, id: int) -> IngredientAmount:
 
 def meal_get_ingredients(user: get_user_model, id: int) -> Iterable[IngredientAmount]:
     meal = meal_get(user, id)
-    return meal.ingredientamount_set.all().prefetch_related('ingredient', 'unit')
+    return meal.ingredientamount_set.all().select_related('ingredient', 'unit')
 
 
 def meal_validate_date(date: datetime):
@@ -74,3 +132,213 @@ def meal_get_available_dates(user):
 def meal_category_list():
     """ return all available categories """
     return MealCategory.objects.all()
+
+
+def meal_recipe_portion_nutrients(recipe: Recipe, portion: int) -> dict[str, float]:
+    """ return nutrients of given number of recipe portions """
+    nutrients = {field: round(portion * ((getattr(recipe, field) or 0) / recipe.portions), 2)
+                 for field in RECIPE_NUTRIENTS}
+    nutrients['calories'] = round(nutrients['calories'])
+    return nutrients
+
+
+def meal_calculate_items_nutrients(recipes: list[dict] = None, ingredients: list[dict] = None) -> tuple[list[dict], list[dict]]:
+    """ return nutrients of every recipe ({'recipe', 'portion'}) and
+    ingredient ({'ingredient', 'unit', 'amount'}) item, in the same order """
+    recipes_nutrients = []
+    if recipes:
+        recipes_by_id = Recipe.objects.in_bulk(
+            {item['recipe'] for item in recipes})
+        for item in recipes:
+            recipes_nutrients.append(meal_recipe_portion_nutrients(
+                recipes_by_id[item['recipe']], item['portion']))
+    ingredients_nutrients = []
+    if ingredients:
+        ingredients_by_id = Ingredient.objects.in_bulk(
+            {item['ingredient'] for item in ingredients})
+        units_by_id = Unit.objects.in_bulk({item['unit'] for item in ingredients})
+        mappings = ingredient_get_unit_mappings(
+            (item['ingredient'], item['unit']) for item in ingredients)
+        for item in ingredients:
+            row = IngredientAmount(
+                ingredient=ingredients_by_id[item['ingredient']],
+                unit=units_by_id[item['unit']],
+                amount=item['amount']
+            )
+            row.grams_in_one_unit = mappings.get(
+                (item['ingredient'], item['unit']))
+            ingredients_nutrients.append(
+                ingredient_calculate_item_nutrients(row))
+    return recipes_nutrients, ingredients_nutrients
+
+
+def meal_sum_nutrients(items_nutrients: list[dict]) -> dict[str, float]:
+    """ return sum of nutrients of meal items """
+    totals = dict.fromkeys(NUTRIENTS, 0)
+    for nutrients in items_nutrients:
+        for field, value in nutrients.items():
+            totals[field] += value
+    return totals
+
+
+def meal_item_nutrients_fields(model: type) -> tuple[str, ...]:
+    """ return nutrients stored on meal items of model, recipes have only
+    macronutrients """
+    return NUTRIENTS if model is IngredientAmount else RECIPE_NUTRIENTS
+
+
+def meal_item_get_nutrients(item: RecipePortion | IngredientAmount) -> dict[str, float]:
+    """ return nutrients stored on meal item """
+    return {field: getattr(item, field) for field in meal_item_nutrients_fields(type(item))}
+
+
+def meal_calculate_calories(meal: Meal) -> int:
+    """ return sum of calories stored on meal recipes and ingredients """
+    recipes = meal.recipe_portion.aggregate(calories=Sum('calories'))
+    ingredients = meal.ingredientamount_set.aggregate(calories=Sum('calories'))
+    return round((recipes['calories'] or 0) + (ingredients['calories'] or 0))
+
+
+def _sum_items_nutrients(items: QuerySet) -> dict[str, float]:
+    """ return sums of nutrients stored on meal items """
+    fields = meal_item_nutrients_fields(items.model)
+    sums = items.aggregate(**{field: Sum(field) for field in fields})
+    return {field: value or 0 for field, value in sums.items()}
+
+
+def meal_get_nutrients(meal: Meal) -> dict[str, float]:
+    """ return sum of nutrients stored on all meal recipes and ingredients """
+    return meal_sum_nutrients([_sum_items_nutrients(meal.recipe_portion.all()),
+                               _sum_items_nutrients(meal.ingredientamount_set.all())])
+
+
+def meal_get_daily_nutrients(user: get_user_model) -> dict[datetime.date, dict[str, float]]:
+    """ return sums of nutrients stored on items of user meals by date """
+    daily = {}
+    for model in (RecipePortion, IngredientAmount):
+        fields = meal_item_nutrients_fields(model)
+        # annotations can not be named as fields of model
+        rows = model.objects.filter(meal__user=user).values('meal__date').annotate(
+            **{f'sum_{field}': Sum(field) for field in fields})
+        for row in rows:
+            daily.setdefault(row['meal__date'], []).append(
+                {field: row[f'sum_{field}'] or 0 for field in fields})
+    return {date: meal_sum_nutrients(items) for date, items in daily.items()}
+
+
+def meal_find_invalid_items(user: get_user_model, meals: list[dict]) -> dict[int, list[str]]:
+    """ check categories, recipes, ingredients and units referenced by meals
+    using few set based queries, return errors keyed by meal index """
+    recipes = [meal.get('recipes') or [] for meal in meals]
+    ingredients = [meal.get('ingredients') or [] for meal in meals]
+    pairs = {(item['ingredient'], item['unit'])
+             for items in ingredients for item in items}
+
+    categories_ids = set(MealCategory.objects.filter(
+        id__in={meal['category'] for meal in meals}).values_list('id', flat=True))
+    recipes_ids = set(recipe_list(user).filter(
+        id__in={item['recipe'] for items in recipes for item in items}
+    ).values_list('id', flat=True))
+    ingredients_ids = set(Ingredient.objects.filter(
+        id__in={ingredient_id for ingredient_id, _ in pairs}).values_list('id', flat=True))
+    units = dict(Unit.objects.filter(
+        id__in={unit_id for _, unit_id in pairs}).values_list('id', 'name'))
+    mappings = ingredient_get_unit_mappings(pairs)
+
+    errors = {}
+    for index, meal in enumerate(meals):
+        meal_errors = []
+        if not recipes[index] and not ingredients[index]:
+            meal_errors.append('Meal must include at least on recipe or ingredient')
+        if meal['category'] not in categories_ids:
+            meal_errors.append(f'Category with id {meal["category"]} does not exists')
+        for item in recipes[index]:
+            if item['recipe'] not in recipes_ids:
+                meal_errors.append(
+                    f'Recipe with id {item["recipe"]} does not exists or '
+                    'you do not have permissions to retrieve it')
+            if item['portion'] < 1:
+                meal_errors.append(
+                    f'Incorrect portion {item["portion"]} for recipe {item["recipe"]}')
+        for item in ingredients[index]:
+            if item['ingredient'] not in ingredients_ids:
+                meal_errors.append(
+                    f'Ingredient with id {item["ingredient"]} does not exist')
+            elif item['unit'] not in units:
+                meal_errors.append(f'Unit with id {item["unit"]} does not exists')
+            elif units[item['unit']] != 'gram' and \
+                    (item['ingredient'], item['unit']) not in mappings:
+                meal_errors.append(
+                    f'Unit with id {item["unit"]} is not mapped with '
+                    f'ingredient {item["ingredient"]}')
+            if item['amount'] < 1:
+                meal_errors.append(
+                    f'Incorrect amount {item["amount"]} for ingredient {item["ingredient"]}')
+        if meal_errors:
+            errors[index] = meal_errors
+    return errors
+
+
+def meal_get_shopping_list(user: get_user_model, start_date: datetime.date = None,
+                           end_date: datetime.date = None,
+                           recipes: list[dict] = ()) -> list[dict]:
+    """ return ingredients needed for meals planned between given dates and
+    for recipes ({'recipe', 'portion'}), amounts summed per ingredient in
+    grams. Rows are loaded in constant number of queries and reduced in
+    memory, amounts in units not mapped to grams are summed per unit """
+    portions = {}
+    recipes_portions = {}
+    meal_ingredients = []
+    if start_date and end_date:
+        meal_recipes = RecipePortion.objects.filter(
+            meal__user=user, meal__date__range=(start_date, end_date)
+        ).values_list('recipe_id', 'portion', 'recipe__portions')
+        for recipe_id, portion, recipe_portions in meal_recipes:
+            portions[recipe_id] = portions.get(recipe_id, 0) + portion
+            recipes_portions[recipe_id] = recipe_portions
+        meal_ingredients = ingredient_annotate_grams_in_one_unit(
+            IngredientAmount.objects.filter(
+                meal__user=user, meal__date__range=(start_date, end_date)))
+    if recipes:
+        available = dict(recipe_list(user).filter(
+            id__in={item['recipe'] for item in recipes}
+        ).values_list('id', 'portions'))
+        for item in recipes:
+            if item['recipe'] not in available:
+                raise ObjectDoesNotExist(
+                    f'Recipe with id {item["recipe"]} does not exists or '
+                    'you do not have permissions to retrieve it')
+            portions[item['recipe']] = portions.get(item['recipe'], 0) + item['portion']
+        recipes_portions.update(available)
+
+    recipe_ingredients = ingredient_annotate_grams_in_one_unit(
+        Recipe_Ingredient.objects.filter(recipe_id__in=portions.keys())
+    ) if portions else []
+
+    shopping_list = {}
+    for item, scale in [(item, portions[item.recipe_id] / recipes_portions[item.recipe_id])
+                        for item in recipe_ingredients] + \
+            [(item, 1) for item in meal_ingredients]:
+        row = shopping_list.get(item.ingredient_id)
+        if row is None:
+            row = shopping_list[item.ingredient_id] = {
+                'ingredient': item.ingredient_id,
+                'name': item.ingredient.name,
+                'slug': item.ingredient.slug,
+                'grams': 0,
+                'other_units': {},
+            }
+        amount = item.amount * scale
+        if item.unit.name == 'gram':
+            row['grams'] += amount
+        elif item.grams_in_one_unit is not None:
+            row['grams'] += amount * item.grams_in_one_unit
+        else:
+            row['other_units'][item.unit.name] = \
+                row['other_units'].get(item.unit.name, 0) + amount
+
+    for row in shopping_list.values():
+        row['grams'] = round(row['grams'], 2)
+        row['other_units'] = [{'unit': unit, 'amount': round(amount, 2)}
+                              for unit, amount in sorted(row['other_units'].items())]
+    return sorted(shopping_list.values(), key=lambda row: row['name'])
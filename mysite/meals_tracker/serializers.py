@@ -3,7 +3,6 @@ from rest_framework.reverse import reverse
 
 from mysite import serializers as generic_serializers
 from meals_tracker.models import Meal, MealCategory, RecipePortion, IngredientAmount
-from recipe import selectors
 from recipe.serializers import UnitOutputSerializer
 
 
@@ -15,7 +14,22 @@ class MealCategorySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class MealDetailSerializer(serializers.ModelSerializer):
+class MealExpandMixin:
+    """ embed meal recipes and ingredients, listed in context 'expand',
+    instead of links to them """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.context.get('expand', ())
+        if 'recipes' in expand:
+            self.fields['recipes'] = MealRecipesSerializer(
+                source='recipe_portion', many=True, read_only=True)
+        if 'ingredients' in expand:
+            self.fields['ingredients'] = MealIngredientsSerializer(
+                source='ingredientamount_set', many=True, read_only=True)
+
+
+class MealDetailSerializer(MealExpandMixin, serializers.ModelSerializer):
     """ serializing meal object """
 
     self = serializers.HyperlinkedIdentityField(
@@ -36,7 +50,7 @@ class MealDetailSerializer(serializers.ModelSerializer):
         return serializer.data
 
 
-class MealsListSerializer(serializers.ModelSerializer):
+class MealsListSerializer(MealExpandMixin, serializers.ModelSerializer):
     """ serializer for list of meals """
 
     self = serializers.HyperlinkedIdentityField(
@@ -87,16 +101,11 @@ class MealRecipesSerializer(serializers.ModelSerializer):
     self = RecipePortionDetailHyperlink(
         view_name='meals_tracker:meal-recipes-detail')
     recipe = RecipeDetailHyperLink(view_name='recipe:recipe-detail')
-    calories = serializers.SerializerMethodField()
 
     class Meta:
         model = RecipePortion
-        fields = ('id', 'self', 'portion', 'calories', 'recipe')
-
-    def get_calories(self, instance):
-        return selectors.recipe_calculate_calories_based_on_portion(
-            instance.portion,
-            instance.recipe)
+        fields = ('id', 'self', 'portion', 'calories', 'proteins',
+                  'carbohydrates', 'fats', 'recipe')
 
 
 class MealIngredientsSerializer(serializers.ModelSerializer):
@@ -122,20 +131,12 @@ class MealIngredientsSerializer(serializers.ModelSerializer):
         view_name='meals_tracker:meal-ingredients-detail')
     ingredient = IngredientDetailHyperLink(
         view_name='recipe:ingredient-detail')
-    unit = serializers.SerializerMethodField()
-    calories = serializers.SerializerMethodField()
+    unit = UnitOutputSerializer(read_only=True)
 
     class Meta:
         model = IngredientAmount
-        fields = ('id', 'self', 'ingredient', 'unit', 'amount', 'calories')
-
-    def get_unit(self, instance):
-        serializer = UnitOutputSerializer(instance.unit)
-        return serializer.data
-
-    def get_calories(self, instance):
-        return selectors.ingredient_calculate_calories(
-            instance.ingredient, instance.unit, instance.amount)
+        fields = ('id', 'self', 'ingredient', 'unit', 'amount', 'calories',
+                  'proteins', 'carbohydrates', 'fats')
 
 
 class AddRecipeToMealSerializer(serializers.Serializer):
@@ -178,3 +179,30 @@ class DatesSerializer(serializers.Serializer):
         url = reverse('meals_tracker:meal-list', request=self.context['request']) \
             + "?date=" + str(obj['date'])
         return url
+
+
+class ShoppingListInputSerializer(serializers.Serializer):
+    """ serializing dates of planned meals and recipes for shopping list """
+
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    recipes = generic_serializers.inline_serializer(many=True, required=False, fields={
+        'recipe': serializers.IntegerField(required=True),
+        'portion': serializers.IntegerField(required=True, min_value=1)
+    })
+
+    def validate(self, data):
+        start_date, end_date = data.get('start_date'), data.get('end_date')
+        if (start_date is None) != (end_date is None):
+            raise serializers.ValidationError(
+                'Provide both start_date and end_date')
+        if start_date and start_date > end_date:
+            raise serializers.ValidationError(
+                'start_date can not be later than end_date')
+        if start_date and (end_date - start_date).days > 31:
+            raise serializers.ValidationError(
+                'Shopping list can cover up to 31 days')
+        if not start_date and not data.get('recipes'):
+            raise serializers.ValidationError(
+                'Provide dates of planned meals or recipes')
+        return data
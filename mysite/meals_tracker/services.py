@@ -1,21 +1,46 @@
 import datetime
 from dataclasses import dataclass
+from typing import Iterable
 
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
-from django.db import IntegrityError
-
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max
+
+from health.services import (
+    UpdateDiaryNutrition,
+    UpdateDiaryNutritionDto,
+    reconcile_diary_nutrition,
+)
+from mysite.nplusone import allow_repeated_queries, detect_n_plus_one
 from meals_tracker.models import Meal, RecipePortion, IngredientAmount
-from recipe.models import Recipe, Ingredient_Unit
+from meals_tracker.selectors import (
+    meal_calculate_items_nutrients,
+    meal_sum_nutrients,
+    meal_item_get_nutrients,
+    meal_get_nutrients,
+    meal_get_daily_nutrients,
+    meal_calculate_calories,
+    meal_find_invalid_items,
+)
 from recipe.selectors import (
-    recipe_calculate_calories_based_on_portion,
     recipe_list,
     ingredient_list,
-    ingredient_calculate_calories,
     unit_list,
     )
 
 
+def _update_diary_nutrition(meal: Meal, added: dict[str, float] = None,
+                            removed: dict[str, float] = None) -> None:
+    """ apply nutrients of added and removed meal items to daily diary """
+    nutrients = dict(added or {})
+    for field, value in (removed or {}).items():
+        nutrients[field] = nutrients.get(field, 0) - value
+    dto = UpdateDiaryNutritionDto(
+        user=meal.user, date=meal.date, nutrients=nutrients)
+    UpdateDiaryNutrition().update(dto)
+
+
 @dataclass
 class CreateMealDto:
     recipe = int
@@ -37,6 +62,8 @@ class CreateMealDto:
 
 
 class CreateMeal():
+    @detect_n_plus_one
+    @transaction.atomic
     def create(self, dto: CreateMealDto) -> Meal:
         try:
             meal = Meal.objects.create(
@@ -48,21 +75,10 @@ class CreateMeal():
             raise ValidationError(
                 f'Category with id {dto.category} does not exists!')
 
-        try:
-            if dto.recipes:
-                recipes_dto = AddRecipesToMealDto(
-                    user=meal.user, recipes=dto.recipes)
-                AddRecipesToMeal().add(meal, recipes_dto)
-
-            if dto.ingredients:
-                ingredients_dto = AddIngredientsToMealDto(
-                    user=meal.user, ingredients=dto.ingredients)
-                AddIngredientsToMeal().add(meal, ingredients_dto)
-        except ValidationError as e:
-            meal.delete()
-            raise ValidationError(e)
-
-        meal.save()
+        recipes_dto = AddRecipesToMealDto(user=meal.user, recipes=dto.recipes)
+        ingredients_dto = AddIngredientsToMealDto(
+            user=meal.user, ingredients=dto.ingredients)
+        ComposeMeal().compose(meal, recipes_dto.recipes, ingredients_dto.ingredients)
         return meal
 
 
@@ -77,30 +93,32 @@ class AddRecipesToMealDto:
     def __post_init__(self):
         if not self.recipes:
             return
-        available_recipe_for_user = recipe_list(
-            user=self.user).values_list('id', flat=True)
         for item in self.recipes:
-            if item['recipe'] not in available_recipe_for_user:
-                raise ValidationError(
-                    f'Recipe with id {item["recipe"]} does not exists or \
-                    you do not have permissions to retrieve it')
             if item['portion'] < 1:
                 raise ValidationError(
                     f'Incorrect portion {item["portion"]}for recipe {item["recipe"]} ')
+        dto_recipes_ids = {item['recipe'] for item in self.recipes}
+        available_recipes_ids = set(recipe_list(user=self.user).filter(
+            id__in=dto_recipes_ids).values_list('id', flat=True))
+        for id in dto_recipes_ids - available_recipes_ids:
+            raise ValidationError(
+                f'Recipe with id {id} does not exists or \
+                you do not have permissions to retrieve it')
 
 
 class AddRecipesToMeal:
+    @transaction.atomic
     def add(self, meal: Meal, dto: AddRecipesToMealDto) -> None:
-        for item in dto.recipes or []:
-            meal.recipes.add(item['recipe'], through_defaults={
-                             'portion': item['portion']})
-        dto = RecalculateMealCaloriesDto(recipes=dto.recipes)
-        RecalculateMealCalories().add_recipes(dto, meal)
+        ComposeMeal().compose(meal, recipes=dto.recipes)
 
 
 class RemoveRecipeFromMeal:
+    @transaction.atomic
     def remove(self, recipe_portion: RecipePortion) -> None:
+        _update_diary_nutrition(
+            recipe_portion.meal, removed=meal_item_get_nutrients(recipe_portion))
         recipe_portion.delete()
+        RecalculateMealCalories().recalculate(recipe_portion.meal)
 
 
 @dataclass
@@ -124,63 +142,179 @@ class AddIngredientsToMealDto:
             raise ValidationError(
                 f'Ingredient with ids {non_existsting_ids} do not exist')
 
-        dto_units_ids = [item['unit'] for item in self.ingredients]
-        available_units = unit_list().values_list('id', flat=True)
-        for id in dto_units_ids:
-            if id not in available_units:
-                raise ValidationError(f'Unit with id {id} does not exists')
+        dto_units_ids = {item['unit'] for item in self.ingredients}
+        available_units = set(unit_list().filter(
+            id__in=dto_units_ids).values_list('id', flat=True))
+        for id in dto_units_ids - available_units:
+            raise ValidationError(f'Unit with id {id} does not exists')
 
 
 class AddIngredientsToMeal:
+    @transaction.atomic
     def add(self, meal: Meal, dto: AddIngredientsToMealDto) -> None:
-        for item in dto.ingredients or []:
-            meal.ingredients.add(item['ingredient'], through_defaults={
-                                     'unit_id': item['unit'], 'amount': item['amount']})
-        dto = RecalculateMealCaloriesDto(ingredients=dto.ingredients)
-        RecalculateMealCalories().add_ingredients(dto, meal)
+        ComposeMeal().compose(meal, ingredients=dto.ingredients)
 
 
 class RemoveIngredientFromMeal:
+    @transaction.atomic
     def remove(self, ingredient_amount: IngredientAmount) -> None:
+        _update_diary_nutrition(
+            ingredient_amount.meal, removed=meal_item_get_nutrients(ingredient_amount))
         ingredient_amount.delete()
+        RecalculateMealCalories().recalculate(ingredient_amount.meal)
+
+
+def _ingredient_amount_as_item(ingredient_amount: IngredientAmount) -> dict:
+    return {'ingredient': ingredient_amount.ingredient_id,
+            'unit': ingredient_amount.unit_id,
+            'amount': ingredient_amount.amount}
+
+
+class ComposeMeal:
+    """ add validated recipes and ingredients items to meal using constant
+    number of queries. Items already in meal, and repeated items, are skipped
+    (first one wins) """
+
+    @transaction.atomic
+    def compose(self, meal: Meal, recipes: list[dict] = None,
+                ingredients: list[dict] = None) -> None:
+        recipes = _skip_repeated_items(
+            recipes, 'recipe', meal.recipe_portion.values_list('recipe_id', flat=True))
+        ingredients = _skip_repeated_items(
+            ingredients, 'ingredient',
+            meal.ingredientamount_set.values_list('ingredient_id', flat=True))
+        if not recipes and not ingredients:
+            return
+
+        recipes_nutrients, ingredients_nutrients = meal_calculate_items_nutrients(
+            recipes, ingredients)
+        RecipePortion.objects.bulk_create([
+            RecipePortion(meal=meal, recipe_id=item['recipe'],
+                          portion=item['portion'], **nutrients)
+            for item, nutrients in zip(recipes, recipes_nutrients)
+        ])
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(meal=meal, ingredient_id=item['ingredient'],
+                             unit_id=item['unit'], amount=item['amount'],
+                             **nutrients)
+            for item, nutrients in zip(ingredients, ingredients_nutrients)
+        ])
+        added = meal_sum_nutrients(recipes_nutrients + ingredients_nutrients)
+        _update_diary_nutrition(meal, added=added)
+        RecalculateMealCalories().add(meal, added['calories'])
+
+
+def _skip_repeated_items(items: list[dict], key: str, existing_ids: Iterable[int] = ()) -> list[dict]:
+    """ return items without repeated ones and ones already added to meal """
+    if not items:
+        return []
+    seen = set(existing_ids)
+    unique_items = []
+    for item in items:
+        if item[key] not in seen:
+            seen.add(item[key])
+            unique_items.append(item)
+    return unique_items
 
 
 @dataclass
-class RecalculateMealCaloriesDto:
-    recipe = int
-    portion = int
-    ingredient = int
-    unit = int
-    amount = int
+class ImportMealsDto:
+    user: get_user_model
+    meals: list[dict]
 
-    recipes: list[dict[str, recipe | portion]] = None
-    ingredients: list[dict[str, ingredient | unit | amount]] = None
+    def __post_init__(self):
+        if not self.meals:
+            raise ValidationError('At least one meal must be provided')
+
+
+class ImportMeals:
+    """ create many meals, possibly for many dates, at once. References of all
+    meals are validated with few set based queries and invalid meals are
+    skipped, meal items are inserted with bulk operations. Like CreateMeal
+    it accepts meals planned for future dates """
+
+    @detect_n_plus_one
+    @transaction.atomic
+    def import_meals(self, dto: ImportMealsDto) -> tuple[dict[int, Meal], dict[int, list[str]]]:
+        errors = meal_find_invalid_items(dto.user, dto.meals)
+        valid_meals = {index: {
+            **meal,
+            'recipes': _skip_repeated_items(meal.get('recipes'), 'recipe'),
+            'ingredients': _skip_repeated_items(meal.get('ingredients'), 'ingredient'),
+        } for index, meal in enumerate(dto.meals) if index not in errors}
+        if not valid_meals:
+            return {}, errors
+
+        recipes_nutrients, ingredients_nutrients = meal_calculate_items_nutrients(
+            [item for meal in valid_meals.values() for item in meal['recipes']],
+            [item for meal in valid_meals.values() for item in meal['ingredients']]
+        )
+        recipes_nutrients, ingredients_nutrients = iter(
+            recipes_nutrients), iter(ingredients_nutrients)
+        meals, items, diary_nutrients = {}, [], {}
+        for index, data in valid_meals.items():
+            meal = Meal(user=dto.user, date=data['date'],
+                        category_id=data['category'])
+            added = []
+            for item in data['recipes']:
+                nutrients = next(recipes_nutrients)
+                items.append(RecipePortion(
+                    meal=meal, recipe_id=item['recipe'], portion=item['portion'],
+                    **nutrients))
+                added.append(nutrients)
+            for item in data['ingredients']:
+                nutrients = next(ingredients_nutrients)
+                items.append(IngredientAmount(
+                    meal=meal, ingredient_id=item['ingredient'],
+                    unit_id=item['unit'], amount=item['amount'],
+                    **nutrients))
+                added.append(nutrients)
+            added = meal_sum_nutrients(added)
+            meal.calories = round(added['calories'])
+            meals[index] = meal
+            diary_nutrients.setdefault(meal.date, []).append(added)
+
+        self._insert_meals(dto.user, list(meals.values()))
+        for item in items:
+            item.meal_id = item.meal.id
+        RecipePortion.objects.bulk_create(
+            [item for item in items if isinstance(item, RecipePortion)])
+        IngredientAmount.objects.bulk_create(
+            [item for item in items if isinstance(item, IngredientAmount)])
+        for date, nutrients in diary_nutrients.items():
+            UpdateDiaryNutrition().update(UpdateDiaryNutritionDto(
+                user=dto.user, date=date, nutrients=meal_sum_nutrients(nutrients)))
+        return meals, errors
+
+    @staticmethod
+    def _insert_meals(user: get_user_model, meals: list[Meal]) -> None:
+        """ bulk insert meals. When database does not return primary keys of
+        inserted rows, they are read back with one query: rows inserted by
+        single statement get increasing ids, so new meals of user ordered by
+        id are matched with inserted ones by date and category """
+        if connection.features.can_return_rows_from_bulk_insert:
+            Meal.objects.bulk_create(meals)
+            return
+        last_id = Meal.objects.filter(user=user).aggregate(last_id=Max('id'))['last_id']
+        Meal.objects.bulk_create(meals)
+        inserted = {}
+        for id, date, category_id in Meal.objects.filter(
+                user=user, id__gt=last_id or 0).order_by('id').values_list(
+                'id', 'date', 'category_id'):
+            inserted.setdefault((date, category_id), []).append(id)
+        for meal in meals:
+            meal.id = inserted[meal.date, meal.category_id].pop(0)
 
 
 class RecalculateMealCalories():
-    def add_recipes(self, dto: RecalculateMealCaloriesDto, meal: Meal) -> None:
-        if not dto.recipes:
-            raise ValueError(
-                f'You cannot use add_recipes method with recipes set to None in RecalculateMealCaloriesDto')
-        recipes_ids = [item['recipe'] for item in dto.recipes]
-        recipes_to_be_added = Recipe.objects.filter(id__in=recipes_ids)
-        for recipe, item in zip(recipes_to_be_added, dto.recipes):
-            meal.calories += recipe_calculate_calories_based_on_portion(
-                item['portion'], recipe)
+    def add(self, meal: Meal, calories: float) -> None:
+        """ add calories of new meal items and save meal """
+        meal.calories = round(meal.calories + calories)
         meal.save()
 
-    def add_ingredients(self, dto: RecalculateMealCaloriesDto, meal: Meal) -> None:
-        if not dto.ingredients:
-            raise ValueError(
-                f'You cannot use add_ingredients method with ingredients set to None in RecalculateMealCaloriesDto')
-        ingredients_ids = [item['ingredient']
-                           for item in dto.ingredients]
-        unit_ids = [item['unit'] for item in dto.ingredients]
-        ingredients_with_amount = Ingredient_Unit.objects.filter(
-            ingredient_id__in=ingredients_ids, unit_id__in=unit_ids).prefetch_related('ingredient', 'unit')
-        for item, dto_item in zip(ingredients_with_amount, dto.ingredients):
-            meal.calories += ingredient_calculate_calories(
-                item.ingredient, item.unit, dto_item['amount'])
+    def recalculate(self, meal: Meal) -> None:
+        """ set meal calories to sum of calories stored on its items """
+        meal.calories = meal_calculate_calories(meal)
         meal.save()
 
 
@@ -210,22 +344,21 @@ class UpdateMealRecipeDto:
 
 
 class UpdateMealRecipe:
+    @transaction.atomic
     def update(self, recipe_portion: RecipePortion, dto: UpdateMealRecipeDto) -> None:
         if not recipe_portion:
             raise ObjectDoesNotExist()
 
-        old_calories = recipe_calculate_calories_based_on_portion(
-            recipe_portion.portion, recipe_portion.recipe)
-        recipe_portion.meal.calories -= old_calories
-
+        removed = meal_item_get_nutrients(recipe_portion)
+        added, _ = meal_calculate_items_nutrients(recipes=[
+            {'recipe': recipe_portion.recipe_id, 'portion': dto.portion}])
+        _update_diary_nutrition(
+            recipe_portion.meal, added=added[0], removed=removed)
+        for field, value in added[0].items():
+            setattr(recipe_portion, field, value)
         setattr(recipe_portion, 'portion', dto.portion)
         recipe_portion.save()
-
-        dto = RecalculateMealCaloriesDto(
-            recipes=[{'recipe': recipe_portion.recipe.id,
-                      'portion': recipe_portion.portion}]
-        )
-        RecalculateMealCalories().add_recipes(dto, recipe_portion.meal)
+        RecalculateMealCalories().recalculate(recipe_portion.meal)
 
 
 @dataclass
@@ -235,9 +368,9 @@ class UpdateMealIngredientDto:
 
 
 class UpdateMealIngredient:
-    def update(self, meal_ingredient: Meal, dto: UpdateMealIngredientDto) -> None:
-        meal_ingredient.meal.calories -= self._calculate_calories_to_be_substracted(
-            meal_ingredient)
+    @transaction.atomic
+    def update(self, meal_ingredient: IngredientAmount, dto: UpdateMealIngredientDto) -> None:
+        removed = meal_item_get_nutrients(meal_ingredient)
 
         if meal_ingredient.unit_id != dto.unit:
             if not unit_list().filter(id=dto.unit).exists():
@@ -245,21 +378,24 @@ class UpdateMealIngredient:
                     f'Unit with id {dto.unit} does not exists')
             meal_ingredient.unit_id = dto.unit
         meal_ingredient.amount = dto.amount
-        dto = RecalculateMealCaloriesDto(
-            ingredients=[{'ingredient': meal_ingredient.ingredient,
-                          'unit': dto.unit, 'amount': dto.amount}]
-        )
-        RecalculateMealCalories().add_ingredients(dto, meal_ingredient.meal)
-
-    @staticmethod
-    def _calculate_calories_to_be_substracted(ing: IngredientAmount) -> int:
-        return ingredient_calculate_calories(
-            ingredient=ing.ingredient,
-            unit=ing.unit,
-            amount=ing.amount
-        )
+        _, added = meal_calculate_items_nutrients(
+            ingredients=[_ingredient_amount_as_item(meal_ingredient)])
+        for field, value in added[0].items():
+            setattr(meal_ingredient, field, value)
+        meal_ingredient.save()
+        _update_diary_nutrition(
+            meal_ingredient.meal, added=added[0], removed=removed)
+        RecalculateMealCalories().recalculate(meal_ingredient.meal)
 
 
 class DeleteMeal:
+    @transaction.atomic
     def delete(self, meal: Meal) -> None:
+        _update_diary_nutrition(meal, removed=meal_get_nutrients(meal))
         meal.delete()
+
+
+def rebuild_diary_nutrition(user: get_user_model, dry_run: bool = False) -> list[datetime.date]:
+    """ set nutrients of user diaries to sums of nutrients stored on meal
+    items, return dates of diaries which drifted from their meals """
+    return reconcile_diary_nutrition(user, meal_get_daily_nutrients(user), dry_run)
@@ -1,3 +1,4 @@
+import json
 import random
 import string
 import datetime
@@ -5,6 +6,8 @@ import datetime
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework import status
 
@@ -18,11 +21,14 @@ from recipe.services import (
     AddIngredientsToRecipe,
 )
 from recipe.models import Recipe, Ingredient, Unit
-from meals_tracker.models import MealCategory
+from meals_tracker.models import MealCategory, Meal
+from health.models import HealthDiary
 
 MEALS_API = reverse('meals_tracker:meal-create')
 MEALS_HISTORY_URL = reverse('meals_tracker:meal-available-dates')
 CATEGORIES_URL = reverse('meals_tracker:categories')
+MEALS_IMPORT_URL = reverse('meals_tracker:meal-import')
+SHOPPING_LIST_URL = reverse('meals_tracker:shopping-list')
 
 
 def meal_detail_url(id: int) -> reverse:
@@ -143,6 +149,34 @@ class RecipeApiTests(TestCase):
         self.assertEqual(meal['id'], res.data[0]['id'])
         self.assertEqual(meal2['id'], res.data[1]['id'])
 
+    def test_listing_unchanged_meals_returns_not_modified(self) -> None:
+        self._create_meal(self.user)
+        etag = self.client.get(MEALS_API)['ETag']
+
+        res = self.client.get(MEALS_API, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.get(MEALS_API + '?expand=recipes', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self._create_meal(self.user)
+        res = self.client.get(MEALS_API, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 2)
+
+    def test_listing_meals_after_deleting_older_meal(self) -> None:
+        older = self._create_meal(self.user)
+        self._create_meal(self.user)
+        res = self.client.get(MEALS_API)
+        self.assertFalse(res.has_header('Last-Modified'))
+        etag = res['ETag']
+
+        self.client.delete(meal_detail_url(older['id']))
+        res = self.client.get(MEALS_API, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+
     def test_listing_meals_for_different_date_success(self) -> None:
         yesterday = datetime.date.today() - datetime.timedelta(1)
         meal = self._create_meal(self.user, yesterday)
@@ -279,3 +313,174 @@ class RecipeApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         res = self.client.get(meal_detail_url(meal['id']))
         self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_listing_meals_with_expanded_recipes_and_ingredients(self) -> None:
+        meal = self._create_meal(self.user)
+        ingredient = self._add_ingredient_to_meal(meal['id'])[0]
+        res = self.client.get(MEALS_API + '?expand=recipes,ingredients')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data[0]['recipes']), 1)
+        self.assertEqual(res.data[0]['ingredients'][0]['calories'],
+                         ingredient.calories)
+        self.assertEqual(res.data[0]['ingredients'][0]['unit']['name'], 'gram')
+
+    def test_retrieving_meal_with_expanded_recipes(self) -> None:
+        meal = self._create_meal(self.user)
+        res = self.client.get(meal_detail_url(meal['id']) + '?expand=recipes')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipes'][0]['portion'], 4)
+        self.assertIn('meals', res.data['ingredients'])
+
+    def test_listing_expanded_meals_takes_constant_number_of_queries(self) -> None:
+        def count_queries() -> int:
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(MEALS_API + '?expand=recipes,ingredients')
+            return len(context.captured_queries)
+
+        meal = self._create_meal(self.user)
+        self._add_ingredient_to_meal(meal['id'])
+        expected_queries = count_queries()
+        for _ in range(3):
+            meal = self._create_meal(self.user)
+            self._add_ingredient_to_meal(meal['id'])
+        self.assertEqual(count_queries(), expected_queries)
+
+    def test_listing_meals_with_invalid_expand_failed(self) -> None:
+        res = self.client.get(MEALS_API + '?expand=category')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def _import_payload(self, count: int) -> list[dict]:
+        recipe = self._create_recipe_with_ingredient(self.user)
+        ingredient = self._create_ingredient(self.user)
+        unit = ingredient.units.all()[0]
+        category = self._create_category()
+        return [{
+            'category': category.id,
+            'date': str(datetime.date.today() - datetime.timedelta(days=day)),
+            'recipes': [{'recipe': recipe.id, 'portion': 1}],
+            'ingredients': [{'ingredient': ingredient.id, 'unit': unit.id, 'amount': 100}],
+        } for day in range(count)]
+
+    def test_importing_meals_from_many_dates_success(self) -> None:
+        payload = self._import_payload(3)
+        payload[1]['recipes'][0]['recipe'] = 9999
+        payload.append({'date': 'today'})
+
+        res = self.client.post(MEALS_IMPORT_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([meal['index'] for meal in res.data['meals']], [0, 2])
+        self.assertEqual([error['index'] for error in res.data['errors']], [1, 3])
+        meal = Meal.objects.get(id=res.data['meals'][1]['id'])
+        self.assertEqual(meal.date, datetime.date.today() - datetime.timedelta(days=2))
+        self.assertEqual(meal.calories, 250 + 1000)
+        self.assertEqual(meal.recipe_portion.count(), 1)
+        self.assertEqual(meal.ingredientamount_set.count(), 1)
+        self.assertEqual(HealthDiary.objects.get(
+            user=self.user, date=meal.date).calories, 1250)
+
+    def test_importing_meals_from_ndjson_success(self) -> None:
+        payload = '\n'.join(json.dumps(meal) for meal in self._import_payload(2))
+
+        res = self.client.post(MEALS_IMPORT_URL, payload,
+                               content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data['meals']), 2)
+        self.assertEqual(Meal.objects.filter(user=self.user).count(), 2)
+
+    def test_importing_only_invalid_meals_failed(self) -> None:
+        payload = self._import_payload(1)
+        payload[0]['category'] = 9999
+
+        res = self.client.post(MEALS_IMPORT_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Meal.objects.filter(user=self.user).exists())
+
+    def test_importing_meals_takes_constant_number_of_queries(self) -> None:
+        def count_queries(payload):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(MEALS_IMPORT_URL, payload, format='json')
+            return len(queries)
+
+        payload = self._import_payload(10)
+        for meal in payload:
+            meal['date'] = str(datetime.date.today())
+        count_queries(payload[:1])
+        few = count_queries(payload[:2])
+        many = count_queries(payload)
+        self.assertEqual(few, many)
+
+    def test_importing_planned_meals_with_repeated_date_and_category(self) -> None:
+        payload = self._import_payload(2)
+        payload[0]['date'] = payload[1]['date'] = str(
+            datetime.date.today() + datetime.timedelta(days=7))
+        payload[1]['recipes'] = []
+
+        res = self.client.post(MEALS_IMPORT_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        first, second = (Meal.objects.get(id=meal['id']) for meal in res.data['meals'])
+        self.assertEqual(first.calories, 250 + 1000)
+        self.assertEqual(first.recipe_portion.count(), 1)
+        self.assertEqual(second.calories, 1000)
+        self.assertFalse(second.recipe_portion.exists())
+
+    def test_shopping_list_from_planned_meals_and_recipes(self) -> None:
+        recipe = self._create_recipe_with_ingredient(self.user)
+        ingredient = recipe.ingredients.get()
+        gram = Unit.objects.get(name='gram')
+        today = datetime.date.today()
+        yesterday = today - datetime.timedelta(days=1)
+        category = self._create_category().id
+        self.client.post(MEALS_API, {
+            'category': category, 'date': yesterday,
+            'recipes': [{'recipe': recipe.id, 'portion': 2}]}, format='json')
+        self.client.post(MEALS_API, {
+            'category': category, 'date': today,
+            'ingredients': [{'ingredient': ingredient.id, 'unit': gram.id,
+                             'amount': 30}]}, format='json')
+        payload = {
+            'start_date': yesterday,
+            'end_date': today,
+            'recipes': [{'recipe': recipe.id, 'portion': 4}],
+        }
+
+        res = self.client.post(SHOPPING_LIST_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['ingredient'], ingredient.id)
+        self.assertEqual(res.data[0]['grams'], 100 * 2 / 4 + 30 + 100)
+        self.assertEqual(res.data[0]['other_units'], [])
+
+    def test_shopping_list_takes_constant_number_of_queries(self) -> None:
+        recipes = [self._create_recipe_with_ingredient(self.user) for i in range(6)]
+
+        def shopping_list_queries(recipes: list[Recipe]) -> int:
+            payload = {'recipes': [{'recipe': recipe.id, 'portion': 1}
+                                   for recipe in recipes]}
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(SHOPPING_LIST_URL, payload, format='json')
+            self.assertEqual(len(res.data), len(recipes))
+            return len(queries)
+
+        shopping_list_queries(recipes[:1])
+        self.assertEqual(shopping_list_queries(recipes[:2]),
+                         shopping_list_queries(recipes))
+
+    def test_shopping_list_with_unavailable_recipe_failed(self) -> None:
+        other_user = get_user_model().objects.create_user(
+            email='other@gmail.com', name='other', password='otherpass')
+        recipe = self._create_recipe_with_ingredient(other_user)
+        payload = {'recipes': [{'recipe': recipe.id, 'portion': 1}]}
+
+        res = self.client.post(SHOPPING_LIST_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_shopping_list_without_dates_and_recipes_failed(self) -> None:
+        res = self.client.post(SHOPPING_LIST_URL, {'start_date': datetime.date.today()},
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,11 +1,15 @@
 import datetime
+from io import StringIO
 
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.utils.text import slugify
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from meals_tracker.models import MealCategory, Meal
+from meals_tracker.models import MealCategory, Meal, RecipePortion, IngredientAmount
 from meals_tracker.services import (
     CreateMealDto,
     CreateMeal,
@@ -15,6 +19,8 @@ from meals_tracker.services import (
     UpdateMealRecipe,
     AddRecipesToMeal,
     AddRecipesToMealDto,
+    AddIngredientsToMeal,
+    AddIngredientsToMealDto,
     UpdateMealIngredientDto,
     UpdateMealIngredient,
     DeleteMeal,
@@ -22,6 +28,7 @@ from meals_tracker.services import (
     RemoveIngredientFromMeal,
 )
 from recipe.models import Recipe, Ingredient
+from health.models import HealthDiary
 from recipe import selectors as recipe_selectors
 
 
@@ -307,14 +314,191 @@ class MealsTrackerServicesTests(TestCase):
 
     def test_deleting_recipe_from_meal_success(self) -> None:
         meal = self._create_meal(self.user)
-        recipe_to_be_deleted_from_meal = meal.recipes.all()[0]
-        RemoveRecipeFromMeal().remove(recipe_to_be_deleted_from_meal)
+        recipe_portion_to_be_deleted = meal.recipe_portion.all()[0]
+        RemoveRecipeFromMeal().remove(recipe_portion_to_be_deleted)
         with self.assertRaises(Recipe.DoesNotExist):
-            meal.recipes.get(id=recipe_to_be_deleted_from_meal.id)
+            meal.recipes.get(id=recipe_portion_to_be_deleted.recipe_id)
 
     def test_deleting_ingredient_from_meal_success(self) -> None:
         meal = self._create_meal(self.user)
-        ingredient_to_be_deleted_from_meal = meal.ingredients.all()[0]
-        RemoveIngredientFromMeal().remove(ingredient_to_be_deleted_from_meal)
+        ingredient_amount_to_be_deleted = meal.ingredientamount_set.all()[0]
+        RemoveIngredientFromMeal().remove(ingredient_amount_to_be_deleted)
         with self.assertRaises(Ingredient.DoesNotExist):
-            meal.ingredients.get(id=ingredient_to_be_deleted_from_meal.id)
+            meal.ingredients.get(id=ingredient_amount_to_be_deleted.ingredient_id)
+
+    def _get_diary(self) -> HealthDiary:
+        return HealthDiary.objects.get(user=self.user, date=self.today)
+
+    def test_creating_meal_updates_daily_diary_nutrition(self) -> None:
+        meal = self._create_meal(self.user)
+        diary = self._get_diary()
+        self.assertEqual(diary.calories, meal.calories)
+        self.assertEqual(diary.proteins, 0)
+
+        ingredient = Ingredient.objects.create(
+            user=self.user, name='proteins', slug='proteins',
+            calories=400, proteins=80, fats=5, zinc=2)
+        unit = recipe_selectors.unit_get_default()
+        ingredient.units.add(unit, through_defaults={'grams_in_one_unit': 100})
+        dto = AddIngredientsToMealDto(
+            user=self.user,
+            ingredients=[{'ingredient': ingredient.id,
+                          'unit': unit.id, 'amount': 50}]
+        )
+        AddIngredientsToMeal().add(meal, dto)
+        diary.refresh_from_db()
+        self.assertEqual(diary.calories, meal.calories)
+        self.assertEqual(diary.proteins, 40)
+        self.assertEqual(diary.fats, 2.5)
+        self.assertEqual(diary.zinc, 1)
+
+    def test_updating_meal_items_updates_daily_diary_nutrition(self) -> None:
+        meal = self._create_meal(self.user)
+        recipe_portion = meal.recipe_portion.all()[0]
+        UpdateMealRecipe().update(recipe_portion, UpdateMealRecipeDto(portion=4))
+        ingredient_amount = meal.ingredientamount_set.all()[0]
+        UpdateMealIngredient().update(ingredient_amount, UpdateMealIngredientDto(
+            unit=ingredient_amount.unit_id, amount=200))
+        self.assertEqual(self._get_diary().calories, 1000 + 1000)
+
+    def test_removing_meal_items_updates_daily_diary_nutrition(self) -> None:
+        meal = self._create_meal(self.user)
+        RemoveRecipeFromMeal().remove(meal.recipe_portion.all()[0])
+        self.assertEqual(self._get_diary().calories, 500)
+        RemoveIngredientFromMeal().remove(meal.ingredientamount_set.all()[0])
+        self.assertEqual(self._get_diary().calories, 0)
+
+    def test_deleting_meal_updates_daily_diary_nutrition(self) -> None:
+        meal = self._create_meal(self.user)
+        DeleteMeal().delete(meal)
+        self.assertEqual(self._get_diary().calories, 0)
+
+    def test_meal_items_store_calculated_nutrients(self) -> None:
+        meal = self._create_meal(self.user)
+        recipe_portion = meal.recipe_portion.all()[0]
+        ingredient_amount = meal.ingredientamount_set.all()[0]
+        self.assertEqual(recipe_portion.calories, 250)
+        self.assertEqual(ingredient_amount.calories, 500)
+
+        UpdateMealRecipe().update(recipe_portion, UpdateMealRecipeDto(portion=2))
+        UpdateMealIngredient().update(ingredient_amount, UpdateMealIngredientDto(
+            unit=ingredient_amount.unit_id, amount=50))
+        recipe_portion.refresh_from_db()
+        ingredient_amount.refresh_from_db()
+        self.assertEqual(recipe_portion.calories, 500)
+        self.assertEqual(ingredient_amount.calories, 250)
+
+    def test_backfill_meal_items_nutrients_command(self) -> None:
+        meal = self._create_meal(self.user)
+        recipe = self._create_recipe(self.user, name='second')
+        AddRecipesToMeal().add(meal, AddRecipesToMealDto(
+            user=self.user, recipes=[{'recipe': recipe.id, 'portion': 1}]))
+        RecipePortion.objects.update(calories=0, proteins=0)
+        IngredientAmount.objects.update(calories=0)
+        call_command('backfill_meal_items_nutrients', chunk_size=1, stdout=StringIO())
+
+        for item in RecipePortion.objects.filter(meal=meal):
+            self.assertEqual(item.calories, 250)
+        for item in IngredientAmount.objects.filter(meal=meal):
+            self.assertEqual(item.calories, 500)
+
+    def test_removing_meal_items_subtracts_stored_nutrients(self) -> None:
+        meal = self._create_meal(self.user)
+        ingredient = Ingredient.objects.create(
+            user=self.user, name='zinc', slug='zinc', calories=333, proteins=7, zinc=3)
+        unit = recipe_selectors.unit_get_default()
+        ingredient.units.add(unit, through_defaults={'grams_in_one_unit': 100})
+        AddIngredientsToMeal().add(meal, AddIngredientsToMealDto(
+            user=self.user, ingredients=[{'ingredient': ingredient.id,
+                                          'unit': unit.id, 'amount': 30}]))
+        ingredient_amount = meal.ingredientamount_set.get(ingredient=ingredient)
+        self.assertAlmostEqual(ingredient_amount.zinc, 0.9)
+        self.assertAlmostEqual(self._get_diary().calories, 750 + 99.9)
+
+        # values of ingredient changed after it was added to meal
+        Ingredient.objects.filter(id=ingredient.id).update(calories=10, zinc=50)
+        UpdateMealIngredient().update(ingredient_amount, UpdateMealIngredientDto(
+            unit=unit.id, amount=100))
+        self.assertAlmostEqual(self._get_diary().zinc, 50)
+        ingredient_amount.refresh_from_db()
+        # unit mapping of ingredient was deleted
+        ingredient.units.clear()
+        RemoveIngredientFromMeal().remove(ingredient_amount)
+
+        diary = self._get_diary()
+        self.assertEqual(diary.calories, 750)
+        self.assertEqual(diary.proteins, 0)
+        self.assertEqual(diary.zinc, 0)
+
+    def test_rebuild_diary_nutrition_command(self) -> None:
+        meal = self._create_meal(self.user)
+        HealthDiary.objects.filter(user=self.user).update(calories=-20, proteins=3)
+        yesterday = self.today - datetime.timedelta(days=1)
+        HealthDiary.objects.create(user=self.user, date=yesterday, calories=100)
+
+        out = StringIO()
+        call_command('rebuild_diary_nutrition', '--dry-run', stdout=out)
+        self.assertIn('Found 2 diaries', out.getvalue())
+        self.assertEqual(self._get_diary().calories, -20)
+
+        call_command('rebuild_diary_nutrition', email=self.user.email, stdout=StringIO())
+        diary = self._get_diary()
+        self.assertEqual(diary.calories, meal.calories)
+        self.assertEqual(diary.proteins, 0)
+        self.assertEqual(HealthDiary.objects.get(user=self.user, date=yesterday).calories, 0)
+        out = StringIO()
+        call_command('rebuild_diary_nutrition', stdout=out)
+        self.assertIn('Corrected 0 diaries', out.getvalue())
+
+    def _create_meal_with_items(self, count: int) -> tuple[Meal, int]:
+        """ create meal from count recipes and count ingredients, return it
+        with number of executed queries """
+        unit = recipe_selectors.unit_get_default()
+        recipes = [self._create_recipe(self.user, name=f'recipe {count} {i}')
+                   for i in range(count)]
+        ingredients = [self._create_ingredient(self.user, name=f'ing {count} {i}')
+                       for i in range(count)]
+        dto = CreateMealDto(
+            user=self.user,
+            date=self.today,
+            category=self._create_category(name=f'category {count}').id,
+            recipes=[{'recipe': recipe.id, 'portion': 1} for recipe in recipes],
+            ingredients=[{'ingredient': ingredient.id, 'unit': unit.id, 'amount': 100}
+                         for ingredient in ingredients]
+        )
+        with CaptureQueriesContext(connection) as queries:
+            meal = CreateMeal().create(dto)
+        return meal, len(queries)
+
+    def test_create_meal_uses_constant_number_of_queries(self) -> None:
+        self._create_meal_with_items(1)
+        meal, queries_for_two = self._create_meal_with_items(2)
+        self.assertEqual(meal.calories, 2 * 250 + 2 * 500)
+        meal, queries_for_twenty = self._create_meal_with_items(20)
+        self.assertEqual(meal.calories, 20 * 250 + 20 * 500)
+        self.assertEqual(meal.recipe_portion.count(), 20)
+        self.assertEqual(meal.ingredientamount_set.count(), 20)
+        self.assertEqual(queries_for_two, queries_for_twenty)
+
+    def test_create_meal_with_repeated_items_counts_them_once(self) -> None:
+        recipe = self._create_recipe(self.user)
+        ingredient = self._create_ingredient(self.user)
+        unit = recipe_selectors.unit_get_default()
+        dto = CreateMealDto(
+            user=self.user,
+            date=self.today,
+            category=self._create_category().id,
+            recipes=[{'recipe': recipe.id, 'portion': 1},
+                     {'recipe': recipe.id, 'portion': 2}],
+            ingredients=[{'ingredient': ingredient.id, 'unit': unit.id, 'amount': 100},
+                         {'ingredient': ingredient.id, 'unit': unit.id, 'amount': 300}]
+        )
+        meal = CreateMeal().create(dto)
+        self.assertEqual(meal.calories, 250 + 500)
+        self.assertEqual(meal.recipe_portion.get().portion, 1)
+        self.assertEqual(self._get_diary().calories, 750)
+
+        AddRecipesToMeal().add(meal, AddRecipesToMealDto(
+            user=self.user, recipes=[{'recipe': recipe.id, 'portion': 4}]))
+        meal.refresh_from_db()
+        self.assertEqual(meal.calories, 750)
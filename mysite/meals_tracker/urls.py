@@ -10,6 +10,7 @@ urlpatterns = [
          name='meal-list'),
     path('meals/', views.MealsApi.as_view(),
          name='meal-create'),
+    path('meals/import', views.MealsImportApi.as_view(), name='meal-import'),
     path('meals/<pk>', views.MealsDetailApi.as_view(), name='meal-detail'),
     path('meals/<pk>/recipes', views.MealsRecipesApi.as_view(), name='meal-recipes'),
     path('meals/<pk>/recipes/<recipe_pk>',
@@ -20,6 +21,8 @@ urlpatterns = [
          views.MealsIngredientsDetailApi.as_view(), name='meal-ingredients-detail'),
     path('meals-history/', views.MealsAvailableDatesApi.as_view(),
          name='meal-available-dates'),
+    path('shopping-list/', views.MealsShoppingListApi.as_view(),
+         name='shopping-list'),
     path('categories/', views.MealCategoryApi.as_view(),
          name='categories')
 
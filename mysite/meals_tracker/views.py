@@ -1,12 +1,16 @@
 from rest_framework import status
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.views import APIView
 from rest_framework.reverse import reverse
+from rest_framework.exceptions import ValidationError
 
 from meals_tracker import serializers, selectors
 from mysite.views import BaseAuthPermClass
 from mysite.exceptions import ApiErrorsMixin
+from mysite.parsers import NDJSONParser
+from mysite.conditional import get_etag, get_not_modified_response, set_validators
 from meals_tracker.services import (
     CreateMeal,
     CreateMealDto,
@@ -21,6 +25,8 @@ from meals_tracker.services import (
     RemoveRecipeFromMeal,
     RemoveIngredientFromMeal,
     DeleteMeal,
+    ImportMeals,
+    ImportMealsDto,
 )
 
 
@@ -35,10 +41,15 @@ class MealsBaseViewClass(BaseAuthPermClass, ApiErrorsMixin, APIView):
             'view': self
         }
 
-    def _get_object(self) -> None:
+    def _get_object(self, expand: list[str] = ()) -> None:
         id = self.kwargs.get('pk')
         user = self.request.user
-        return selectors.meal_get(user, id)
+        return selectors.meal_get(user, id, expand)
+
+    def _get_expand(self) -> list[str]:
+        """ return meal fields which should be embedded in response """
+        return selectors.meal_validate_expand(
+            self.request.query_params.get('expand'))
 
     def set_location_in_header(self, id: int, request: Request) -> dict:
         return {'Location': reverse(
@@ -51,10 +62,21 @@ class MealsApi(MealsBaseViewClass):
 
     def get(self, request, *args, **kwargs):
         date = request.query_params.get('date')
-        meals = selectors.meal_list(user=request.user, date=date)
+        expand = self._get_expand()
+        version = selectors.meal_list_version(user=request.user, date=date, expand=expand)
+        etag = get_etag('meals', date, sorted(expand), sorted(version.items()),
+                        request.get_host())
+        # Last-Modified is not sent, deleted meal does not change latest
+        # updated_at of the rest, only number of meals in etag
+        response = get_not_modified_response(request, etag)
+        if response is not None:
+            return response
+        meals = selectors.meal_list(user=request.user, date=date, expand=expand)
+        context = self.get_serializer_context()
+        context['expand'] = expand
         serializer = serializers.MealsListSerializer(
-            instance=meals, many=True, context=self.get_serializer_context())
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+            instance=meals, many=True, context=context)
+        return set_validators(Response(data=serializer.data, status=status.HTTP_200_OK), etag)
 
     def post(self, request, *args, **kwargs):
         dto = self._prepare_dto(request)
@@ -76,13 +98,62 @@ class MealsApi(MealsBaseViewClass):
         )
 
 
+class MealsImportApi(MealsBaseViewClass):
+    """ API for creating many meals at once from JSON array or NDJSON stream """
+
+    parser_classes = [JSONParser, NDJSONParser]
+    max_meals = 1000
+
+    def post(self, request, *args, **kwargs):
+        meals, errors = self._validate(request.data)
+        indexes = list(meals.keys())
+        created = {}
+        if meals:
+            dto = ImportMealsDto(user=request.user, meals=list(meals.values()))
+            created, invalid = ImportMeals().import_meals(dto)
+            for position, messages in invalid.items():
+                errors[indexes[position]] = messages
+        data = {
+            'meals': [{
+                'index': indexes[position],
+                'id': meal.id,
+                'self': reverse('meals_tracker:meal-detail', request=request,
+                                kwargs={'pk': meal.id})
+            } for position, meal in created.items()],
+            'errors': [{'index': index, 'errors': errors[index]}
+                       for index in sorted(errors)],
+        }
+        response_status = status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        return Response(data=data, status=response_status)
+
+    def _validate(self, data: list) -> tuple[dict[int, dict], dict[int, dict]]:
+        """ validate every meal separately, return valid meals and errors
+        keyed by meal index """
+        if not isinstance(data, list) or not data:
+            raise ValidationError('Expected non empty list of meals')
+        if len(data) > self.max_meals:
+            raise ValidationError(
+                f'Maximum {self.max_meals} meals can be imported at once')
+        meals, errors = {}, {}
+        for index, item in enumerate(data):
+            serializer = serializers.MealCreateSerializer(data=item)
+            if serializer.is_valid():
+                meals[index] = serializer.validated_data
+            else:
+                errors[index] = serializer.errors
+        return meals, errors
+
+
 class MealsDetailApi(MealsBaseViewClass):
     """ API for retrieving/updating specific meals """
 
     def get(self, request, *args, **kwargs):
-        meal = self._get_object()
+        expand = self._get_expand()
+        meal = self._get_object(expand)
+        context = self.get_serializer_context()
+        context['expand'] = expand
         serializer = serializers.MealDetailSerializer(
-            meal, context=self.get_serializer_context())
+            meal, context=context)
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
     def delete(self, request, *args, **kwargs):
@@ -239,3 +310,20 @@ class MealCategoryApi(MealsBaseViewClass):
         serializer = serializers.MealCategorySerializer(
             all_categories, many=True)
         return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+
+class MealsShoppingListApi(MealsBaseViewClass):
+    """ API for aggregating ingredients of planned meals and recipes into
+    shopping list """
+
+    def post(self, request, *args, **kwargs):
+        serializer = serializers.ShoppingListInputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        shopping_list = selectors.meal_get_shopping_list(
+            request.user,
+            start_date=data.get('start_date'),
+            end_date=data.get('end_date'),
+            recipes=[dict(item) for item in data.get('recipes', [])]
+        )
+        return Response(data=shopping_list, status=status.HTTP_200_OK)
@@ -0,0 +1,34 @@
+import datetime
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.request import Request
+
+
+def get_etag(*parts) -> str:
+    """ return strong etag built from values identifying version of resource """
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def get_not_modified_response(request: Request, etag: str,
+                              last_modified: datetime.datetime = None) -> HttpResponse:
+    """ return 304 response if validators sent by client (If-None-Match,
+    If-Modified-Since) still match resource, otherwise None """
+    response = get_conditional_response(
+        request, etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response: HttpResponse, etag: str,
+                   last_modified: datetime.datetime = None) -> HttpResponse:
+    """ set ETag and Last-Modified headers of response """
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
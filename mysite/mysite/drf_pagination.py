@@ -1,10 +1,18 @@
 from collections import OrderedDict
 
-from rest_framework.pagination import LimitOffsetPagination as _LimitOffsetPagination
+from rest_framework.pagination import (
+    LimitOffsetPagination as _LimitOffsetPagination,
+    CursorPagination as _CursorPagination,
+)
 from rest_framework.response import Response
 
 
-def get_paginated_response(*, pagination_class, serializer_class, queryset, request, view):
+def get_paginated_response(*, pagination_class, serializer_class, queryset, request, view,
+                           cursor_pagination_class=None):
+    """ paginate queryset with pagination_class, or with cursor_pagination_class
+    when client asks for cursor pagination """
+    if cursor_pagination_class is not None and CursorPagination.is_requested(request):
+        pagination_class = cursor_pagination_class
     paginator = pagination_class()
 
     page = paginator.paginate_queryset(queryset, request, view=view)
@@ -45,3 +53,35 @@ class LimitOffsetPagination(_LimitOffsetPagination):
             ('previous', self.get_previous_link()),
             ('results', data)
         ]))
+
+
+class CursorPagination(_CursorPagination):
+    """
+    Keyset pagination, every page costs the same regardless of its depth.
+    Used when request contains `cursor` or `pagination=cursor` query param,
+    total count is calculated only on demand with `count=true`.
+    """
+    page_size = 10
+    max_page_size = 50
+    page_size_query_param = 'limit'
+    ordering = ('-id', )
+    count_query_param = 'count'
+
+    @classmethod
+    def is_requested(cls, request) -> bool:
+        params = request.query_params
+        return cls.cursor_query_param in params or params.get('pagination') == 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('true', '1'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
@@ -0,0 +1,202 @@
+""" Low overhead request metrics kept in memory of the process and exposed
+in prometheus text format. Every request increases request counter, only
+METRICS_SAMPLE_RATE part of requests is timed and has its queries counted """
+import random
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable
+
+from django.db import connection
+
+from mysite import settings
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, value: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        """ return (suffix, labels, value) of every series """
+        with self._lock:
+            return [('', tuple(zip(self.labelnames, labels)), value)
+                    for labels, value in sorted(self._values.items())]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple,
+                 buckets: tuple) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels: str) -> None:
+        """ count value in first bucket not lower than value, buckets are
+        accumulated only when metrics are rendered """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        samples = []
+        with self._lock:
+            values = sorted((labels, (list(counts), total))
+                            for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in values:
+            labels = tuple(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf', ), counts):
+                cumulative += count
+                samples.append(('_bucket', labels + (('le', str(bound)), ), cumulative))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, cumulative))
+        return samples
+
+
+REQUESTS = Counter(
+    'http_requests_total', 'Handled requests', ('view', 'method', 'status'))
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Latency of sampled requests',
+    ('view', 'method'), LATENCY_BUCKETS)
+RENDER_DURATION = Histogram(
+    'http_response_render_duration_seconds',
+    'Time of rendering body of sampled responses, serializer data is built '
+    'before by view', ('view', ), LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Body size of sampled responses', ('view', ), SIZE_BUCKETS)
+DB_QUERIES = Histogram(
+    'db_queries_per_request', 'SQL queries run by sampled request', ('view', ),
+    QUERIES_BUCKETS)
+DB_DURATION = Histogram(
+    'db_query_duration_seconds_per_request', 'Time of SQL queries run by sampled request',
+    ('view', ), LATENCY_BUCKETS)
+OUTBOUND_DURATION = Histogram(
+    'outbound_request_duration_seconds', 'Time to response of requests to external APIs',
+    ('service', 'status'), LATENCY_BUCKETS)
+N_PLUS_ONE = Counter(
+    'n_plus_one_detected_total', 'Repeated query shapes found by N+1 detector', ('source', ))
+
+METRICS = (REQUESTS, REQUEST_DURATION, RENDER_DURATION, RESPONSE_SIZE, DB_QUERIES,
+           DB_DURATION, OUTBOUND_DURATION, N_PLUS_ONE)
+
+
+def render_metrics() -> str:
+    """ return all metrics in prometheus text exposition format """
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for suffix, labels, value in metric.samples():
+            rendered = ','.join(f'{name}="{_escape(value)}"' for name, value in labels)
+            lines.append(f'{metric.name}{suffix}{{{rendered}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def clear_metrics() -> None:
+    for metric in METRICS:
+        metric.clear()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def outbound_response_hook(service: str) -> Callable:
+    """ return requests response hook recording time to response of service """
+    def hook(response, *args, **kwargs):
+        OUTBOUND_DURATION.observe(response.elapsed.total_seconds(), service,
+                                  str(response.status_code))
+    return hook
+
+
+def get_view_name(request) -> str:
+    """ return name of view class which handled request """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view_class = getattr(match.func, 'view_class', None)
+    return view_class.__name__ if view_class else match.func.__name__
+
+
+class RequestMetrics:
+    """ measurements of single sampled request """
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.queries_time = 0
+        self.render_time = None
+
+    def record_query(self, execute, sql, params, many, context):
+        """ database execute wrapper counting queries and their time """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.queries_time += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """ record metrics of every request, should be first in MIDDLEWARE """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            response = self.get_response(request)
+            REQUESTS.inc(get_view_name(request), request.method, str(response.status_code))
+            return response
+
+        request_metrics = request.request_metrics = RequestMetrics()
+        start = time.perf_counter()
+        with connection.execute_wrapper(request_metrics.record_query):
+            response = self.get_response(request)
+        end = time.perf_counter()
+
+        view = get_view_name(request)
+        REQUESTS.inc(view, request.method, str(response.status_code))
+        REQUEST_DURATION.observe(end - start, view, request.method)
+        DB_QUERIES.observe(request_metrics.queries, view)
+        DB_DURATION.observe(request_metrics.queries_time, view)
+        if request_metrics.render_time is not None:
+            RENDER_DURATION.observe(request_metrics.render_time, view)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), view)
+        return response
+
+    def process_template_response(self, request, response):
+        """ called right before response rendering, DRF responses are
+        encoded to JSON during rendering """
+        request_metrics = getattr(request, 'request_metrics', None)
+        if request_metrics is not None:
+            render_start = time.perf_counter()
+
+            def record_render_time(response):
+                request_metrics.render_time = time.perf_counter() - render_start
+            response.add_post_render_callback(record_render_time)
+        return response
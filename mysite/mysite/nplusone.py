@@ -0,0 +1,150 @@
+""" Detection of N+1 queries: statements of the same shape repeated many
+times in single request or service call. Requests and calls are sampled
+with NPLUSONE_SAMPLE_RATE and detections are logged. In strict mode,
+enabled in tests, every request and call is inspected and detection
+raises NPlusOneError at the offending query """
+import logging
+import random
+import re
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable
+
+from django.db import connection
+
+from mysite import settings, metrics
+
+logger = logging.getLogger(__name__)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAMS_LIST = re.compile(r'\((?:(?:%s|\?), )*(?:%s|\?)\)')
+_WHITESPACE = re.compile(r'\s+')
+_current = ContextVar('query_inspector', default=None)
+
+
+class NPlusOneError(Exception):
+    """ raised in strict mode when repeated queries are detected """
+
+
+def fingerprint(sql: str) -> str:
+    """ return shape of SQL statement, statements differing only by values
+    of literals or number of parameters in list are equal """
+    sql = _LITERALS.sub('?', sql)
+    sql = _PARAMS_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def get_call_site() -> str:
+    """ return innermost frame of project code outside of this module """
+    base = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(base) and frame.filename != __file__ \
+                and 'site-packages' not in frame.filename:
+            return f'{frame.filename[len(base) + 1:]}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+class QueryInspector:
+    """ database execute wrapper counting shapes of statements """
+
+    def __init__(self, name: str, threshold: int, strict: bool) -> None:
+        self.name = name
+        self.threshold = threshold
+        self.strict = strict
+        self.counts = Counter()
+        # call site where shape reached threshold, by shape
+        self.detected = {}
+        self.paused = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.paused:
+            return execute(sql, params, many, context)
+        shape = fingerprint(sql)
+        self.counts[shape] += 1
+        if self.counts[shape] == self.threshold:
+            self.detected[shape] = get_call_site()
+            metrics.N_PLUS_ONE.inc(self.name)
+            if self.strict:
+                raise NPlusOneError(
+                    f'{self.threshold} queries "{shape}" in {self.name} '
+                    f'from {self.detected[shape]}')
+        return execute(sql, params, many, context)
+
+    def report(self) -> None:
+        for shape, call_site in self.detected.items():
+            logger.warning('N+1 queries in %s: %s times "%s" from %s',
+                           self.name, self.counts[shape], shape, call_site)
+
+
+def is_sampled() -> bool:
+    return settings.NPLUSONE_STRICT or random.random() < settings.NPLUSONE_SAMPLE_RATE
+
+
+@contextmanager
+def inspect_queries(name: str, threshold: int = None, strict: bool = None):
+    """ inspect queries run inside block, nested blocks are inspected by
+    the outermost one """
+    inspector = _current.get()
+    if inspector is not None:
+        yield inspector
+        return
+    inspector = QueryInspector(
+        name, threshold or settings.NPLUSONE_THRESHOLD,
+        settings.NPLUSONE_STRICT if strict is None else strict)
+    token = _current.set(inspector)
+    try:
+        with connection.execute_wrapper(inspector):
+            yield inspector
+    finally:
+        _current.reset(token)
+        inspector.report()
+
+
+@contextmanager
+def allow_repeated_queries():
+    """ skip inspection of block which repeats queries deliberately """
+    inspector = _current.get()
+    if inspector is None:
+        yield
+        return
+    inspector.paused += 1
+    try:
+        yield
+    finally:
+        inspector.paused -= 1
+
+
+def detect_n_plus_one(func: Callable) -> Callable:
+    """ inspect queries of sampled calls of decorated service function """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not is_sampled():
+            return func(*args, **kwargs)
+        with inspect_queries(func.__qualname__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class NPlusOneMiddleware:
+    """ inspect queries of sampled requests """
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_sampled():
+            return self.get_response(request)
+        # renamed after view in process_view, path of unresolved request
+        # is not used as name so metric labels stay bounded
+        with inspect_queries('unresolved'):
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """ name inspection after view class handling request """
+        inspector = _current.get()
+        if inspector is not None:
+            inspector.name = metrics.get_view_name(request)
+        return None
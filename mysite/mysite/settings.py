@@ -19,6 +19,55 @@ TEMPLATE_DIR = Path(BASE_DIR) / 'templates'
 # MEDIA_DIR = Path(BASE_DIR) / 'media'
 
 STRAVA_AUTH_URL = "https://www.strava.com/oauth/token"
+STRAVA_API_URL = "https://www.strava.com/api/v3"
+STRAVA_MAX_WORKERS = 4
+STRAVA_REQUEST_TIMEOUT = 10
+STRAVA_SYNC_INTERVAL = 900
+STRAVA_SYNC_MAX_ATTEMPTS = 5
+STRAVA_SYNC_BACKOFF = 60
+STRAVA_BACKFILL_DAYS = 365
+STRAVA_BACKFILL_PER_PAGE = 100
+STRAVA_BACKFILL_PAGES_PER_RUN = 5
+# seconds after which running task of crashed worker is claimed again
+STRAVA_TASK_LEASE = 600
+# tokens expiring within horizon seconds are refreshed by run_strava_sync
+STRAVA_TOKEN_REFRESH_HORIZON = 1800
+STRAVA_TOKEN_REFRESH_INTERVAL = 300
+STRAVA_TOKEN_REFRESH_BATCH = 100
+STRAVA_TOKEN_REFRESH_MAX_FAILURES = 5
+STRAVA_WEBHOOK_VERIFY_TOKEN = os.environ.get('STRAVA_WEBHOOK_VERIFY_TOKEN')
+STRAVA_WEBHOOK_SUBSCRIPTION_ID = os.environ.get('STRAVA_WEBHOOK_SUBSCRIPTION_ID')
+# secret part of webhook callback url, strava does not sign events
+STRAVA_WEBHOOK_CALLBACK_TOKEN = os.environ.get('STRAVA_WEBHOOK_CALLBACK_TOKEN')
+NOZBE_API_URL = "https://api.nozbe.com:3000"
+NOZBE_MAX_WORKERS = 8
+NOZBE_REQUEST_TIMEOUT = 10
+NOZBE_MAX_RETRIES = 3
+NOZBE_RETRY_BACKOFF = 0.5
+NOZBE_MAX_ITEMS = 200
+# running export not finished within lease is claimed by another worker
+NOZBE_EXPORT_LEASE = 600
+# (requests, seconds) windows of strava application rate limits
+STRAVA_RATE_LIMITS = {
+    'app-15min': (100, 900),
+    'app-daily': (1000, 86400),
+}
+STRAVA_USER_RATE_LIMIT = (30, 900)
+# part of limit which may be sent at once, the rest is refilled over window
+STRAVA_BUDGET_BURST = 0.5
+# part of every bucket which only interactive requests can use
+STRAVA_BUDGET_INTERACTIVE_RESERVE = 0.2
+# range of health statistic series when no dates given and points limit
+HEALTH_SERIES_DEFAULT_DAYS = 365
+HEALTH_SERIES_MAX_POINTS = 1000
+# weight of newest weight in exponentially smoothed weight trend
+HEALTH_WEIGHT_TREND_SMOOTHING = 0.1
+# longest edge of processed recipe photos and of their thumbnails in pixels
+RECIPE_PHOTO_MAX_SIZE = 1600
+RECIPE_PHOTO_THUMBNAILS = {'medium': 640, 'small': 240}
+RECIPE_PHOTO_QUALITY = 80
+RECIPE_PHOTO_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+RECIPE_PHOTO_LEASE = 300
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.1/howto/deployment/checklist/
@@ -47,7 +96,6 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
@@ -56,13 +104,15 @@ INSTALLED_APPS = [
     'users',
     'recipe.apps.RecipeConfig',
     'meals_tracker.apps.MealsTrackerConfig',
-    'health'
+    'health',
+    'benchmarks',
 ]
 
 MIDDLEWARE = [
+    'mysite.metrics.MetricsMiddleware',
+    'mysite.nplusone.NPlusOneMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -98,9 +148,25 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
+# debug toolbar slows down every request, it is enabled only on demand
+DEBUG_TOOLBAR = DEBUG and os.environ.get('DEBUG_TOOLBAR') == '1'
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(MIDDLEWARE.index('corsheaders.middleware.CorsMiddleware'),
+                      'debug_toolbar.middleware.DebugToolbarMiddleware')
 DEBUG_TOOLBAR_CONFIG = {
     "SHOW_TOOLBAR_CALLBACK": lambda request: True,
 }
+# part of requests which are timed and have their queries counted
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0.1))
+# when set, metrics endpoint requires 'Authorization: Bearer <token>' header
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# statements of the same shape repeated threshold times in request or
+# service call are reported as N+1 queries, strict mode inspects every
+# request and raises, set NPLUSONE_STRICT=1 when running tests
+NPLUSONE_THRESHOLD = int(os.environ.get('NPLUSONE_THRESHOLD', 5))
+NPLUSONE_SAMPLE_RATE = float(os.environ.get('NPLUSONE_SAMPLE_RATE', 0.01))
+NPLUSONE_STRICT = os.environ.get('NPLUSONE_STRICT') == '1'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 DB_NAME = os.environ['DB_NAME']
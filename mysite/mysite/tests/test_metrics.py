@@ -0,0 +1,100 @@
+import datetime
+from unittest.mock import patch, Mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from mysite import metrics
+
+METRICS_URL = reverse('metrics')
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        metrics.clear_metrics()
+        self.user = get_user_model().objects.create_user(
+            email='auth@gmail.com',
+            name='auth',
+            password='authpass',
+            gender='M',
+            age=25,
+            height=188,
+            weight=73,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @patch('mysite.settings.METRICS_TOKEN', 'secret')
+    def _get_metrics(self):
+        return self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret')
+
+    def test_rendering_histogram_in_prometheus_format(self) -> None:
+        histogram = metrics.Histogram('test_seconds', 'Test', ('view', ), (0.1, 1))
+        histogram.observe(0.05, 'A"pi')
+        histogram.observe(0.5, 'A"pi')
+        histogram.observe(5, 'A"pi')
+
+        self.assertEqual([(suffix, labels[-1], value) for suffix, labels, value
+                          in histogram.samples()], [
+            ('_bucket', ('le', '0.1'), 1),
+            ('_bucket', ('le', '1'), 2),
+            ('_bucket', ('le', '+Inf'), 3),
+            ('_sum', ('view', 'A"pi'), 5.55),
+            ('_count', ('view', 'A"pi'), 3),
+        ])
+        self.assertEqual(metrics._escape('A"pi'), r'A\"pi')
+
+    @patch('mysite.settings.METRICS_SAMPLE_RATE', 1)
+    def test_sampled_request_records_latency_queries_and_size(self) -> None:
+        self.client.get(reverse('recipe:recipe-list'))
+
+        res = self._get_metrics()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain; version=0.0.4'))
+        content = res.content.decode()
+        self.assertIn('http_requests_total{view="RecipesApi",method="GET",status="200"} 1',
+                      content)
+        self.assertIn('http_request_duration_seconds_count{view="RecipesApi",method="GET"} 1',
+                      content)
+        self.assertIn('db_queries_per_request_count{view="RecipesApi"} 1', content)
+        self.assertIn('http_response_render_duration_seconds_count{view="RecipesApi"} 1',
+                      content)
+        self.assertIn('http_response_size_bytes_count{view="RecipesApi"} 1', content)
+
+    @patch('mysite.settings.METRICS_SAMPLE_RATE', 0)
+    def test_not_sampled_request_is_only_counted(self) -> None:
+        self.client.get(reverse('recipe:recipe-list'))
+        self.client.get('/not-existing-url')
+
+        content = self._get_metrics().content.decode()
+
+        self.assertIn('http_requests_total{view="RecipesApi",method="GET",status="200"} 1',
+                      content)
+        self.assertIn('http_requests_total{view="unresolved",method="GET",status="404"} 1',
+                      content)
+        self.assertNotIn('http_request_duration_seconds_count', content)
+
+    @patch('mysite.settings.METRICS_TOKEN', 'secret')
+    def test_metrics_endpoint_requires_token(self) -> None:
+        res = self.client.get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @patch('mysite.settings.METRICS_TOKEN', None)
+    def test_metrics_endpoint_is_denied_when_token_not_configured(self) -> None:
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer None')
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_outbound_response_hook_records_service_latency(self) -> None:
+        hook = metrics.outbound_response_hook('strava')
+        hook(Mock(elapsed=datetime.timedelta(milliseconds=300), status_code=429))
+
+        self.assertIn('outbound_request_duration_seconds_bucket{service="strava",'
+                      'status="429",le="0.5"} 1', metrics.render_metrics())
@@ -0,0 +1,108 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from mysite import metrics, nplusone
+from mysite.nplusone import (
+    NPlusOneError,
+    allow_repeated_queries,
+    detect_n_plus_one,
+    fingerprint,
+    inspect_queries,
+)
+
+
+def get_users_one_by_one(ids: list[int]) -> list:
+    users = []
+    for id in ids:
+        users.append(get_user_model().objects.get(id=id))
+    return users
+
+
+class NPlusOneTests(TestCase):
+
+    def setUp(self):
+        metrics.clear_metrics()
+        self.users = [get_user_model().objects.create_user(
+            email=f'user{index}@gmail.com',
+            name=f'user{index}',
+            password='authpass',
+            gender='M',
+            age=25,
+            height=188,
+            weight=73,
+        ) for index in range(5)]
+        self.ids = [user.id for user in self.users]
+
+    def test_fingerprint_ignores_values_of_literals_and_parameters(self) -> None:
+        self.assertEqual(
+            fingerprint("SELECT * FROM a  WHERE id = 12 AND name = 'it''s'"),
+            'SELECT * FROM a WHERE id = ? AND name = ?')
+        self.assertEqual(
+            fingerprint('SELECT * FROM a WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT * FROM a WHERE id IN (%s)'))
+
+    def test_raising_at_call_site_in_strict_mode(self) -> None:
+        with self.assertRaises(NPlusOneError) as error:
+            with inspect_queries('test', threshold=3, strict=True):
+                get_users_one_by_one(self.ids)
+
+        self.assertIn('3 queries', str(error.exception))
+        self.assertIn('in get_users_one_by_one', str(error.exception))
+
+    def test_logging_detection_without_strict_mode(self) -> None:
+        with self.assertLogs('mysite.nplusone', 'WARNING') as logs:
+            with inspect_queries('test', threshold=3, strict=False):
+                get_users_one_by_one(self.ids)
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('N+1 queries in test: 5 times', logs.output[0])
+        self.assertIn('n_plus_one_detected_total{source="test"} 1', metrics.render_metrics())
+
+    def test_not_detecting_queries_below_threshold_or_allowed(self) -> None:
+        with inspect_queries('test', threshold=6, strict=True) as inspector:
+            get_users_one_by_one(self.ids)
+        self.assertEqual(inspector.detected, {})
+
+        with inspect_queries('test', threshold=3, strict=True) as inspector:
+            with allow_repeated_queries():
+                get_users_one_by_one(self.ids)
+            list(get_user_model().objects.filter(id__in=self.ids))
+        self.assertEqual(inspector.detected, {})
+
+    def test_inspecting_decorated_service_call(self) -> None:
+        service = detect_n_plus_one(get_users_one_by_one)
+
+        with patch('mysite.settings.NPLUSONE_STRICT', True), \
+                patch('mysite.settings.NPLUSONE_THRESHOLD', 3), \
+                self.assertRaises(NPlusOneError):
+            service(self.ids)
+
+        with patch('mysite.settings.NPLUSONE_STRICT', False), \
+                patch('mysite.settings.NPLUSONE_SAMPLE_RATE', 0), \
+                patch('mysite.settings.NPLUSONE_THRESHOLD', 3):
+            self.assertEqual(len(service(self.ids)), 5)
+
+    def test_inspecting_request_named_after_view(self) -> None:
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+
+        with patch('mysite.settings.NPLUSONE_STRICT', False), \
+                patch('mysite.settings.NPLUSONE_SAMPLE_RATE', 1), \
+                patch('mysite.settings.NPLUSONE_THRESHOLD', 1), \
+                self.assertLogs('mysite.nplusone', 'WARNING') as logs:
+            client.get(reverse('meals_tracker:meal-list'))
+
+        self.assertTrue(logs.output)
+        self.assertTrue(all('N+1 queries in MealsApi:' in line for line in logs.output))
+
+    def test_naming_unresolved_request_with_fixed_label(self) -> None:
+        with patch('mysite.settings.NPLUSONE_SAMPLE_RATE', 1), \
+                patch('mysite.nplusone.inspect_queries',
+                      wraps=nplusone.inspect_queries) as inspect:
+            APIClient().get('/no-such-page/1/')
+
+        inspect.assert_called_once_with('unresolved')
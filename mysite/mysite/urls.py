@@ -17,7 +17,6 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
-import debug_toolbar
 
 from mysite import views
 
@@ -32,7 +31,12 @@ urlpatterns = [
     path('meals-tracker/', include('meals_tracker.urls')),
     path('food/', include('recipe.urls')),
     path('strava-auth/', views.StravaCodeApiView.as_view(), name='strava-auth'),
+    path('strava-webhook/<token>/', views.StravaWebhookApi.as_view(), name='strava-webhook'),
     path('strava-connection-status/',
          views.StravaCheckStatusApi.as_view(), name='strava-status'),
-    path('__debug__/', include(debug_toolbar.urls)),
+    path('metrics', views.metrics, name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+if settings.DEBUG_TOOLBAR:
+    import debug_toolbar
+    urlpatterns.append(path('__debug__/', include(debug_toolbar.urls)))
@@ -1,15 +1,20 @@
+import hmac
 import time
 
+from django.http import HttpResponse, HttpResponseForbidden
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework import generics
 from rest_framework import status
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.renderers import JSONRenderer
 from rest_framework.views import APIView
+from rest_framework.exceptions import PermissionDenied
 
 from mysite.renderers import CustomRenderer
+from mysite import settings, metrics as request_metrics
 from mysite.exceptions import ApiErrorsMixin
 from users import selectors as users_selectors
 from users import services as users_services
@@ -25,6 +30,16 @@ def api_root(request, format=None):
     })
 
 
+def metrics(request):
+    """ expose request metrics of this process in prometheus text format,
+    access is denied until METRICS_TOKEN is configured """
+    if not settings.METRICS_TOKEN or not hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'):
+        return HttpResponseForbidden()
+    return HttpResponse(request_metrics.render_metrics(),
+                        content_type=request_metrics.PROMETHEUS_CONTENT_TYPE)
+
+
 def get_serializer_required_fields(serializer):
     """ return fields names which are required """
     writable_fields = []
@@ -106,6 +121,36 @@ class StravaCodeApiView(BaseAuthPermClass):
         return Response(data=response_message, status=response_status)
 
 
+class StravaWebhookApi(ApiErrorsMixin, APIView):
+    """ receive strava webhook events, they are only queued here and
+    processed by run_strava_sync worker. Strava does not sign events, so
+    callback url contains secret STRAVA_WEBHOOK_CALLBACK_TOKEN and webhook
+    is disabled until it and STRAVA_WEBHOOK_SUBSCRIPTION_ID are set """
+    authentication_classes = ()
+    permission_classes = (AllowAny, )
+    renderer_classes = (JSONRenderer, )
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        callback_token = settings.STRAVA_WEBHOOK_CALLBACK_TOKEN
+        if not callback_token or not settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID or \
+                not hmac.compare_digest(kwargs.get('token', ''), callback_token):
+            raise PermissionDenied()
+
+    def get(self, request, *args, **kwargs):
+        """ verify subscription by echoing challenge """
+        verify_token = settings.STRAVA_WEBHOOK_VERIFY_TOKEN
+        if (request.query_params.get('hub.mode') == 'subscribe' and verify_token
+                and request.query_params.get('hub.verify_token') == verify_token):
+            return Response(data={'hub.challenge': request.query_params.get('hub.challenge')},
+                            status=status.HTTP_200_OK)
+        return Response(status=status.HTTP_403_FORBIDDEN)
+
+    def post(self, request, *args, **kwargs):
+        users_services.handle_strava_webhook_event(request.data)
+        return Response(status=status.HTTP_200_OK)
+
+
 class StravaCheckStatusApi(BaseAuthPermClass):
 
     def get(self, request, *args, **kwrags):
@@ -115,10 +160,13 @@ class StravaCheckStatusApi(BaseAuthPermClass):
         is_token_valid = users_selectors.is_token_valid(request.user.strava)
         can_request_be_send = users_selectors.can_request_be_send(
             request.user.strava)
+        remaining_budget = users_selectors.get_strava_remaining_budget(
+            request.user)
 
         return Response(data={
             'has_needed_information': has_needed_information,
             'is_auth_to_strava': is_auth_to_strava,
             'is_token_valid': is_token_valid,
             'can_request_be_send': can_request_be_send,
+            'remaining_budget': remaining_budget,
         }, status=status.HTTP_200_OK)
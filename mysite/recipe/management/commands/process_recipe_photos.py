@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipe.services import run_recipe_photos_processing, schedule_recipe_photos_processing
+
+
+class Command(BaseCommand):
+    """ worker processing uploaded recipe photos """
+
+    help = 'Downscale uploaded recipe photos and generate their thumbnails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--sleep', type=float, default=5,
+                            help='seconds to wait when there are no pending photos')
+        parser.add_argument('--once', action='store_true',
+                            help='process pending photos and exit')
+        parser.add_argument('--schedule-existing', action='store_true',
+                            help='process also photos uploaded before they were processed')
+
+    def handle(self, *args, **options):
+        if options['schedule_existing']:
+            scheduled = schedule_recipe_photos_processing()
+            self.stdout.write(f'Scheduled {scheduled} recipe photos')
+        while True:
+            processed = run_recipe_photos_processing(limit=options['batch_size'])
+            if processed:
+                self.stdout.write(f'Processed {processed} recipe photos')
+            if options['once']:
+                return
+            if processed < options['batch_size']:
+                time.sleep(options['sleep'])
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipe.models import Ingredient
+from recipe.services import IndexIngredient
+
+
+class Command(BaseCommand):
+    """ index search terms of all ingredients, processing them in chunks
+    ordered by id """
+
+    help = 'Rebuild ingredient search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        indexed = 0
+        last_id = 0
+        while True:
+            chunk = list(Ingredient.objects.filter(id__gt=last_id)
+                         .order_by('id').prefetch_related('search_terms')[:chunk_size])
+            if not chunk:
+                break
+            with transaction.atomic():
+                for ingredient in chunk:
+                    IndexIngredient().index(ingredient)
+            indexed += len(chunk)
+            last_id = chunk[-1].id
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} ingredients'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipe.services import run_nozbe_exports
+
+
+class Command(BaseCommand):
+    """ worker sending ingredients of background nozbe exports """
+
+    help = 'Process pending Nozbe exports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--sleep', type=float, default=5,
+                            help='seconds to wait when there are no pending exports')
+        parser.add_argument('--once', action='store_true',
+                            help='process pending exports and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = run_nozbe_exports(limit=options['batch_size'])
+            if processed:
+                self.stdout.write(f'Processed {processed} nozbe exports')
+            if options['once']:
+                return
+            if processed < options['batch_size']:
+                time.sleep(options['sleep'])
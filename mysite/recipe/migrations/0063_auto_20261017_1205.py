@@ -0,0 +1,27 @@
+# Generated by Django 3.1.7 on 2026-10-17 12:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0062_auto_20211128_1401'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientSearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('N', 'name'), ('T', 'token'), ('G', 'trigram')], max_length=1)),
+                ('term', models.CharField(max_length=100)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='recipe.ingredient')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ingredientsearchterm',
+            index=models.Index(fields=['kind', 'term'], name='recipe_ingr_kind_7c9d9c_idx'),
+        ),
+    ]
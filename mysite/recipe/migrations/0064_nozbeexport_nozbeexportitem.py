@@ -0,0 +1,37 @@
+# Generated by Django 3.1.7 on 2026-10-17 12:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipe', '0063_auto_20261017_1205'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NozbeExport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('P', 'pending'), ('R', 'running'), ('D', 'done'), ('F', 'failed')], default='P', max_length=1)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nozbe_exports', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NozbeExportItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('P', 'pending'), ('R', 'running'), ('D', 'done'), ('F', 'failed')], default='P', max_length=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('export', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='recipe.nozbeexport')),
+                ('ingredient', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='recipe.ingredient')),
+            ],
+        ),
+    ]
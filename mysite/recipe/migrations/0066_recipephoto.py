@@ -0,0 +1,30 @@
+# Generated by Django 3.1.7 on 2026-10-17 12:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0065_auto_20261017_1228'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipePhoto',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('photo1', 'photo1'), ('photo2', 'photo2'), ('photo3', 'photo3')], max_length=6)),
+                ('name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('P', 'pending'), ('R', 'running'), ('D', 'done'), ('F', 'failed')], default='P', max_length=1)),
+                ('error', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='photos', to='recipe.recipe')),
+            ],
+            options={
+                'ordering': ('field',),
+                'unique_together': {('recipe', 'field')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-17 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0066_recipephoto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipephoto',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
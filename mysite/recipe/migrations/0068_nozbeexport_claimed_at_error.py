@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-17 13:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0067_recipephoto_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nozbeexport',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='nozbeexport',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+    ]
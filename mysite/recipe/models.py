@@ -30,6 +30,7 @@ class Dish(models.Model):
     fats = models.FloatField(blank=True, null=True,
                              default=0, validators=[MinValue(0)])
     tags = models.ManyToManyField('Tag')
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         abstract = True
@@ -133,6 +134,31 @@ class Ingredient(Dish):
         ]
 
 
+class IngredientSearchTerm(models.Model):
+    """ normalized terms of ingredient name used for searching ingredients """
+
+    NAME = 'N'
+    TOKEN = 'T'
+    TRIGRAM = 'G'
+    KIND_CHOICE = [
+        (NAME, 'name'),
+        (TOKEN, 'token'),
+        (TRIGRAM, 'trigram')
+    ]
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   related_name='search_terms')
+    kind = models.CharField(max_length=1, choices=KIND_CHOICE)
+    term = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'term'])
+        ]
+
+    def __str__(self):
+        return self.term
+
+
 class ReadyMeals(Ingredient):
     """ proxy model for ready meals """
 
@@ -190,3 +216,91 @@ class Ingredient_Unit(models.Model):
     def __str__(self):
         return self.ingredient.name + ' ' + self.unit.name + \
             '(' + str(self.grams_in_one_unit) + ')'
+
+
+class NozbeExport(models.Model):
+    """ export of ingredients to nozbe tasks, processed in request or in
+    background by run_nozbe_exports command """
+
+    PENDING = 'P'
+    RUNNING = 'R'
+    DONE = 'D'
+    FAILED = 'F'
+    STATUS_CHOICE = [
+        (PENDING, 'pending'),
+        (RUNNING, 'running'),
+        (DONE, 'done'),
+        (FAILED, 'failed')
+    ]
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                             null=False, related_name='nozbe_exports')
+    status = models.CharField(max_length=1, choices=STATUS_CHOICE,
+                              default=PENDING)
+    created = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f'{self.user} {self.get_status_display()}'
+
+
+class NozbeExportItem(models.Model):
+    """ single ingredient of nozbe export, item which is done is never sent
+    again """
+
+    export = models.ForeignKey(NozbeExport, on_delete=models.CASCADE,
+                               related_name='items')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.SET_NULL,
+                                   null=True)
+    name = models.CharField(max_length=255)
+    status = models.CharField(max_length=1, choices=NozbeExport.STATUS_CHOICE,
+                              default=NozbeExport.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f'{self.name} {self.get_status_display()}'
+
+
+class RecipePhoto(models.Model):
+    """ processing of photo uploaded to recipe, done in background by
+    process_recipe_photos command. Processed photo replaces uploaded one
+    and has jpeg and webp renditions in every size """
+
+    PENDING = 'P'
+    RUNNING = 'R'
+    DONE = 'D'
+    FAILED = 'F'
+    STATUS_CHOICE = [
+        (PENDING, 'pending'),
+        (RUNNING, 'running'),
+        (DONE, 'done'),
+        (FAILED, 'failed')
+    ]
+    FIELDS = ('photo1', 'photo2', 'photo3')
+    FORMATS = {'jpeg': 'jpg', 'webp': 'webp'}
+    # size of processed photo, other sizes are RECIPE_PHOTO_THUMBNAILS
+    LARGE = 'large'
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='photos')
+    field = models.CharField(max_length=6, choices=[(field, field) for field in FIELDS])
+    name = models.CharField(max_length=255)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICE,
+                              default=PENDING)
+    error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('recipe', 'field')
+        ordering = ('field', )
+
+    def __str__(self):
+        return f'{self.name} {self.get_status_display()}'
+
+    def get_rendition_name(self, size: str, format: str) -> str:
+        """ return file name of rendition of processed photo """
+        base = os.path.splitext(self.name)[0]
+        suffix = '' if size == self.LARGE else f'_{size}'
+        return f'{base}{suffix}.{self.FORMATS[format]}'
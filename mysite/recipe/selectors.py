@@ -1,17 +1,44 @@
+import math
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterable
 
 from django.contrib.auth import get_user_model
 from django.http.request import QueryDict
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
+from django.db.models import (
+    OuterRef, Subquery, Sum, F, Case, When, FloatField, Count, Q, ExpressionWrapper
+)
+from django.db.models.functions import Coalesce, Length, Round
 from django.db.models.query import QuerySet
 import requests
-
-from recipe.models import Recipe, Ingredient, Unit, Ingredient_Unit, Tag, Recipe_Ingredient
-from users.models import Group
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from unidecode import unidecode
+
+from recipe.models import (
+    Recipe,
+    Ingredient,
+    IngredientSearchTerm,
+    NozbeExport,
+    Unit,
+    Ingredient_Unit,
+    Tag,
+    Recipe_Ingredient,
+)
+from mysite import settings
+from mysite.metrics import outbound_response_hook
 from users import selectors as users_selectors
 
 
+NUTRIENTS = ('calories', 'proteins', 'carbohydrates', 'fats', 'fiber',
+             'sodium', 'potassium', 'calcium', 'iron', 'magnesium',
+             'selenium', 'zinc')
+RECIPE_NUTRIENTS = ('calories', 'proteins', 'carbohydrates', 'fats')
+
+
 def recipe_get(user: get_user_model, slug: str) -> Recipe:
     """ return recipe object """
     try:
@@ -23,6 +50,15 @@ def recipe_get(user: get_user_model, slug: str) -> Recipe:
             f'Recipe with provided slug {slug} does not exists!')
 
 
+def recipe_get_version(user: get_user_model, slug: str) -> dict:
+    """ return id and updated_at of recipe without loading whole object """
+    try:
+        return Recipe.objects.values('id', 'updated_at').get(user=user, slug=slug)
+    except ObjectDoesNotExist:
+        raise ObjectDoesNotExist(
+            f'Recipe with provided slug {slug} does not exists!')
+
+
 def recipe_get_tags(user: get_user_model, recipe: Recipe) -> Iterable[Tag]:
     """ return all tags for given recipe """
     return Tag.objects.filter(user=user, recipe=recipe)
@@ -33,6 +69,37 @@ def recipe_get_ingredients(recipe: Recipe) -> Iterable[Ingredient]:
     return Recipe_Ingredient.objects.filter(recipe=recipe).prefetch_related('ingredient', 'unit', 'recipe')
 
 
+def recipe_get_ingredients_with_grams(recipe: Recipe, ingredient_ids: list[int] = None) -> QuerySet:
+    """ return recipe ingredients with unit mapping resolved in single query """
+    queryset = Recipe_Ingredient.objects.filter(recipe=recipe)
+    if ingredient_ids is not None:
+        queryset = queryset.filter(ingredient_id__in=ingredient_ids)
+    return ingredient_annotate_grams_in_one_unit(queryset)
+
+
+def recipe_get_ingredient_nutrient_change(ingredient_id: int, old: float, new: float) -> Subquery:
+    """ return subquery with change of nutrient of recipe referenced by outer
+    query, when given ingredient nutrient per 100 grams changes from old to
+    new value. Nutrient of every item is rounded to 2 places like in
+    ingredient_calculate_item_nutrients, items with unit no longer mapped
+    are not changed """
+    mapping = Ingredient_Unit.objects.filter(
+        ingredient_id=OuterRef('ingredient_id'),
+        unit_id=OuterRef('unit_id')
+    ).values('grams_in_one_unit')[:1]
+    rows = Recipe_Ingredient.objects.filter(
+        recipe_id=OuterRef('pk'), ingredient_id=ingredient_id
+    ).annotate(grams=Coalesce(Case(
+        When(unit__name='gram', then=F('amount')),
+        default=F('amount') * Subquery(mapping),
+        output_field=FloatField()
+    ), 0.0)).annotate(change=ExpressionWrapper(
+        (Round(F('grams') * (new or 0)) - Round(F('grams') * (old or 0))) / 100.0,
+        output_field=FloatField()
+    )).values('recipe_id').annotate(total=Sum('change')).values('total')
+    return Subquery(rows, output_field=FloatField())
+
+
 def recipe_get_ingredient_details(recipe: Recipe, ingredient_id: str) -> Recipe_Ingredient:
     """ return specific recipe ingredient intermediate table object """
     try:
@@ -43,18 +110,17 @@ def recipe_get_ingredient_details(recipe: Recipe, ingredient_id: str) -> Recipe_
 
 def recipe_list(user: get_user_model, filters: QueryDict = None) -> list[Recipe]:
     """ retrieve list of recipes """
-    user_groups = users_selectors.group_get_membership(user)
-    list_of_users_ids = users_selectors.group_retrieve_founders(user_groups)
+    visible_owners = users_selectors.group_get_visible_recipe_owners(user)
     # default_queryset = Recipe.objects.filter(
     #     user__id__in=list_of_users_ids).prefetch_related('tags', 'ingredients')
     default_queryset = Recipe.objects.filter(
-        user__id__in=list_of_users_ids).prefetch_related('user')
+        user__id__in=set(visible_owners.values())).prefetch_related('user', 'photos')
     if filters:
-        return _filter_queryset(user, filters, default_queryset, user_groups)
+        return _filter_queryset(user, filters, default_queryset, visible_owners.keys())
     return default_queryset
 
 
-def _filter_queryset(user: get_user_model, filters: QueryDict, default_queryset: QuerySet, user_groups: list[Group]) -> list[Recipe]:
+def _filter_queryset(user: get_user_model, filters: QueryDict, default_queryset: QuerySet, user_groups: Iterable[int]) -> list[Recipe]:
     """ apply filters on queryset and return it """
     queryset = default_queryset
     allowed_filters = ['groups', 'tags']
@@ -69,10 +135,9 @@ def _filter_queryset(user: get_user_model, filters: QueryDict, default_queryset:
     return queryset
 
 
-def _filter_queryset_by_groups(list_of_values: list, queryset: QuerySet, user_groups: list[Group]) -> QuerySet:
+def _filter_queryset_by_groups(list_of_values: list, queryset: QuerySet, group_ids: Iterable[int]) -> QuerySet:
     """ filter queryset by groups """
     list_of_values = list(map(int, list_of_values))
-    group_ids = user_groups.values_list('id', flat=True)
     if not all(list_of_values[id] in group_ids for id in range(len(list_of_values))):
         raise ValidationError('Invalid group id/ids')
     return queryset.filter(user__own_group__id__in=list_of_values)
@@ -90,14 +155,12 @@ def recipe_check_if_user_can_retrieve(requested_user: get_user_model,
         recipe_creator_id = int(recipe_creator_id)
     except ValueError:
         raise ObjectDoesNotExist()
-    recipe_creator_group = users_selectors.group_get_by_user_id(
-        recipe_creator_id)
-    try:
-        if requested_user not in recipe_creator_group.members.all():
-            raise ValidationError('You are not a member of given user group!')
-    except AttributeError as e:
-        print(f'{e} func: recipe_check_if_user_can_retrieve')
-        raise ValidationError('Internal error, contanct administrator')
+    visible_owners = users_selectors.group_get_visible_recipe_owners(
+        requested_user)
+    if recipe_creator_id in visible_owners.values():
+        return
+    users_selectors.group_get_by_user_id(recipe_creator_id)
+    raise ValidationError('You are not a member of given user group!')
 
 
 def recipe_calculate_calories_based_on_portion(portion: int, recipe: Recipe) -> int:
@@ -133,6 +196,68 @@ def ingredient_list() -> Iterable[Ingredient]:
     return Ingredient.objects.all()
 
 
+def ingredient_normalize_search_text(text: str) -> list[str]:
+    """ return lowercase ascii tokens of text """
+    return re.findall(r'[a-z0-9]+', unidecode(text).lower())
+
+
+def ingredient_get_trigrams(tokens: Iterable[str]) -> set[str]:
+    """ return trigrams of tokens, padded the same way as postgres pg_trgm """
+    trigrams = set()
+    for token in tokens:
+        padded = f'  {token} '
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def ingredient_get_search_terms(ingredient: Ingredient) -> set[tuple[str, str]]:
+    """ return (kind, term) pairs indexed for ingredient name and slug,
+    slug suffix with user id is skipped """
+    max_length = IngredientSearchTerm._meta.get_field('term').max_length
+    slug = re.sub(r'-user-\d+$', '', ingredient.slug or '')
+    tokens = ingredient_normalize_search_text(ingredient.name) \
+        + ingredient_normalize_search_text(slug)
+    terms = {(IngredientSearchTerm.NAME,
+              ' '.join(ingredient_normalize_search_text(ingredient.name))[:max_length])}
+    terms.update((IngredientSearchTerm.TOKEN, token[:max_length]) for token in tokens)
+    terms.update((IngredientSearchTerm.TRIGRAM, trigram)
+                 for trigram in ingredient_get_trigrams(tokens))
+    return terms
+
+
+def ingredient_search(query: str, limit: int = 10, similarity: float = 0.4) -> list[Ingredient]:
+    """ return ingredients best matching query. Ingredients whose name starts
+    with query rank first, then ones having tokens starting with query tokens,
+    then ones sharing at least `similarity` part of query trigrams """
+    tokens = ingredient_normalize_search_text(query)
+    if not tokens:
+        raise ValidationError('Search query must contain letters or digits')
+    trigrams = ingredient_get_trigrams(tokens)
+    token_condition = Q()
+    for token in tokens:
+        token_condition |= Q(term__startswith=token)
+    matches = IngredientSearchTerm.objects.filter(
+        Q(kind=IngredientSearchTerm.NAME, term__startswith=' '.join(tokens))
+        | Q(token_condition, kind=IngredientSearchTerm.TOKEN)
+        | Q(kind=IngredientSearchTerm.TRIGRAM, term__in=trigrams)
+    ).values('ingredient').annotate(
+        name_matches=Count('id', filter=Q(kind=IngredientSearchTerm.NAME)),
+        token_matches=Count('id', filter=Q(kind=IngredientSearchTerm.TOKEN)),
+        trigram_matches=Count('id', filter=Q(kind=IngredientSearchTerm.TRIGRAM)),
+    ).filter(
+        Q(name_matches__gt=0) | Q(token_matches__gt=0)
+        | Q(trigram_matches__gte=math.ceil(similarity * len(trigrams)))
+    ).annotate(
+        score=ExpressionWrapper(
+            F('name_matches') * 4 + F('token_matches') * 2
+            + F('trigram_matches') * 1.0 / len(trigrams),
+            output_field=FloatField())
+    ).order_by('-score', Length('ingredient__name'), 'ingredient')[:limit]
+    ids = [match['ingredient'] for match in matches]
+    ingredients = Ingredient.objects.in_bulk(ids)
+    return [ingredients[id] for id in ids]
+
+
 def ingredient_get(slug: str) -> Ingredient:
     """ return ingredient """
     try:
@@ -142,6 +267,15 @@ def ingredient_get(slug: str) -> Ingredient:
             f"Ingredient with slug {slug} does not exists!")
 
 
+def ingredient_get_version(slug: str) -> dict:
+    """ return id and updated_at of ingredient without loading whole object """
+    try:
+        return Ingredient.objects.values('id', 'updated_at').get(slug=slug)
+    except Ingredient.DoesNotExist:
+        raise ObjectDoesNotExist(
+            f"Ingredient with slug {slug} does not exists!")
+
+
 def ingredient_get_tags(ingredient: Ingredient) -> Iterable[Tag]:
     """ retrieve all tags for given ingredient """
     return ingredient.tags.all()
@@ -158,6 +292,31 @@ def ingredient_is_mapped_with_unit(unit_id: int, ingredient_id: int) -> bool:
         ingredient__id=ingredient_id, unit__id=unit_id).exists()
 
 
+def ingredient_get_unit_mappings(pairs: Iterable[tuple[int, int]]) -> dict[tuple[int, int], int]:
+    """ return grams in one unit for every given (ingredient id, unit id)
+    pair which is mapped. All pairs are resolved in single query """
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+    mappings = Ingredient_Unit.objects.filter(
+        ingredient_id__in={ingredient_id for ingredient_id, _ in pairs},
+        unit_id__in={unit_id for _, unit_id in pairs}
+    ).values_list('ingredient_id', 'unit_id', 'grams_in_one_unit')
+    return {(ingredient_id, unit_id): grams for ingredient_id, unit_id, grams
+            in mappings if (ingredient_id, unit_id) in pairs}
+
+
+def ingredient_annotate_grams_in_one_unit(queryset: QuerySet) -> QuerySet:
+    """ annotate rows having ingredient, unit and amount (e.g. Recipe_Ingredient)
+    with grams_in_one_unit, so no further query is needed for calculations """
+    mapping = Ingredient_Unit.objects.filter(
+        ingredient_id=OuterRef('ingredient_id'),
+        unit_id=OuterRef('unit_id')
+    ).values('grams_in_one_unit')[:1]
+    return queryset.select_related('ingredient', 'unit').annotate(
+        grams_in_one_unit=Subquery(mapping))
+
+
 def ingredient_get_only_for_user(user: get_user_model, slug: str) -> Ingredient:
     """ return ingredient only for requested user """
     try:
@@ -196,23 +355,35 @@ def ingredient_calculate_calories(ingredient: Ingredient, unit: Unit, amount: in
     return round((ingredient_convert_unit_to_grams(ingredient, unit, amount)/100) * ingredient.calories, 2)
 
 
-def ingredient_send_to_nozbe(slug_list: list) -> bool:
-    """ send chosen ingredients to nozbe """
+def ingredient_calculate_item_nutrients(item) -> dict[str, float]:
+    """ return nutrients for single row annotated with grams_in_one_unit """
+    if item.unit.name == 'gram':
+        grams = item.amount
+    elif item.grams_in_one_unit is None:
+        raise ValidationError(
+            f"{item.unit} - {item.ingredient.name} no such mapping")
+    else:
+        grams = item.grams_in_one_unit * item.amount
+    nutrients = {}
+    for nutrient in NUTRIENTS:
+        value = getattr(item.ingredient, nutrient)
+        nutrients[nutrient] = 0 if value is None else round(
+            (grams/100) * value, 2)
+    return nutrients
 
-    if is_slug_list_too_long(slug_list):
-        return False
-    ingredients = ingredient_get_multi_by_slugs(slug_list)
-    secret, client_id, project_id = get_nozbe_request_information()
-    for ingredient in ingredients:
-        res = send_request_to_nozbe(ingredient, secret, client_id, project_id)
-        if res.status_code != 200:
-            return False
-    return True
 
+def ingredient_calculate_nutrients(items: Iterable) -> dict[str, float]:
+    """ return sum of nutrients for rows annotated with grams_in_one_unit """
+    totals = dict.fromkeys(NUTRIENTS, 0)
+    for item in items:
+        for nutrient, value in ingredient_calculate_item_nutrients(item).items():
+            totals[nutrient] += value
+    return totals
 
-def is_slug_list_too_long(slug_list: list) -> bool:
-    """ check if list too long """
-    return len(slug_list) > 25
+
+# nozbe refused to handle request, other errors like 502 or 504 can come
+# back after task was created so request is not sent again
+NOZBE_RETRY_STATUS_CODES = (429, 503)
 
 
 def get_nozbe_request_information() -> tuple([str, str, str]):
@@ -225,14 +396,81 @@ def get_nozbe_request_information() -> tuple([str, str, str]):
             contanct admin")
 
 
-def send_request_to_nozbe(ingredient: Ingredient, secret: str, client_id: int,
-                          project_id: int) -> requests:
+_nozbe_session = None
+
+
+def get_nozbe_session() -> requests.Session:
+    """ return keep-alive session shared by all nozbe requests """
+    global _nozbe_session
+    if _nozbe_session is None:
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(
+            pool_connections=1, pool_maxsize=settings.NOZBE_MAX_WORKERS))
+        session.hooks['response'].append(outbound_response_hook('nozbe'))
+        _nozbe_session = session
+    return _nozbe_session
+
+
+def send_request_to_nozbe(name: str, secret: str, client_id: int,
+                          project_id: int) -> requests.Response:
     """ send request to nozbe API """
-    url = 'https://api.nozbe.com:3000/task'
-    res = requests.post(url, headers={'Authorization': secret},
-                        data={'name': ingredient.name, 'project_id':
-                              project_id, 'client_id': client_id})
-    return res
+    return get_nozbe_session().post(
+        f'{settings.NOZBE_API_URL}/task', headers={'Authorization': secret},
+        data={'name': name, 'project_id': project_id, 'client_id': client_id},
+        timeout=settings.NOZBE_REQUEST_TIMEOUT)
+
+
+def is_connection_not_established(error: requests.ConnectionError) -> bool:
+    """ return True when error was raised before request was sent: connecting
+    timed out or connection was refused """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
+def send_task_to_nozbe(name: str, credentials: tuple) -> tuple[int, str]:
+    """ create nozbe task, retrying with exponential backoff only when task
+    could not have been created: connection was not established or request
+    was throttled or refused as service unavailable. Return number of
+    attempts and error, which is empty on success """
+    error = ''
+    for attempt in range(1, settings.NOZBE_MAX_RETRIES + 2):
+        if attempt > 1:
+            time.sleep(settings.NOZBE_RETRY_BACKOFF * 2 ** (attempt - 2))
+        try:
+            res = send_request_to_nozbe(name, *credentials)
+        except requests.ConnectionError as e:
+            error = f'Connection failed: {e}'
+            if is_connection_not_established(e):
+                continue
+            return attempt, error
+        except requests.RequestException as e:
+            return attempt, f'Request failed: {e}'
+        if res.status_code == 200:
+            return attempt, ''
+        error = f'Nozbe responded with {res.status_code}'
+        if res.status_code not in NOZBE_RETRY_STATUS_CODES:
+            return attempt, error
+    return attempt, error
+
+
+def ingredient_send_to_nozbe(names: list[str], credentials: tuple) -> list[tuple[int, str]]:
+    """ send names as nozbe tasks over pooled session with bounded
+    concurrency, return (attempts, error) of every name in given order """
+    if not names:
+        return []
+    workers = min(settings.NOZBE_MAX_WORKERS, len(names))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda name: send_task_to_nozbe(name, credentials),
+                                 names))
+
+
+def nozbe_export_get(user: get_user_model, id: int) -> NozbeExport:
+    try:
+        return NozbeExport.objects.prefetch_related('items').get(user=user, id=id)
+    except (NozbeExport.DoesNotExist, ValueError):
+        raise ObjectDoesNotExist(f'No nozbe export with id {id}')
 
 
 def unit_get(id: int) -> Unit:
@@ -252,11 +490,8 @@ def unit_list() -> Iterable[Unit]:
 
 def unit_get_multi_by_ids(ids: list[int]) -> list[Unit]:
     """ return units by provided ids or raise object does not exists """
-    all_units = Unit.objects.all()
-    mapped_instances = []
+    units = Unit.objects.in_bulk(set(ids))
     for id in ids:
-        try:
-            mapped_instances.append(all_units.get(id=id))
-        except Unit.DoesNotExist:
+        if id not in units:
             raise ObjectDoesNotExist(f'Unit with id {id} does not exists!')
-    return mapped_instances
+    return [units[id] for id in ids]
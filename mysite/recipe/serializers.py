@@ -1,6 +1,39 @@
 from rest_framework import serializers
-from recipe.models import Ingredient, Tag, Recipe, Recipe_Ingredient, Unit
+from recipe.models import (
+    Ingredient, Tag, Recipe, Recipe_Ingredient, Unit, NozbeExport, NozbeExportItem,
+    RecipePhoto
+)
 from rest_framework.reverse import reverse
+from mysite import settings
+
+
+def get_photo_urls(photo: RecipePhoto, sizes: list[str], request=None) -> dict:
+    """ return urls of renditions of processed photo by size and format """
+    storage = Recipe._meta.get_field(photo.field).storage
+    urls = {}
+    for size in sizes:
+        urls[size] = {}
+        for format in RecipePhoto.FORMATS:
+            url = storage.url(photo.get_rendition_name(size, format))
+            urls[size][format] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+class RecipePhotoOutputSerializer(serializers.ModelSerializer):
+    """ serializing recipe photo, urls are given when photo is processed """
+
+    status = serializers.CharField(source='get_status_display')
+    urls = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RecipePhoto
+        fields = ('field', 'status', 'urls')
+
+    def get_urls(self, instance) -> dict:
+        if instance.status != RecipePhoto.DONE:
+            return {}
+        return get_photo_urls(instance, [RecipePhoto.LARGE, *settings.RECIPE_PHOTO_THUMBNAILS],
+                              self.context.get('request'))
 
 
 class RecipeInputSerializer(serializers.Serializer):
@@ -15,6 +48,7 @@ class RecipeListOutputSerializer(serializers.ModelSerializer):
     """ serializing list of recipe objects """
 
     links = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -24,20 +58,30 @@ class RecipeListOutputSerializer(serializers.ModelSerializer):
             'name',
             'slug',
             'calories',
+            'thumbnails',
             'links'
         )
 
+    def get_thumbnails(self, instance) -> dict:
+        """ return thumbnails urls of first processed photo, photos should be
+        prefetched """
+        for photo in instance.photos.all():
+            if photo.status == RecipePhoto.DONE:
+                return get_photo_urls(photo, list(settings.RECIPE_PHOTO_THUMBNAILS),
+                                      self.context['request'])
+        return None
+
     def get_links(self, instance) -> dict:
         """ prepare links to proper endpoints """
         links = []
-        if instance.user != self.context['request'].user:
+        if instance.user_id != self.context['request'].user.id:
             self_url = reverse('recipe:group-recipe-detail', kwargs={
-                'pk': instance.user.id,
+                'pk': instance.user_id,
                 'slug': instance.slug,
             }, request=self.context['request'])
             tags = reverse(
                 'recipe:group-recipe-tags',  kwargs={
-                    'pk': instance.user.id,
+                    'pk': instance.user_id,
                     'slug': instance.slug
                 },
                 request=self.context['request'])
@@ -74,11 +118,21 @@ class RecipeDetailOutputSerializer(serializers.ModelSerializer):
         view_name='recipe:recipe-tags', lookup_field='slug')
     ingredients = serializers.HyperlinkedIdentityField(
         view_name='recipe:recipe-ingredients', lookup_field='slug')
+    photos = RecipePhotoOutputSerializer(many=True, read_only=True)
 
     class Meta:
         model = Recipe
         fields = '__all__'
 
+    def to_representation(self, instance) -> dict:
+        """ hide uploaded photos which are not processed yet, they still have
+        their metadata """
+        ret = super().to_representation(instance)
+        for photo in ret['photos']:
+            if photo['status'] != 'done':
+                ret[photo['field']] = None
+        return ret
+
 
 class GroupRecipeDetailOutpuSerializer(RecipeDetailOutputSerializer):
 
@@ -104,6 +158,13 @@ class TagsIdsSerializer(serializers.Serializer):
     tag_ids = serializers.ListField(child=serializers.IntegerField())
 
 
+class RecipePhotosInputSerializer(serializers.Serializer):
+
+    photo1 = serializers.ImageField(required=False)
+    photo2 = serializers.ImageField(required=False)
+    photo3 = serializers.ImageField(required=False)
+
+
 class RecipeIngredientsHelperSerializer(serializers.Serializer):
     """ helper serializer for recipe ingredient """
     ingredient = serializers.IntegerField()
@@ -235,6 +296,13 @@ class IngredientInputSerializer(serializers.Serializer):
     zinc = serializers.FloatField(min_value=0, required=False)
 
 
+class IngredientSearchInputSerializer(serializers.Serializer):
+    """ serializing ingredient search query params """
+
+    q = serializers.CharField(max_length=100)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
 class IngredientUnitSerializer(serializers.Serializer):
     """ serializer for mapping unit to ingredients """
     unit = serializers.IntegerField()
@@ -247,3 +315,26 @@ class UnitOutputSerializer(serializers.ModelSerializer):
     class Meta:
         model = Unit
         fields = '__all__'
+
+
+class NozbeExportItemOutputSerializer(serializers.ModelSerializer):
+    """ serializing result of sending single ingredient to nozbe """
+
+    status = serializers.CharField(source='get_status_display')
+
+    class Meta:
+        model = NozbeExportItem
+        fields = ('id', 'ingredient', 'name', 'status', 'attempts', 'error')
+
+
+class NozbeExportOutputSerializer(serializers.ModelSerializer):
+    """ serializing nozbe export with its items """
+
+    self = serializers.HyperlinkedIdentityField(
+        view_name='recipe:nozbe-export-detail')
+    status = serializers.CharField(source='get_status_display')
+    items = NozbeExportItemOutputSerializer(many=True)
+
+    class Meta:
+        model = NozbeExport
+        fields = ('id', 'status', 'created', 'error', 'items', 'self')
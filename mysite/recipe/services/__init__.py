@@ -1,3 +1,5 @@
 from .recipe_services import *
 from .tag_services import *
 from .ingredient_services import *
+from .nozbe_services import *
+from .photo_services import *
@@ -1,13 +1,13 @@
 from django.contrib.auth import get_user_model
 from django.utils.text import slugify
 from unidecode import unidecode
-from django.db import IntegrityError
-from recipe.models import Ingredient, Recipe
+from django.db import IntegrityError, transaction
+from recipe.models import Ingredient, IngredientSearchTerm, Recipe
 from django.core.exceptions import ValidationError
 from dataclasses import dataclass, fields
 from recipe import selectors
 from recipe.services.tag_services import CreateTagDto, CreateTag
-from recipe.services.recipe_services import RecalculateRecipeCalories, RecalculateRecipeCaloriesDto
+from recipe.services.recipe_services import RecalculateRecipeCalories
 
 
 @dataclass
@@ -48,7 +48,24 @@ class UpdateIngredientDto(CreateIngredientDto):
         pass
 
 
+class IndexIngredient:
+    """ keep ingredient search terms up to date with ingredient name """
+
+    def index(self, ingredient: Ingredient) -> None:
+        terms = selectors.ingredient_get_search_terms(ingredient)
+        existing = {(term.kind, term.term): term.id
+                    for term in ingredient.search_terms.all()}
+        IngredientSearchTerm.objects.filter(
+            id__in=[id for term, id in existing.items() if term not in terms]
+        ).delete()
+        IngredientSearchTerm.objects.bulk_create([
+            IngredientSearchTerm(ingredient=ingredient, kind=kind, term=term)
+            for kind, term in terms - existing.keys()
+        ])
+
+
 class CreateIngredient:
+    @transaction.atomic
     def create(self, dto: CreateIngredientDto) -> Ingredient:
 
         slug = slugify(unidecode(dto.name)) + \
@@ -78,6 +95,7 @@ class CreateIngredient:
         if dto.ready_meal:
             self._add_ready_meal_tag()
         self._add_default_unit()
+        IndexIngredient().index(self.ingredient)
 
         return self.ingredient
 
@@ -91,6 +109,11 @@ class CreateIngredient:
                                   'grams_in_one_unit': 100})
 
 
+def _get_nutrients(ingredient: Ingredient) -> dict:
+    return {field: getattr(ingredient, field)
+            for field in RecalculateRecipeCalories.fields}
+
+
 class UpdateIngredient:
     def update(self, ingredient: Ingredient, dto: UpdateIngredientDto) -> Ingredient:
 
@@ -101,20 +124,18 @@ class UpdateIngredient:
             slug = slugify(unidecode(dto.name)) + \
                 '-user-' + str(dto.user.id)
 
+        old_nutrients = _get_nutrients(ingredient)
         for attr in vars(dto):
             setattr(ingredient, attr, getattr(dto, attr))
 
         try:
             ingredient.slug = slug
-            service = RecalculateRecipeCalories()
-            service_dto = RecalculateRecipeCaloriesDto(
-                ingredients_ids=[ingredient.id, ]
-            )
-            affected_recipes = Recipe.objects.filter(
-                ingredients__in=[ingredient.id, ])
-            service.batch_removal(service_dto, affected_recipes)
-            ingredient.save()
-            service.batch_addition(service_dto, affected_recipes)
+            with transaction.atomic():
+                ingredient.save()
+                self.affected_recipes = RecalculateRecipeCalories() \
+                    .propagate_ingredient_change(
+                        ingredient.id, old_nutrients, _get_nutrients(ingredient))
+                IndexIngredient().index(ingredient)
         except IntegrityError:
             raise ValidationError(
                 f'Ingredient with name "{dto.name}" already exists!')
@@ -124,14 +145,13 @@ class UpdateIngredient:
 
 class DeleteIngredient:
     def delete(self, ingredient: Ingredient) -> None:
-        service_dto = RecalculateRecipeCaloriesDto(
-            ingredients_ids=[ingredient.id, ]
-        )
-        service = RecalculateRecipeCalories()
-        affected_recipes = Recipe.objects.filter(
-            ingredients__in=[ingredient.id, ])
-        service.batch_removal(service_dto, affected_recipes)
-        ingredient.delete()
+        old_nutrients = _get_nutrients(ingredient)
+        with transaction.atomic():
+            self.affected_recipes = RecalculateRecipeCalories() \
+                .propagate_ingredient_change(
+                    ingredient.id, old_nutrients, dict.fromkeys(old_nutrients))
+            ingredient.search_terms.all().delete()
+            ingredient.delete()
 
 
 @dataclass
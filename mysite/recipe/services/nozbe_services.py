@@ -0,0 +1,102 @@
+import datetime
+from dataclasses import dataclass
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from mysite import settings
+from recipe import selectors
+from recipe.models import NozbeExport, NozbeExportItem
+
+
+@dataclass
+class ExportIngredientsToNozbeDto:
+    user: get_user_model
+    slugs: list[str]
+    background: bool = False
+
+    def __post_init__(self):
+        if not self.slugs or not all(isinstance(slug, str) for slug in self.slugs):
+            raise ValidationError('Provide list of ingredient slugs')
+        if len(self.slugs) > settings.NOZBE_MAX_ITEMS:
+            raise ValidationError(
+                f'Up to {settings.NOZBE_MAX_ITEMS} ingredients can be exported at once')
+        self.slugs = list(dict.fromkeys(self.slugs))
+
+
+class ExportIngredientsToNozbe:
+    """ export ingredients as nozbe tasks """
+
+    @transaction.atomic
+    def create(self, dto: ExportIngredientsToNozbeDto) -> NozbeExport:
+        """ create export with item for every ingredient, export which is not
+        run in background is created as running so workers skip it. Export
+        is not created when nozbe is not configured """
+        selectors.get_nozbe_request_information()
+        ingredients = selectors.ingredient_get_multi_by_slugs(dto.slugs)
+        export = NozbeExport.objects.create(
+            user=dto.user,
+            status=NozbeExport.PENDING if dto.background else NozbeExport.RUNNING,
+            claimed_at=None if dto.background else datetime.datetime.now())
+        NozbeExportItem.objects.bulk_create([
+            NozbeExportItem(export=export, ingredient=ingredient, name=ingredient.name)
+            for ingredient in ingredients])
+        return export
+
+    def export(self, export: NozbeExport) -> NozbeExport:
+        """ send items which are not done yet, export is done when all items
+        are done. Export which could not be sent at all is failed with error,
+        so it can be retried """
+        try:
+            items = list(export.items.exclude(status=NozbeExport.DONE))
+            results = selectors.ingredient_send_to_nozbe(
+                [item.name for item in items], selectors.get_nozbe_request_information())
+            for item, (attempts, error) in zip(items, results):
+                item.attempts += attempts
+                item.error = error
+                item.status = NozbeExport.FAILED if error else NozbeExport.DONE
+            NozbeExportItem.objects.bulk_update(items, ['attempts', 'error', 'status'])
+        except Exception as e:
+            export.status = NozbeExport.FAILED
+            export.error = '; '.join(e.messages) if isinstance(e, ValidationError) \
+                else str(e) or e.__class__.__name__
+        else:
+            export.error = ''
+            export.status = NozbeExport.FAILED if any(
+                item.status == NozbeExport.FAILED for item in items) else NozbeExport.DONE
+        export.save(update_fields=['status', 'error'])
+        return export
+
+    def retry(self, export: NozbeExport) -> NozbeExport:
+        """ queue failed export again, worker sends only its items which are
+        not done """
+        if not NozbeExport.objects.filter(id=export.id, status=NozbeExport.FAILED).update(
+                status=NozbeExport.PENDING, claimed_at=None):
+            raise ValidationError('Only failed export can be retried')
+        export.status = NozbeExport.PENDING
+        export.claimed_at = None
+        return export
+
+
+def run_nozbe_exports(limit: int = 10) -> int:
+    """ process pending exports and running ones whose worker crashed and did
+    not finish them within NOZBE_EXPORT_LEASE. Every export is claimed with
+    conditional update so many workers can run at the same time. Return
+    number of processed exports """
+    now = datetime.datetime.now()
+    claimable = (
+        Q(status=NozbeExport.PENDING)
+        | Q(status=NozbeExport.RUNNING,
+            claimed_at__lt=now - datetime.timedelta(seconds=settings.NOZBE_EXPORT_LEASE))
+    )
+    ids = NozbeExport.objects.filter(claimable).order_by(
+        'created').values_list('id', flat=True)[:limit]
+    processed = 0
+    for id in ids:
+        if NozbeExport.objects.filter(claimable, id=id).update(
+                status=NozbeExport.RUNNING, claimed_at=now):
+            ExportIngredientsToNozbe().export(NozbeExport.objects.get(id=id))
+            processed += 1
+    return processed
@@ -0,0 +1,179 @@
+import datetime
+import os
+import uuid
+from dataclasses import dataclass
+from io import BytesIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from mysite import settings
+from recipe.models import Recipe, RecipePhoto
+
+
+@dataclass
+class UploadRecipePhotosDto:
+    photos: dict[str, UploadedFile]
+
+    def __post_init__(self):
+        if not self.photos:
+            raise ValidationError(
+                f'Provide at least one of {", ".join(RecipePhoto.FIELDS)}')
+        for field, photo in self.photos.items():
+            if field not in RecipePhoto.FIELDS:
+                raise ValidationError(f'Unknown photo {field}')
+            if photo.size > settings.RECIPE_PHOTO_MAX_UPLOAD_SIZE:
+                raise ValidationError(
+                    f'{field} is larger than '
+                    f'{settings.RECIPE_PHOTO_MAX_UPLOAD_SIZE // 1024 // 1024} MB')
+
+
+def _get_storage():
+    return Recipe._meta.get_field('photo1').storage
+
+
+def _get_sizes() -> dict[str, int]:
+    return {RecipePhoto.LARGE: settings.RECIPE_PHOTO_MAX_SIZE,
+            **settings.RECIPE_PHOTO_THUMBNAILS}
+
+
+def _get_renditions_names(photo: RecipePhoto) -> list[str]:
+    return [photo.get_rendition_name(size, format)
+            for size in _get_sizes() for format in RecipePhoto.FORMATS]
+
+
+class UploadRecipePhotos:
+    """ replace recipe photos with uploaded ones, which are processed in
+    background by process_recipe_photos command. Until then uploaded photos
+    are not served """
+
+    @transaction.atomic
+    def upload(self, recipe: Recipe, dto: UploadRecipePhotosDto) -> None:
+        replaced = recipe.photos.filter(field__in=dto.photos, status=RecipePhoto.DONE)
+        for photo in replaced:
+            for name in _get_renditions_names(photo):
+                _get_storage().delete(name)
+        for field, photo in dto.photos.items():
+            setattr(recipe, field, photo)
+        # replaced files of photo fields are removed by Recipe.clean
+        recipe.save()
+        for field in dto.photos:
+            RecipePhoto.objects.update_or_create(
+                recipe=recipe, field=field, defaults={
+                    'name': getattr(recipe, field).name,
+                    'status': RecipePhoto.PENDING,
+                    'error': '',
+                })
+
+
+def render_photo(image: Image.Image) -> dict[tuple[str, str], bytes]:
+    """ return encoded renditions of image by size and format. Image is
+    rotated according to its EXIF orientation and the rest of metadata,
+    like location, is dropped """
+    sizes = sorted(_get_sizes().items(), key=lambda item: item[1], reverse=True)
+    # JPEG is decoded already reduced by power of two, close to largest size
+    image.draft('RGB', (sizes[0][1], sizes[0][1]))
+    image = ImageOps.exif_transpose(image)
+    icc_profile = image.info.get('icc_profile')
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        flattened = Image.new('RGB', image.size, (255, 255, 255))
+        flattened.paste(image, mask=image.getchannel('A'))
+        image = flattened
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    renditions = {}
+    for size, edge in sizes:
+        # every size is scaled down from previous, larger one
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        for format in RecipePhoto.FORMATS:
+            buffer = BytesIO()
+            if format == 'jpeg':
+                image.save(buffer, 'JPEG', quality=settings.RECIPE_PHOTO_QUALITY,
+                           optimize=True, progressive=True, icc_profile=icc_profile)
+            else:
+                image.save(buffer, 'WEBP', quality=settings.RECIPE_PHOTO_QUALITY,
+                           method=4, icc_profile=icc_profile)
+            renditions[size, format] = buffer.getvalue()
+    return renditions
+
+
+class ProcessRecipePhoto:
+    """ replace uploaded photo with processed one and save its renditions """
+
+    def process(self, photo: RecipePhoto) -> RecipePhoto:
+        storage = _get_storage()
+        try:
+            with storage.open(photo.name) as file, Image.open(file) as image:
+                renditions = render_photo(image)
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            photo.status = RecipePhoto.FAILED
+            photo.error = str(e) or e.__class__.__name__
+            with transaction.atomic():
+                # uploaded photo still has its metadata, so it is removed from
+                # recipe, which is touched so its etag changes
+                current = RecipePhoto.objects.filter(id=photo.id, name=photo.name).update(
+                    status=photo.status, error=photo.error) and Recipe.objects.filter(
+                        id=photo.recipe_id, **{photo.field: photo.name}).update(**{
+                            photo.field: '', 'updated_at': datetime.datetime.now()})
+            if current:
+                storage.delete(photo.name)
+            return photo
+
+        uploaded = photo.name
+        photo.name = os.path.join(os.path.dirname(uploaded), f'{uuid.uuid4()}.jpg')
+        saved = [storage.save(photo.get_rendition_name(size, format), ContentFile(data))
+                 for (size, format), data in renditions.items()]
+        with transaction.atomic():
+            # photo could be replaced by another upload during processing
+            current = Recipe.objects.filter(
+                id=photo.recipe_id, **{photo.field: uploaded}).update(**{
+                    photo.field: photo.name, 'updated_at': datetime.datetime.now()})
+            if current:
+                RecipePhoto.objects.filter(id=photo.id, name=uploaded).update(
+                    name=photo.name, status=RecipePhoto.DONE, error='')
+        for name in [uploaded] if current else saved:
+            storage.delete(name)
+        if current:
+            photo.status = RecipePhoto.DONE
+        return photo
+
+
+def run_recipe_photos_processing(limit: int = 10) -> int:
+    """ process pending photos and running ones left by crashed worker for
+    longer than RECIPE_PHOTO_LEASE. Every photo is claimed with conditional
+    update so many workers can run at the same time. Return number of
+    processed photos """
+    now = datetime.datetime.now()
+    claimable = (
+        Q(status=RecipePhoto.PENDING)
+        | Q(status=RecipePhoto.RUNNING,
+            claimed_at__lt=now - datetime.timedelta(seconds=settings.RECIPE_PHOTO_LEASE))
+    )
+    ids = RecipePhoto.objects.filter(claimable).order_by(
+        'updated_at').values_list('id', flat=True)[:limit]
+    processed = 0
+    for id in ids:
+        if RecipePhoto.objects.filter(claimable, id=id).update(
+                status=RecipePhoto.RUNNING, claimed_at=now):
+            ProcessRecipePhoto().process(RecipePhoto.objects.get(id=id))
+            processed += 1
+    return processed
+
+
+def schedule_recipe_photos_processing() -> int:
+    """ create pending processing of recipe photos uploaded before photos
+    were processed. Return number of scheduled photos """
+    photos = []
+    for field in RecipePhoto.FIELDS:
+        recipes = Recipe.objects.exclude(**{field: ''}).exclude(
+            **{f'{field}__isnull': True}).exclude(photos__field=field)
+        photos.extend(RecipePhoto(recipe_id=recipe_id, field=field, name=name)
+                      for recipe_id, name in recipes.values_list('id', field))
+    RecipePhoto.objects.bulk_create(photos)
+    return len(photos)
@@ -1,11 +1,16 @@
+import datetime
+
 from django.contrib.auth import get_user_model
 from django.utils.text import slugify
 from django.db import IntegrityError
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from dataclasses import dataclass, fields, MISSING
 from recipe.models import Recipe, Recipe_Ingredient, Ingredient_Unit
 from recipe import selectors
 from django.core.exceptions import ValidationError
 from abc import ABC, abstractmethod
+from mysite.nplusone import detect_n_plus_one
 
 
 @dataclass
@@ -101,27 +106,31 @@ class AddIngredientsToRecipeDto:
     def __post_init__(self):
         if self.ingredients is None:
             raise ValidationError('Provide list of ingredients for recipe')
+        mappings = selectors.ingredient_get_unit_mappings(
+            (item['ingredient'], item['unit']) for item in self.ingredients)
         for item in self.ingredients:
-            if not selectors.ingredient_is_mapped_with_unit(
-                unit_id=item['unit'],
-                ingredient_id=item['ingredient']
-            ):
+            if (item['ingredient'], item['unit']) not in mappings:
                 raise ValidationError(
                     f'{item["ingredient"]} is not mapped with unit {item["unit"]}')
 
 
 class AddIngredientsToRecipe:
+    @detect_n_plus_one
     def add(self, recipe: Recipe, dto: AddIngredientsToRecipeDto) -> None:
+        ingredients_ids = [item['ingredient'] for item in dto.ingredients]
+        already_added = set(recipe.ingredients_quantity.filter(
+            ingredient_id__in=ingredients_ids).values_list('ingredient_id', flat=True))
+        new_items = {}
         for item in dto.ingredients:
-            recipe.ingredients.add(item['ingredient'],
-                                   through_defaults={"unit_id": item['unit'],
-                                                     "amount": item['amount']})
-
-        service_dto = RecalculateRecipeCaloriesDto(
-            ingredients_ids=[item['ingredient'] for item in dto.ingredients]
-        )
-        service = RecalculateRecipeCalories()
-        service.add(service_dto, recipe)
+            if item['ingredient'] not in already_added:
+                new_items.setdefault(item['ingredient'], item)
+        Recipe_Ingredient.objects.bulk_create([
+            Recipe_Ingredient(recipe=recipe, ingredient_id=item['ingredient'],
+                              unit_id=item['unit'], amount=item['amount'])
+            for item in new_items.values()
+        ])
+
+        RecalculateRecipeCalories().recalculate(recipe)
         recipe.save()
 
 
@@ -132,10 +141,8 @@ class RemoveIngredientsFromRecipeDto:
 
 class RemoveIngredientsFromRecipe:
     def remove(self, recipe: Recipe, dto: RemoveIngredientsFromRecipeDto) -> None:
-        service_dto = RecalculateRecipeCaloriesDto(dto.ingredient_ids)
-        service = RecalculateRecipeCalories()
-        service.remove(service_dto, recipe)
         recipe.ingredients.remove(*dto.ingredient_ids)
+        RecalculateRecipeCalories().recalculate(recipe)
         recipe.save()
 
 
@@ -158,16 +165,9 @@ class UpdateRecipeIngredient:
     def update(self, recipe_ingredient: Recipe_Ingredient, dto: UpdateRecipeIngredientDto) -> None:
         recipe_ingredient.unit_id = dto.unit_id
         recipe_ingredient.amount = dto.amount
-
-        dto = RecalculateRecipeCaloriesDto(
-            ingredients_ids=[recipe_ingredient.ingredient.id, ]
-        )
-        service = RecalculateRecipeCalories()
-        service.remove(dto, recipe_ingredient.recipe)
-
         recipe_ingredient.save()
 
-        service.add(dto, recipe_ingredient.recipe)
+        RecalculateRecipeCalories().recalculate(recipe_ingredient.recipe)
         recipe_ingredient.recipe.save()
 
 
@@ -176,43 +176,33 @@ class DeleteRecipe:
         recipe.delete()
 
 
-@dataclass
-class RecalculateRecipeCaloriesDto:
-    ingredients_ids: list[int]
-
-
 class RecalculateRecipeCalories:
-
-    def add(self, dto: RecalculateRecipeCaloriesDto, recipe: Recipe) -> None:
-        """ add new ingredient calories to recipe """
-        calories = self._sum_of_calories(dto, recipe)
-        recipe.calories += calories
-
-    def remove(self, dto: RecalculateRecipeCaloriesDto, recipe: Recipe) -> None:
-        """ substract removed ingredients calories from recipe """
-        calories = self._sum_of_calories(dto, recipe)
-        recipe.calories -= calories
-
-    def batch_removal(self, dto: RecalculateRecipeCaloriesDto, recipes: list[Recipe]) -> None:
-        """ substract calories from recipes during Ingredient object update """
-        for recipe in recipes:
-            self.remove(dto, recipe)
-            recipe.save()
-
-    def batch_addition(self, dto: RecalculateRecipeCaloriesDto, recipes: list[Recipe]) -> None:
-        """ add calories from recipes during Ingredient object update """
-        for recipe in recipes:
-            self.add(dto, recipe)
-            recipe.save()
-
-    def _sum_of_calories(self, dto: RecalculateRecipeCaloriesDto, recipe: Recipe) -> int:
-        ingredient_quantity_items = Recipe_Ingredient.objects.filter(
-            recipe=recipe, ingredient_id__in=dto.ingredients_ids).prefetch_related('ingredient', 'ingredient__ingredient_unit_set')
-        calories = 0
-        for item in ingredient_quantity_items:
-            calories += selectors.ingredient_calculate_calories(
-                ingredient=item.ingredient,
-                unit=item.unit,
-                amount=item.amount,
-                )
-        return calories
+    """ Keep recipe nutrients in sync with its ingredients. Every unit
+    mapping is resolved in the same query which loads ingredients rows """
+
+    fields = selectors.RECIPE_NUTRIENTS
+
+    def recalculate(self, recipe: Recipe) -> None:
+        """ set recipe nutrients based on all its ingredients """
+        nutrients = selectors.ingredient_calculate_nutrients(
+            selectors.recipe_get_ingredients_with_grams(recipe))
+        for field in self.fields:
+            setattr(recipe, field, nutrients[field])
+
+    def propagate_ingredient_change(self, ingredient_id: int, old: dict[str, float],
+                                    new: dict[str, float]) -> int:
+        """ apply change of ingredient nutrients (per 100 grams) from old to
+        new values to every recipe which uses it in single UPDATE. Return
+        number of updated recipes """
+        changes = {
+            field: Coalesce(F(field), 0.0) + Coalesce(
+                selectors.recipe_get_ingredient_nutrient_change(
+                    ingredient_id, old[field], new[field]), 0.0)
+            for field in self.fields if (old[field] or 0) != (new[field] or 0)
+        }
+        if not changes:
+            return 0
+        affected_recipes = Recipe_Ingredient.objects.filter(
+            ingredient_id=ingredient_id).values('recipe_id')
+        return Recipe.objects.filter(id__in=affected_recipes).update(
+            updated_at=datetime.datetime.now(), **changes)
@@ -4,11 +4,12 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from recipe.models import Unit
+from recipe.models import Unit, Ingredient
 
 
 INGREDIENT_CREATE = reverse('recipe:ingredient-create')
 TAG_CREATE = reverse('recipe:tag-create')
+INGREDIENT_SEARCH = reverse('recipe:ingredient-search')
 
 
 def ingredient_detail_url(slug: str) -> str:
@@ -130,3 +131,43 @@ class IngredientApiTests(TestCase):
             ingredient_units_url(ingredient['slug']), payload)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(unit.ingredient_set.all()[0].name, ingredient['name'])
+
+    def test_listing_ingredients_with_cursor_pagination(self) -> None:
+        for name in ('first', 'second', 'third'):
+            self._create_ingredient(name=name)
+
+        res = self.client.get(
+            INGREDIENT_CREATE, {'pagination': 'cursor', 'limit': 2, 'count': 'true'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], Ingredient.objects.count())
+        ids = [ingredient['id'] for ingredient in res.data['results']]
+
+        res = self.client.get(res.data['next'])
+        self.assertIsNone(res.data['next'])
+        ids += [ingredient['id'] for ingredient in res.data['results']]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 3)
+
+    def test_searching_ingredients_success(self) -> None:
+        self._create_ingredient(name='Banana')
+        self._create_ingredient(name='Bread')
+
+        res = self.client.get(INGREDIENT_SEARCH, {'q': 'ban'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in res.data], ['Banana'])
+
+        res = self.client.get(INGREDIENT_SEARCH, {'q': '?!'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieving_unchanged_ingredient_returns_not_modified(self) -> None:
+        ingredient = self._create_ingredient()
+        url = ingredient_detail_url(ingredient['slug'])
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.put(url, {'calories': 200})
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['calories'], 200)
@@ -0,0 +1,204 @@
+import datetime
+import os
+from io import StringIO
+from unittest.mock import patch, Mock
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from mysite import settings
+from recipe.models import Ingredient, NozbeExport
+
+
+NOZBE_EXPORT = reverse('recipe:ingredient-nozbe-export')
+
+
+def nozbe_export_retry_url(id: int) -> str:
+    return reverse('recipe:nozbe-export-retry', kwargs={'pk': id})
+NOZBE_ENVIRON = {'NOZBE_SECRET': 'secret', 'NOZBE_CLIENT_ID': 'client',
+                 'NOZBE_PROJECT_ID': 'project'}
+
+
+def nozbe_response(status_code: int) -> Mock:
+    return Mock(status_code=status_code)
+
+
+@patch.dict(os.environ, NOZBE_ENVIRON)
+@patch('mysite.settings.NOZBE_RETRY_BACKOFF', 0)
+@patch('recipe.selectors.send_request_to_nozbe')
+class NozbeExportApiTests(TestCase):
+
+    def setUp(self):
+        self.auth_user = get_user_model().objects.create_user(
+            email='auth@gmail.com',
+            name='auth',
+            password='authpass',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.auth_user)
+        self.slugs = [
+            Ingredient.objects.create(user=self.auth_user, name=f'ingredient {i}',
+                                      slug=f'ingredient-{i}').slug
+            for i in range(3)
+        ]
+
+    def test_export_ingredients(self, mock):
+        mock.return_value = nozbe_response(200)
+
+        res = self.client.post(NOZBE_EXPORT, self.slugs, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['status'], 'done')
+        self.assertEqual(len(res.data['items']), 3)
+        self.assertEqual(mock.call_count, 3)
+        self.assertEqual(sorted(call.args[0] for call in mock.call_args_list),
+                         ['ingredient 0', 'ingredient 1', 'ingredient 2'])
+
+    def test_export_retries_throttled_and_unreachable_requests(self, mock):
+        refused = requests.ConnectionError(MaxRetryError(
+            None, '/task', NewConnectionError(None, 'Connection refused')))
+        responses = {'ingredient 0': [nozbe_response(503), nozbe_response(200)],
+                     'ingredient 1': [refused, requests.ConnectTimeout(),
+                                      nozbe_response(200)],
+                     'ingredient 2': [nozbe_response(200)]}
+
+        def send(name, *args):
+            res = responses[name].pop(0)
+            if isinstance(res, Exception):
+                raise res
+            return res
+        mock.side_effect = send
+
+        res = self.client.post(NOZBE_EXPORT, self.slugs, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        attempts = {item['name']: item['attempts'] for item in res.data['items']}
+        self.assertEqual(attempts, {'ingredient 0': 2, 'ingredient 1': 3,
+                                    'ingredient 2': 1})
+
+    def test_export_not_retrying_requests_which_could_create_task(self, mock):
+        aborted = requests.ConnectionError(ProtocolError('Connection aborted.'))
+        responses = {'ingredient 0': nozbe_response(502),
+                     'ingredient 1': nozbe_response(504),
+                     'ingredient 2': aborted}
+
+        def send(name, *args):
+            if isinstance(responses[name], Exception):
+                raise responses[name]
+            return responses[name]
+        mock.side_effect = send
+
+        res = self.client.post(NOZBE_EXPORT, self.slugs, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(mock.call_count, 3)
+        self.assertTrue(all(item['status'] == 'failed' and item['attempts'] == 1
+                            for item in res.data['items']))
+
+    def test_export_reports_failed_items(self, mock):
+        mock.side_effect = lambda name, *args: nozbe_response(
+            400 if name == 'ingredient 1' else 200)
+
+        res = self.client.post(NOZBE_EXPORT, self.slugs, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(res.data['status'], 'failed')
+        failed = [item for item in res.data['items'] if item['status'] == 'failed']
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0]['name'], 'ingredient 1')
+        self.assertEqual(failed[0]['attempts'], 1)
+        self.assertEqual(failed[0]['error'], 'Nozbe responded with 400')
+
+    def test_background_export(self, mock):
+        mock.return_value = nozbe_response(200)
+
+        res = self.client.post(NOZBE_EXPORT + '?background=true', self.slugs,
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['status'], 'pending')
+        mock.assert_not_called()
+
+        call_command('run_nozbe_exports', once=True, stdout=StringIO())
+
+        res = self.client.get(res._headers['location'][1])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['status'], 'done')
+        self.assertEqual(mock.call_count, 3)
+
+    def test_export_retried_in_background_sends_only_failed_items(self, mock):
+        mock.side_effect = lambda name, *args: nozbe_response(
+            400 if name == 'ingredient 1' else 200)
+        res = self.client.post(NOZBE_EXPORT, self.slugs, format='json')
+        mock.reset_mock(side_effect=True)
+        mock.return_value = nozbe_response(200)
+
+        retry = self.client.post(nozbe_export_retry_url(res.data['id']))
+        self.assertEqual(retry.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(retry.data['status'], 'pending')
+        call_command('run_nozbe_exports', once=True, stdout=StringIO())
+
+        mock.assert_called_once()
+        self.assertEqual(NozbeExport.objects.get(id=res.data['id']).status,
+                         NozbeExport.DONE)
+        retry = self.client.post(nozbe_export_retry_url(res.data['id']))
+        self.assertEqual(retry.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_not_created_without_nozbe_credentials(self, mock):
+        with patch.dict(os.environ, clear=True):
+            res = self.client.post(NOZBE_EXPORT, self.slugs, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(NozbeExport.objects.exists())
+        mock.assert_not_called()
+
+    def test_background_export_which_cannot_be_sent_is_failed(self, mock):
+        mock.return_value = nozbe_response(200)
+        ids = [self.client.post(NOZBE_EXPORT + '?background=true', self.slugs,
+                                format='json').data['id'] for _ in range(2)]
+
+        with patch('recipe.selectors.ingredient_send_to_nozbe',
+                   side_effect=[RuntimeError('database is gone'), [(1, '')] * 3]):
+            call_command('run_nozbe_exports', once=True, stdout=StringIO())
+
+        failed, done = NozbeExport.objects.order_by('id')
+        self.assertEqual(failed.id, ids[0])
+        self.assertEqual((failed.status, failed.error),
+                         (NozbeExport.FAILED, 'database is gone'))
+        self.assertEqual(done.status, NozbeExport.DONE)
+
+    def test_running_export_of_crashed_worker_claimed_after_lease(self, mock):
+        mock.return_value = nozbe_response(200)
+        res = self.client.post(NOZBE_EXPORT + '?background=true', self.slugs,
+                               format='json')
+        claimed_at = datetime.datetime.now() - datetime.timedelta(
+            seconds=settings.NOZBE_EXPORT_LEASE - 60)
+        NozbeExport.objects.filter(id=res.data['id']).update(
+            status=NozbeExport.RUNNING, claimed_at=claimed_at)
+
+        call_command('run_nozbe_exports', once=True, stdout=StringIO())
+        mock.assert_not_called()
+
+        NozbeExport.objects.filter(id=res.data['id']).update(
+            claimed_at=claimed_at - datetime.timedelta(seconds=120))
+        call_command('run_nozbe_exports', once=True, stdout=StringIO())
+        self.assertEqual(mock.call_count, 3)
+        self.assertEqual(NozbeExport.objects.get(id=res.data['id']).status,
+                         NozbeExport.DONE)
+
+    @patch('mysite.settings.NOZBE_MAX_ITEMS', 2)
+    def test_export_too_many_ingredients(self, mock):
+        res = self.client.post(NOZBE_EXPORT, self.slugs, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        mock.assert_not_called()
+
+    def test_export_unknown_ingredient(self, mock):
+        res = self.client.post(NOZBE_EXPORT, ['unknown'], format='json')
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(NozbeExport.objects.exists())
@@ -0,0 +1,144 @@
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from recipe.models import Recipe, RecipePhoto
+
+RECIPE_LIST = reverse('recipe:recipe-list')
+
+
+def recipe_photos_url(slug: str) -> str:
+    return reverse('recipe:recipe-photos', kwargs={'slug': slug})
+
+
+def recipe_detail_url(slug: str) -> str:
+    return reverse('recipe:recipe-detail', kwargs={'slug': slug})
+
+
+def create_photo(name: str = 'photo.jpg', size: tuple = (3000, 2000)) -> SimpleUploadedFile:
+    """ return jpeg photo with metadata of rotated phone photo """
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x010F] = 'Phone'
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, 'JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class RecipePhotosApiTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.auth_user = get_user_model().objects.create_user(
+            email='auth@gmail.com',
+            name='auth',
+            password='authpass',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.auth_user)
+        self.recipe = Recipe.objects.create(user=self.auth_user, name='recipe',
+                                            slug='recipe')
+
+    def _process_photos(self) -> None:
+        call_command('process_recipe_photos', '--once', stdout=StringIO())
+
+    def _media_files(self) -> set[str]:
+        return {os.path.relpath(os.path.join(path, name), self.media_root)
+                for path, _, names in os.walk(self.media_root) for name in names}
+
+    def test_uploading_photo_processed_in_background(self) -> None:
+        res = self.client.put(recipe_photos_url(self.recipe.slug),
+                              {'photo1': create_photo()}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        res = self.client.get(recipe_photos_url(self.recipe.slug))
+        self.assertEqual(res.data, [{'field': 'photo1', 'status': 'pending', 'urls': {}}])
+        # uploaded photo with its metadata is not served until processed
+        res = self.client.get(recipe_detail_url(self.recipe.slug))
+        self.assertIsNone(res.data['photo1'])
+
+        self._process_photos()
+
+        res = self.client.get(recipe_detail_url(self.recipe.slug))
+        photo = res.data['photos'][0]
+        self.assertEqual(photo['status'], 'done')
+        self.assertEqual(set(photo['urls']), {'large', 'medium', 'small'})
+        self.assertTrue(photo['urls']['small']['webp'].startswith('http://testserver/media/'))
+        self.assertTrue(photo['urls']['small']['webp'].endswith('_small.webp'))
+        self.assertEqual(res.data['photo1'], photo['urls']['large']['jpeg'])
+
+    def test_processed_photo_is_rotated_downscaled_and_without_metadata(self) -> None:
+        self.client.put(recipe_photos_url(self.recipe.slug),
+                        {'photo1': create_photo()}, format='multipart')
+        self._process_photos()
+
+        photo = RecipePhoto.objects.get(recipe=self.recipe)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.photo1.name, photo.name)
+        with Image.open(self.recipe.photo1.path) as image:
+            self.assertEqual(image.size, (1067, 1600))
+            self.assertEqual(dict(image.getexif()), {})
+        with Image.open(os.path.join(self.media_root,
+                                     photo.get_rendition_name('small', 'webp'))) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(max(image.size), 240)
+        # uploaded original is replaced by processed photo and 5 renditions
+        self.assertEqual(len(self._media_files()), 6)
+
+    def test_listing_recipes_with_thumbnails(self) -> None:
+        Recipe.objects.create(user=self.auth_user, name='other', slug='other')
+        self.client.put(recipe_photos_url(self.recipe.slug),
+                        {'photo2': create_photo()}, format='multipart')
+        self._process_photos()
+
+        res = self.client.get(RECIPE_LIST)
+
+        thumbnails = {recipe['slug']: recipe['thumbnails'] for recipe in res.data['results']}
+        self.assertIsNone(thumbnails['other'])
+        self.assertEqual(set(thumbnails['recipe']), {'medium', 'small'})
+        self.assertEqual(set(thumbnails['recipe']['small']), {'jpeg', 'webp'})
+
+    def test_replacing_photo_removes_previous_files(self) -> None:
+        self.client.put(recipe_photos_url(self.recipe.slug),
+                        {'photo1': create_photo()}, format='multipart')
+        self._process_photos()
+
+        self.client.put(recipe_photos_url(self.recipe.slug),
+                        {'photo1': create_photo(size=(100, 100))}, format='multipart')
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self._media_files(), {self.recipe.photo1.name})
+        self._process_photos()
+        self.assertEqual(len(self._media_files()), 6)
+
+    def test_uploading_invalid_photo(self) -> None:
+        invalid = SimpleUploadedFile('photo.jpg', b'not an image', content_type='image/jpeg')
+
+        res = self.client.put(recipe_photos_url(self.recipe.slug),
+                              {'photo1': invalid}, format='multipart')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.put(recipe_photos_url(self.recipe.slug), {}, format='multipart')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with patch('mysite.settings.RECIPE_PHOTO_MAX_UPLOAD_SIZE', 1024):
+            res = self.client.put(recipe_photos_url(self.recipe.slug),
+                                  {'photo1': create_photo()}, format='multipart')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(RecipePhoto.objects.exists())
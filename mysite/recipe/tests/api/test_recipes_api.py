@@ -322,3 +322,21 @@ class RecipeApiTests(TestCase):
         res = self.client.get(
             RECIPE_LIST + f'?tags={user2_tag_slug}&groups={user2.own_group.id}')
         self.assertEqual(len(res.data['results']), 1)
+
+    def test_retrieving_unchanged_recipe_returns_not_modified(self) -> None:
+        recipe_slug = self._create_recipe()
+        res = self.client.get(recipe_detail_url(recipe_slug))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        etag = res['ETag']
+        self.assertTrue(res.has_header('Last-Modified'))
+
+        with self.assertNumQueries(1):
+            res = self.client.get(recipe_detail_url(recipe_slug), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+
+        self.client.put(recipe_detail_url(recipe_slug), {'portions': 5})
+        res = self.client.get(recipe_detail_url(recipe_slug), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['portions'], 5)
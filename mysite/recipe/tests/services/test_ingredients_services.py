@@ -4,6 +4,7 @@ from django.core.exceptions import ValidationError
 from django.utils.text import slugify
 
 from recipe.models import Ingredient, Tag, Unit
+from recipe import selectors
 from recipe.services import (
     CreateIngredientDto,
     CreateIngredient,
@@ -189,3 +190,26 @@ class IngredientServicesTests(TestCase):
         service = MapUnitToIngredient()
         with self.assertRaises(ValidationError):
             service.map(ingredient, dto)
+
+    def test_ingredient_search_index_follows_ingredient_changes(self) -> None:
+        ingredient = self._create_ingredient(self.user, name='Żółty ser')
+        self._create_ingredient(self.user, name='Serek wiejski')
+        self._create_ingredient(self.user, name='Masło')
+
+        names = [item.name for item in selectors.ingredient_search('zolty')]
+        self.assertEqual(names, ['Żółty ser'])
+        names = [item.name for item in selectors.ingredient_search('ser')]
+        self.assertEqual(names, ['Serek wiejski', 'Żółty ser'])
+        names = [item.name for item in selectors.ingredient_search('maslo')]
+        self.assertEqual(names, ['Masło'])
+        names = [item.name for item in selectors.ingredient_search('masslo')]
+        self.assertEqual(names, ['Masło'])
+
+        UpdateIngredient().update(ingredient, UpdateIngredientDto(
+            user=self.user, name='Ser gouda'))
+        self.assertEqual(selectors.ingredient_search('zolty'), [])
+        names = [item.name for item in selectors.ingredient_search('gouda')]
+        self.assertEqual(names, ['Ser gouda'])
+
+        DeleteIngredient().delete(ingredient)
+        self.assertEqual(selectors.ingredient_search('gouda'), [])
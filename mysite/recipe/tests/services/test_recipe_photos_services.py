@@ -0,0 +1,112 @@
+import datetime
+import os
+import tempfile
+from io import BytesIO
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+
+from mysite import settings
+from recipe.models import Recipe, RecipePhoto
+from recipe.services import (
+    UploadRecipePhotosDto,
+    UploadRecipePhotos,
+    ProcessRecipePhoto,
+    render_photo,
+    run_recipe_photos_processing,
+    schedule_recipe_photos_processing,
+)
+
+
+def create_photo(mode: str = 'RGB') -> SimpleUploadedFile:
+    buffer = BytesIO()
+    Image.new(mode, (800, 400)).save(buffer, 'PNG')
+    return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+
+class RecipePhotosServicesTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.user = get_user_model().objects.create_user(
+            email='auth@gmail.com',
+            name='auth',
+            password='authpass',
+        )
+        self.recipe = Recipe.objects.create(user=self.user, name='recipe', slug='recipe')
+
+    def _upload(self, photo: SimpleUploadedFile) -> RecipePhoto:
+        UploadRecipePhotos().upload(self.recipe, UploadRecipePhotosDto(photos={'photo1': photo}))
+        return RecipePhoto.objects.get(recipe=self.recipe, field='photo1')
+
+    def test_rendering_transparent_photo_in_every_size_and_format(self) -> None:
+        with Image.open(create_photo('RGBA')) as image:
+            renditions = render_photo(image)
+
+        self.assertEqual(set(renditions), {
+            (size, format) for size in ('large', 'medium', 'small')
+            for format in ('jpeg', 'webp')})
+        with Image.open(BytesIO(renditions['medium', 'jpeg'])) as image:
+            self.assertEqual((image.format, image.mode, image.size), ('JPEG', 'RGB', (640, 320)))
+        # photo smaller than large size is not upscaled
+        with Image.open(BytesIO(renditions['large', 'webp'])) as image:
+            self.assertEqual(image.size, (800, 400))
+
+    def test_removing_uploaded_photo_which_cannot_be_decoded(self) -> None:
+        photo = self._upload(create_photo())
+        with open(os.path.join(self.media_root, photo.name), 'wb') as file:
+            file.write(b'broken')
+
+        updated_at = Recipe.objects.get(id=self.recipe.id).updated_at
+
+        photo = ProcessRecipePhoto().process(photo)
+
+        self.assertEqual(RecipePhoto.objects.get(id=photo.id).status, RecipePhoto.FAILED)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.photo1)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, photo.name)))
+        self.assertGreater(self.recipe.updated_at, updated_at)
+
+    def test_discarding_result_of_photo_replaced_during_processing(self) -> None:
+        photo = self._upload(create_photo())
+        stale = RecipePhoto.objects.get(id=photo.id)
+        self.recipe = Recipe.objects.get(id=self.recipe.id)
+        replaced = self._upload(create_photo())
+
+        ProcessRecipePhoto().process(stale)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.photo1.name, replaced.name)
+        self.assertEqual(RecipePhoto.objects.get(id=photo.id).status, RecipePhoto.PENDING)
+        self.assertEqual(os.listdir(os.path.dirname(self.recipe.photo1.path)),
+                         [os.path.basename(replaced.name)])
+
+    def test_scheduling_processing_of_photos_uploaded_before(self) -> None:
+        self.recipe.photo2 = create_photo()
+        self.recipe.save()
+        self._upload(create_photo())
+
+        self.assertEqual(schedule_recipe_photos_processing(), 1)
+        self.assertEqual(schedule_recipe_photos_processing(), 0)
+        self.assertEqual(RecipePhoto.objects.filter(status=RecipePhoto.PENDING).count(), 2)
+
+    def test_processing_photo_of_crashed_worker_after_lease(self) -> None:
+        photo = self._upload(create_photo())
+        claimed_at = datetime.datetime.now() - datetime.timedelta(
+            seconds=settings.RECIPE_PHOTO_LEASE - 60)
+        RecipePhoto.objects.filter(id=photo.id).update(
+            status=RecipePhoto.RUNNING, claimed_at=claimed_at)
+        self.assertEqual(run_recipe_photos_processing(), 0)
+
+        RecipePhoto.objects.filter(id=photo.id).update(
+            claimed_at=claimed_at - datetime.timedelta(seconds=120))
+        self.assertEqual(run_recipe_photos_processing(), 1)
+        self.assertEqual(RecipePhoto.objects.get(id=photo.id).status, RecipePhoto.DONE)
@@ -2,6 +2,8 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.utils.text import slugify
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from unittest.mock import patch
 
 from recipe.models import Recipe, Tag, Unit, Ingredient, Recipe_Ingredient
@@ -25,6 +27,7 @@ from recipe.services import (
     UpdateIngredientDto,
     UpdateIngredient,
     DeleteIngredient,
+    RecalculateRecipeCalories,
 )
 from recipe import selectors
 
@@ -201,13 +204,12 @@ class RecipeServicesTests(TestCase):
         service.remove(recipe, dto)
         self.assertEqual(recipe.tags.all().count(), 1)
 
-    @patch('recipe.selectors.ingredient_is_mapped_with_unit')
-    @patch('recipe.services.RecalculateRecipeCalories.add')
-    def test_adding_ingredient_to_recipe_success(self, mock, mock2) -> None:
-        mock.return_value = True
+    @patch('recipe.selectors.ingredient_get_unit_mappings')
+    def test_adding_ingredient_to_recipe_success(self, mock) -> None:
         recipe = self._create_recipe(self.user)
         ingredient = self._create_ingredient(self.user)
         unit = self._create_unit()
+        mock.return_value = {(ingredient.id, unit.id): 100}
         dto = AddIngredientsToRecipeDto(
             user=self.user,
             ingredients=[
@@ -266,7 +268,7 @@ class RecipeServicesTests(TestCase):
                 ]
             )
 
-    @patch('recipe.services.RecalculateRecipeCalories.remove')
+    @patch('recipe.services.RecalculateRecipeCalories.recalculate')
     def test_removing_ingredient_from_recipe(self, mock) -> None:
         recipe = self._create_recipe(user=self.user)
         ingredient1 = self._create_ingredient(user=self.user)
@@ -429,3 +431,88 @@ class RecipeServicesTests(TestCase):
         service.delete(ing1)
         recipe.refresh_from_db()
         self.assertEqual(recipe.calories, excepected_calories)
+
+    def test_recipe_macros_are_calculated_based_on_ingredients(self) -> None:
+        recipe, ing1, ing2 = self._create_recipe_with_ingredients()
+        self.assertEqual(recipe.proteins, ing1.proteins + ing2.proteins)
+        self.assertEqual(recipe.fats, ing1.fats + ing2.fats)
+        self.assertEqual(recipe.carbohydrates,
+                         ing1.carbohydrates + ing2.carbohydrates)
+
+    def _count_queries_for_adding_ingredients(self, number: int) -> int:
+        recipe = self._create_recipe(self.user, name=f'recipe {number}')
+        unit = selectors.unit_get_default()
+        ingredients = [self._create_ingredient(
+            self.user, name=f'ingredient {number} {i}') for i in range(number)]
+        dto = AddIngredientsToRecipeDto(
+            user=self.user,
+            ingredients=[{'ingredient': ingredient.id, 'unit': unit.id,
+                          'amount': 100} for ingredient in ingredients]
+        )
+        with CaptureQueriesContext(connection) as context:
+            AddIngredientsToRecipe().add(recipe, dto)
+        self.assertEqual(recipe.calories, 100 * number)
+        return len(context.captured_queries)
+
+    def test_adding_ingredients_to_recipe_takes_constant_number_of_queries(self) -> None:
+        self.assertEqual(self._count_queries_for_adding_ingredients(3),
+                         self._count_queries_for_adding_ingredients(30))
+
+    def test_ingredient_update_is_propagated_to_all_affected_recipes(self) -> None:
+        recipe, ing1, ing2 = self._create_recipe_with_ingredients()
+        other_recipe = self._create_recipe(self.user, name='other recipe')
+        spoon = self._create_unit(name='spoon')
+        ing1.units.add(spoon, through_defaults={'grams_in_one_unit': 10})
+        dto = AddIngredientsToRecipeDto(
+            user=self.user,
+            ingredients=[{'ingredient': ing1.id,
+                          'unit': spoon.id, 'amount': 5}]
+        )
+        AddIngredientsToRecipe().add(other_recipe, dto)
+        self._create_recipe(self.user, name='not affected recipe')
+
+        service = UpdateIngredient()
+        service.update(ing1, UpdateIngredientDto(user=self.user, calories=1000))
+        recipe.refresh_from_db()
+        other_recipe.refresh_from_db()
+
+        self.assertEqual(service.affected_recipes, 2)
+        self.assertEqual(recipe.calories, 2000)
+        self.assertEqual(recipe.proteins, ing2.proteins)
+        self.assertEqual(other_recipe.calories, 500)
+
+    def test_ingredient_update_is_rounded_like_recalculation(self) -> None:
+        recipe, ing1, ing2 = self._create_recipe_with_ingredients()
+        recipe.ingredients_quantity.filter(ingredient=ing1).update(amount=7)
+        RecalculateRecipeCalories().recalculate(recipe)
+        recipe.save()
+
+        UpdateIngredient().update(ing1, UpdateIngredientDto(
+            user=self.user, calories=333.333, proteins=0))
+        recipe.refresh_from_db()
+        propagated = recipe.calories, recipe.proteins
+        RecalculateRecipeCalories().recalculate(recipe)
+
+        self.assertAlmostEqual(propagated[0], recipe.calories)
+        self.assertAlmostEqual(propagated[0], 23.33 + 1000)
+        self.assertAlmostEqual(propagated[1], recipe.proteins)
+
+    def test_ingredient_update_skips_items_with_unit_no_longer_mapped(self) -> None:
+        recipe = self._create_recipe(self.user)
+        ingredient = self._create_ingredient(self.user, calories=100)
+        spoon = self._create_unit(name='spoon')
+        ingredient.units.add(spoon, through_defaults={'grams_in_one_unit': 10})
+        AddIngredientsToRecipe().add(recipe, AddIngredientsToRecipeDto(
+            user=self.user,
+            ingredients=[{'ingredient': ingredient.id, 'unit': spoon.id, 'amount': 5}]))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.calories, 50)
+        ingredient.units.remove(spoon)
+
+        UpdateIngredient().update(ingredient, UpdateIngredientDto(user=self.user, calories=10))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.calories, 50)
+
+        DeleteIngredient().delete(ingredient)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.calories, 50)
@@ -13,6 +13,7 @@ urlpatterns = [
     path('recipes/<slug>/tags', views.RecipeTagsApi.as_view(), name='recipe-tags'),
     path('recipes/<slug>/ingredients',
          views.RecipeIngredientsApi.as_view(), name='recipe-ingredients'),
+    path('recipes/<slug>/photos', views.RecipePhotosApi.as_view(), name='recipe-photos'),
     path('recipes/<slug>/ingredients/<pk>',
          views.RecipeIngredientDetailApi.as_view(), name='recipe-ingredients-update'),
 
@@ -31,6 +32,14 @@ urlpatterns = [
 
     path('ingredients/', views.IngredientsApi.as_view(), name='ingredient-list'),
     path('ingredients/', views.IngredientsApi.as_view(), name='ingredient-create'),
+    path('ingredients/search', views.IngredientSearchApi.as_view(),
+         name='ingredient-search'),
+    path('ingredients/nozbe', views.RecipeSendIngredientsToNozbe.as_view(),
+         name='ingredient-nozbe-export'),
+    path('nozbe-exports/<pk>', views.NozbeExportDetailApi.as_view(),
+         name='nozbe-export-detail'),
+    path('nozbe-exports/<pk>/retry', views.NozbeExportRetryApi.as_view(),
+         name='nozbe-export-retry'),
     path('ingredients/<slug>', views.IngredientDetailApi.as_view(),
          name='ingredient-detail'),
     path('ingredients/<slug>/tags',
@@ -19,8 +19,10 @@ from recipe.services import (
     MapUnitToIngredient,
 )
 from .base_views import BaseViewClass
+from mysite.conditional import get_etag, get_not_modified_response, set_validators
 from mysite.drf_pagination import (
     LimitOffsetPagination,
+    CursorPagination,
     get_paginated_response,
 )
 
@@ -45,11 +47,15 @@ class IngredientsApi(BaseIngredientClass):
     class Pagination(LimitOffsetPagination):
         default_limit = 10
 
+    class CursorPagination(CursorPagination):
+        ordering = ('id', )
+
     def get(self, request, *args, **kwargs):
         """ retreving list of ingredients """
         ingredients = selectors.ingredient_list()
         return get_paginated_response(
             pagination_class=self.Pagination,
+            cursor_pagination_class=self.CursorPagination,
             serializer_class=serializers.IngredientListOutputSerializer,
             queryset=ingredients,
             request=request,
@@ -89,15 +95,36 @@ class IngredientsApi(BaseIngredientClass):
         )
 
 
+class IngredientSearchApi(BaseIngredientClass):
+    """ API for searching ingredients by name """
+
+    def get(self, request, *args, **kwargs):
+        serializer = serializers.IngredientSearchInputSerializer(
+            data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        ingredients = selectors.ingredient_search(data['q'], limit=data['limit'])
+        serializer = serializers.IngredientListOutputSerializer(
+            ingredients, many=True, context=self.get_serializer_context())
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+
 class IngredientDetailApi(BaseIngredientClass):
     """ API for handling ingredient detail """
 
     def get(self, request, *args, **kwargs):
-        """ handling get request """
+        """ handling get request, answer 304 if ingredient is not modified """
+        version = selectors.ingredient_get_version(self.kwargs.get('slug'))
+        etag = get_etag('ingredient', version['id'], version['updated_at'],
+                        request.get_host())
+        response = get_not_modified_response(request, etag, version['updated_at'])
+        if response is not None:
+            return response
         ingredient = self._get_object()
         serializer = serializers.IngredientDetailOutputSerializer(
             ingredient, context=self.get_serializer_context())
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        return set_validators(Response(data=serializer.data, status=status.HTTP_200_OK),
+                              etag, version['updated_at'])
 
     def put(self, request, *args, **kwargs):
         """ updating ingredient """
@@ -21,11 +21,16 @@ from recipe.services import (
     RemoveIngredientsFromRecipeDto,
     UpdateRecipeIngredientDto,
     UpdateRecipeIngredient,
-
+    ExportIngredientsToNozbeDto,
+    ExportIngredientsToNozbe,
+    UploadRecipePhotosDto,
+    UploadRecipePhotos,
 )
 from .base_views import BaseViewClass
+from mysite.conditional import get_etag, get_not_modified_response, set_validators
 from mysite.drf_pagination import (
     LimitOffsetPagination,
+    CursorPagination,
     get_paginated_response
 )
 
@@ -61,11 +66,16 @@ class RecipesApi(BaseRecipeClass):
     class Pagination(LimitOffsetPagination):
         default_limit = 5
 
+    class CursorPagination(CursorPagination):
+        page_size = 5
+        ordering = ('id', )
+
     def get(self, request, *args, **kwargs):
         recipes = selectors.recipe_list(
             user=request.user, filters=request.query_params)
         return get_paginated_response(
             pagination_class=self.Pagination,
+            cursor_pagination_class=self.CursorPagination,
             serializer_class=serializers.RecipeListOutputSerializer,
             queryset=recipes,
             request=request,
@@ -96,10 +106,16 @@ class RecipeDetailApi(BaseRecipeClass):
     """ API for retreving recipe detail, updating recipe or deleting recipe """
 
     def get(self, request, *args, **kwargs) -> Response:
+        version = selectors.recipe_get_version(request.user, self.kwargs.get('slug'))
+        etag = get_etag('recipe', version['id'], version['updated_at'], request.get_host())
+        response = get_not_modified_response(request, etag, version['updated_at'])
+        if response is not None:
+            return response
         recipe = self._get_object()
         serializer = serializers.RecipeDetailOutputSerializer(
             recipe, context=self.get_serializer_context())
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        return set_validators(Response(data=serializer.data, status=status.HTTP_200_OK),
+                              etag, version['updated_at'])
 
     def put(self, request, *args, **kwargs) -> Response:
         recipe = self._get_object()
@@ -253,6 +269,30 @@ class RecipeIngredientDetailApi(BaseRecipeClass):
         )
 
 
+class RecipePhotosApi(BaseRecipeClass):
+    """ API for uploading recipe photos """
+
+    def get(self, request, *args, **kwargs):
+        recipe = self._get_object()
+        serializer = serializers.RecipePhotoOutputSerializer(
+            recipe.photos.all(), many=True, context=self.get_serializer_context())
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+    def put(self, request, *args, **kwargs):
+        """ replace photos given as multipart files photo1, photo2, photo3.
+        Photos are processed in background, their status and urls of
+        thumbnails are returned by get """
+        recipe = self._get_object()
+        serializer = serializers.RecipePhotosInputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dto = UploadRecipePhotosDto(photos=serializer.validated_data)
+        service = UploadRecipePhotos()
+        service.upload(recipe, dto)
+        headers = {'Location': reverse('recipe:recipe-photos', request=request,
+                                       kwargs={'slug': recipe.slug})}
+        return Response(headers=headers, status=status.HTTP_202_ACCEPTED)
+
+
 class GroupRecipeBaseClass(BaseRecipeClass):
 
     def _get_object(self):
@@ -303,8 +343,45 @@ class RecipeSendIngredientsToNozbe(BaseRecipeClass):
     """ API for sending recipes ingredients to nozbe """
 
     def post(self, request, *args, **kwargs):
-        """ send ingredients to nozbe """
-        if request.data:
-            if selectors.ingredient_send_to_nozbe(request.data):
-                return Response(status=status.HTTP_200_OK)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        """ send ingredients given as list of slugs to nozbe, with
+        ?background=true export is only scheduled """
+        dto = ExportIngredientsToNozbeDto(
+            user=request.user,
+            slugs=request.data if isinstance(request.data, list) else None,
+            background=request.query_params.get('background') == 'true')
+        service = ExportIngredientsToNozbe()
+        export = service.create(dto)
+        if dto.background:
+            response_status = status.HTTP_202_ACCEPTED
+        else:
+            export = service.export(export)
+            response_status = status.HTTP_200_OK if export.status == export.DONE \
+                else status.HTTP_207_MULTI_STATUS
+        export = selectors.nozbe_export_get(request.user, export.id)
+        serializer = serializers.NozbeExportOutputSerializer(
+            export, context={'request': request})
+        headers = {'Location': serializer.data['self']}
+        return Response(data=serializer.data, status=response_status, headers=headers)
+
+
+class NozbeExportDetailApi(BaseRecipeClass):
+    """ API for retrieving results of nozbe export """
+
+    def get(self, request, *args, **kwargs):
+        export = selectors.nozbe_export_get(request.user, kwargs.get('pk'))
+        serializer = serializers.NozbeExportOutputSerializer(
+            export, context={'request': request})
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+
+class NozbeExportRetryApi(BaseRecipeClass):
+    """ API for retrying failed nozbe export in background """
+
+    def post(self, request, *args, **kwargs):
+        export = selectors.nozbe_export_get(request.user, kwargs.get('pk'))
+        export = ExportIngredientsToNozbe().retry(export)
+        serializer = serializers.NozbeExportOutputSerializer(
+            export, context={'request': request})
+        headers = {'Location': serializer.data['self']}
+        return Response(data=serializer.data, status=status.HTTP_202_ACCEPTED,
+                        headers=headers)
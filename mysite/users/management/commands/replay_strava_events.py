@@ -0,0 +1,37 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from users.services import handle_strava_webhook_event
+
+
+class Command(BaseCommand):
+    """ feed recorded strava webhook events, given as json list or one event
+    per line, to the same handler webhook endpoint uses """
+
+    help = 'Replay recorded Strava webhook events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path']) as file:
+                content = file.read()
+        except OSError as e:
+            raise CommandError(str(e))
+        try:
+            events = json.loads(content)
+        except ValueError:
+            events = [json.loads(line) for line in content.splitlines() if line.strip()]
+        if isinstance(events, dict):
+            events = [events]
+        replayed = 0
+        for event in events:
+            try:
+                handle_strava_webhook_event(event)
+                replayed += 1
+            except ValidationError as e:
+                self.stderr.write(f'Skipped event {event}: {e.messages[0]}')
+        self.stdout.write(self.style.SUCCESS(f'Replayed {replayed} strava events'))
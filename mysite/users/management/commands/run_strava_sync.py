@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mysite import settings
+from users.services import (
+    refresh_expiring_strava_tokens, run_strava_activity_fetches, run_strava_sync_jobs, run_strava_backfills
+)
+
+
+class Command(BaseCommand):
+    """ worker processing activities queued by strava webhook and scheduled
+    synchronization jobs, backfills are processed only when there are no
+    more due synchronization jobs. Expiring tokens are refreshed every
+    STRAVA_TOKEN_REFRESH_INTERVAL seconds """
+
+    help = 'Process queued Strava activities, synchronization jobs and backfills'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--sleep', type=float, default=5,
+                            help='seconds to wait when there are no due jobs')
+        parser.add_argument('--once', action='store_true',
+                            help='process due jobs and exit')
+
+    def handle(self, *args, **options):
+        refreshed_at = 0
+        while True:
+            if time.time() - refreshed_at >= settings.STRAVA_TOKEN_REFRESH_INTERVAL:
+                refreshed, failed = refresh_expiring_strava_tokens()
+                if refreshed or failed:
+                    self.stdout.write(
+                        f'Refreshed {refreshed} strava tokens, {failed} failed')
+                refreshed_at = time.time()
+            fetched = run_strava_activity_fetches(limit=options['batch_size'])
+            if fetched:
+                self.stdout.write(f'Fetched {fetched} queued strava activities')
+            processed = run_strava_sync_jobs(limit=options['batch_size'])
+            if processed:
+                self.stdout.write(f'Processed {processed} strava sync jobs')
+            if processed < options['batch_size']:
+                backfills = run_strava_backfills()
+                if backfills:
+                    self.stdout.write(f'Processed {backfills} strava backfills')
+                processed += backfills
+            processed = max(processed, fetched)
+            if options['once']:
+                return
+            if processed < options['batch_size']:
+                time.sleep(options['sleep'])
@@ -0,0 +1,36 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from mysite import settings
+from users.services import schedule_strava_backfill
+
+
+class Command(BaseCommand):
+    """ schedule import of strava activities history of given user """
+
+    help = 'Schedule Strava activities backfill for user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('--start', type=datetime.date.fromisoformat,
+                            help='first day, defaults to STRAVA_BACKFILL_DAYS ago')
+        parser.add_argument('--end', type=datetime.date.fromisoformat,
+                            help='last day, defaults to today')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError('User does not exist')
+        end = options['end'] or datetime.date.today()
+        start = options['start'] or end - datetime.timedelta(
+            days=settings.STRAVA_BACKFILL_DAYS)
+        try:
+            backfill = schedule_strava_backfill(user, start, end)
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+        self.stdout.write(self.style.SUCCESS(
+            f'Scheduled backfill {backfill.id} from {start} to {end}'))
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.7 on 2026-10-17 12:09
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0041_auto_20211128_1401'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StravaSyncJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('P', 'pending'), ('R', 'running'), ('D', 'done'), ('F', 'failed')], default='P', max_length=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=datetime.datetime.now)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='strava_sync_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stravasyncjob',
+            index=models.Index(fields=['status', 'run_after'], name='users_strav_status_ad69c3_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stravasyncjob',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='unique_user_date_strava_sync'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.7 on 2026-10-17 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0042_auto_20261017_1209'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StravaRateBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='stravasyncjob',
+            name='users_strav_status_ad69c3_idx',
+        ),
+        migrations.AddField(
+            model_name='stravasyncjob',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'interactive'), (1, 'backfill')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='stravasyncjob',
+            index=models.Index(fields=['status', 'priority', 'run_after'], name='users_strav_status_abc3d4_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.7 on 2026-10-17 12:15
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0043_auto_20261017_1213'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StravaBackfill',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('page', models.PositiveIntegerField(default=1)),
+                ('imported', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('P', 'pending'), ('R', 'running'), ('D', 'done'), ('F', 'failed')], default='P', max_length=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=datetime.datetime.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='strava_backfills', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stravabackfill',
+            index=models.Index(fields=['status', 'run_after'], name='users_strav_status_245fad_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.1.7 on 2026-10-17 12:18
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0044_auto_20261017_1215'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stravaapi',
+            name='athlete_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='StravaActivityFetch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('strava_id', models.PositiveBigIntegerField(unique=True)),
+                ('event_time', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('P', 'pending'), ('R', 'running'), ('D', 'done'), ('F', 'failed')], default='P', max_length=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=datetime.datetime.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='strava_activity_fetches', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stravaactivityfetch',
+            index=models.Index(fields=['status', 'run_after'], name='users_strav_status_781317_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.7 on 2026-10-17 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0045_auto_20261017_1218'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stravaapi',
+            name='last_refresh_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='stravaapi',
+            name='refresh_failures',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='stravaapi',
+            name='expires_at',
+            field=models.PositiveIntegerField(db_index=True, default=0, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-17 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0046_auto_20261017_1221'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stravaactivity',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-17 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0048_auto_20261017_1314'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='membership_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -67,6 +67,8 @@ class MyUser(AbstractBaseUser, PermissionsMixin):
     weight = models.PositiveSmallIntegerField(null=True)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # changed with group membership, part of key of data cached for it
+    membership_version = models.PositiveIntegerField(default=0)
 
     USERNAME_FIELD = 'email'
     EMAIL_FIELD = 'email'
@@ -96,8 +98,11 @@ class StravaApi(models.Model):
                                 null=False, related_name='strava')
     access_token = models.CharField(max_length=255)
     refresh_token = models.CharField(max_length=255)
-    expires_at = models.PositiveIntegerField(null=True, default=0)
+    expires_at = models.PositiveIntegerField(null=True, default=0, db_index=True)
     last_request_epoc_time = models.FloatField(default=0, null=False)
+    athlete_id = models.PositiveBigIntegerField(null=True, blank=True, unique=True)
+    refresh_failures = models.PositiveSmallIntegerField(default=0)
+    last_refresh_error = models.TextField(blank=True)
 
     def __str__(self):
         return str(self.user) + str(self.expires_at)
@@ -113,6 +118,7 @@ class StravaActivity(models.Model):
     strava_id = models.PositiveBigIntegerField(unique=True, null=False)
     name = models.CharField(max_length=255, null=True)
     calories = models.PositiveIntegerField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -127,6 +133,8 @@ class GroupManager(models.Manager):
         instance.name = instance.founder.name + "'s group"
         instance.members.add(instance.founder)
         instance.save()
+        from users.services.group_services import invalidate_visible_recipe_owners
+        invalidate_visible_recipe_owners(instance.founder)
         return instance
 
 
@@ -146,3 +154,124 @@ class Group(models.Model):
 
     def __str__(self):
         return self.founder.name + 's group'
+
+
+class StravaSyncJob(models.Model):
+    """ synchronization of user strava activities for given date, processed
+    in background by run_strava_sync command """
+
+    PENDING = 'P'
+    RUNNING = 'R'
+    DONE = 'D'
+    FAILED = 'F'
+    STATUS_CHOICE = [
+        (PENDING, 'pending'),
+        (RUNNING, 'running'),
+        (DONE, 'done'),
+        (FAILED, 'failed')
+    ]
+    INTERACTIVE = 0
+    BACKFILL = 1
+    PRIORITY_CHOICE = [
+        (INTERACTIVE, 'interactive'),
+        (BACKFILL, 'backfill')
+    ]
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, null=False,
+                             related_name='strava_sync_jobs')
+    date = models.DateField()
+    status = models.CharField(max_length=1, choices=STATUS_CHOICE,
+                              default=PENDING)
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICE,
+                                                default=INTERACTIVE)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=datetime.datetime.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'],
+                                    name='unique_user_date_strava_sync')
+        ]
+        indexes = [
+            models.Index(fields=['status', 'priority', 'run_after'])
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.date} {self.get_status_display()}'
+
+
+class StravaBackfill(models.Model):
+    """ import of user strava activities started between start and end date,
+    page is the checkpoint of athlete activities list to resume from """
+
+    PENDING = StravaSyncJob.PENDING
+    RUNNING = StravaSyncJob.RUNNING
+    DONE = StravaSyncJob.DONE
+    FAILED = StravaSyncJob.FAILED
+    STATUS_CHOICE = StravaSyncJob.STATUS_CHOICE
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, null=False,
+                             related_name='strava_backfills')
+    start_date = models.DateField()
+    end_date = models.DateField()
+    page = models.PositiveIntegerField(default=1)
+    imported = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICE,
+                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=datetime.datetime.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'])
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.start_date} - {self.end_date} {self.get_status_display()}'
+
+
+class StravaActivityFetch(models.Model):
+    """ fetch of strava activity details queued by webhook event, there is
+    one row per activity so duplicated events are merged """
+
+    PENDING = StravaSyncJob.PENDING
+    RUNNING = StravaSyncJob.RUNNING
+    DONE = StravaSyncJob.DONE
+    FAILED = StravaSyncJob.FAILED
+    STATUS_CHOICE = StravaSyncJob.STATUS_CHOICE
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, null=False,
+                             related_name='strava_activity_fetches')
+    strava_id = models.PositiveBigIntegerField(unique=True)
+    event_time = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICE,
+                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=datetime.datetime.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'])
+        ]
+
+    def __str__(self):
+        return f'{self.strava_id} {self.get_status_display()}'
+
+
+class StravaRateBucket(models.Model):
+    """ token bucket limiting requests sent to strava, shared by all
+    processes. Tokens are refilled lazily when bucket is acquired """
+
+    key = models.CharField(max_length=50, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField(default=0)
+
+    def __str__(self):
+        return f'{self.key} {self.tokens}'
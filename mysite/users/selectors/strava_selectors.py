@@ -1,22 +1,31 @@
 import datetime
+import logging
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterable
 
 import requests
+from requests.adapters import HTTPAdapter
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
 
 from mysite import settings
-from users.models import StravaActivity, StravaApi
-from users.services import update_activities
+from mysite.metrics import outbound_response_hook
+from users.models import StravaActivity, StravaApi, StravaRateBucket, StravaSyncJob
+
+logger = logging.getLogger(__name__)
+
+STRAVA_ACTIVITY_PROPERTIES = ('name', 'calories', 'date')
 
 
 def get_activity_properties(activity: dict) -> dict:
     """ return only that properties which are needed """
     defaults = {}
-    attributes = ['name', 'calories', 'date']
 
-    for attr in attributes:
+    for attr in STRAVA_ACTIVITY_PROPERTIES:
         try:
             if attr == 'date':
                 date_without_tz = activity['start_date_local'][:-1]
@@ -29,36 +38,120 @@ def get_activity_properties(activity: dict) -> dict:
 
 
 def get_activities(user: get_user_model, date: datetime) -> Iterable[StravaActivity]:
-    """ return strava activities from database """
-    update_activities(user, date)
+    """ return strava activities from database, they are synchronized with
+    strava in background """
     return StravaActivity.objects.filter(user=user, date__date=datetime.date(date.year, date.month, date.day))
 
 
+def get_activities_calories(user: get_user_model,
+                            dates: Iterable[datetime.date] = None) -> dict[datetime.date, int]:
+    """ return sum of calories of stored activities by day, of given days or
+    of all days with activities """
+    activities = StravaActivity.objects.filter(user=user)
+    if dates is not None:
+        activities = activities.filter(date__date__in=list(dates))
+    return {day: calories or 0 for day, calories in activities.annotate(
+        day=TruncDate('date')).order_by().values('day').annotate(
+            calories=Sum('calories')).values_list('day', 'calories')}
+
+
+def get_activities_version(user: get_user_model, date: datetime) -> dict:
+    """ return number of stored activities for given day and latest
+    updated_at of them """
+    return get_activities(user, date).aggregate(
+        count=Count('id'), updated_at=Max('updated_at'))
+
+
+def get_strava_sync_job(user: get_user_model, date: datetime.date) -> StravaSyncJob:
+    """ return synchronization job of user activities for given date or None """
+    return StravaSyncJob.objects.filter(user=user, date=date).first()
+
+
+def is_strava_sync_due(job: StravaSyncJob) -> bool:
+    """ check if finished job is older than STRAVA_SYNC_INTERVAL """
+    if job.status not in (StravaSyncJob.DONE, StravaSyncJob.FAILED):
+        return False
+    synced_at = job.last_synced_at or job.run_after
+    interval = datetime.timedelta(seconds=settings.STRAVA_SYNC_INTERVAL)
+    return datetime.datetime.now() - synced_at > interval
+
+
+def get_strava_budget_buckets(user: get_user_model = None) -> dict[str, tuple[float, float]]:
+    """ return (capacity, refill per second) of application buckets and,
+    if user is given, of user bucket. Bucket holding half of limit and
+    refilling the rest over window never lets more than limit requests
+    through in any window """
+    limits = dict(settings.STRAVA_RATE_LIMITS)
+    if user is not None:
+        limits[f'user-{user.id}'] = settings.STRAVA_USER_RATE_LIMIT
+    return {
+        key: (limit * settings.STRAVA_BUDGET_BURST,
+              limit * (1 - settings.STRAVA_BUDGET_BURST) / period)
+        for key, (limit, period) in limits.items()
+    }
+
+
+def get_strava_bucket_tokens(bucket: StravaRateBucket, capacity: float,
+                             rate: float, now: float) -> float:
+    """ return tokens available in bucket at given time """
+    if bucket is None:
+        return capacity
+    return min(capacity, bucket.tokens + (now - bucket.updated_at) * rate)
+
+
+def get_strava_remaining_budget(user: get_user_model = None) -> dict[str, int]:
+    """ return number of requests which can be sent now from every bucket """
+    buckets = get_strava_budget_buckets(user)
+    stored = StravaRateBucket.objects.in_bulk(buckets.keys(), field_name='key')
+    now = time.time()
+    return {key: max(int(get_strava_bucket_tokens(stored.get(key), capacity, rate, now)), 0)
+            for key, (capacity, rate) in buckets.items()}
+
+
 def get_strava_last_request_epoc_time(user: get_user_model) -> int:
     """ return last request time in epoc format """
     return user.strava.last_request_epoc_time
 
 
 def get_activities_from_strava(user: get_user_model, date: datetime = datetime.date.today()) -> list[dict]:
+    """ return list of user activities started at given day """
+    return get_athlete_activities_from_strava(user, date, date)
+
+
+def get_date_epoch_timestamp(date: datetime.date) -> int:
+    """ return epoch timestamp of the beginning of given day """
+    return int(time.mktime(time.strptime(date.strftime('%Y-%m-%d'), '%Y-%m-%d')))
 
+
+def get_athlete_activities_from_strava(user: get_user_model, start_date: datetime.date,
+                                       end_date: datetime.date, page: int = None,
+                                       per_page: int = None) -> list[dict]:
+    """ return page of activities started between start and end date,
+    both inclusive. None is returned when request could not be sent """
     one_day_in_seconds = 86400
-    after_epoch_timestamp = int(time.mktime(
-        time.strptime(date.strftime('%Y-%m-%d'), '%Y-%m-%d')))
-    before_epoch_timestamp = after_epoch_timestamp + one_day_in_seconds
     params = [
-        f'after={after_epoch_timestamp}',
-        f'before={before_epoch_timestamp}',
+        f'after={get_date_epoch_timestamp(start_date)}',
+        f'before={get_date_epoch_timestamp(end_date) + one_day_in_seconds}',
     ]
+    if page:
+        params += [f'page={page}', f'per_page={per_page}']
 
     strava_obj = user.strava
     if can_request_be_send(strava_obj):
         url = prepare_strava_request_url(id=None, params=params)
-        access_token = user.strava.access_token
         header = prepare_authorization_header(strava_obj)
         return process_request(strava_obj, url, header, 'GET')
     return None
 
 
+def get_strava_ids_not_stored(ids: Iterable[int]) -> list[int]:
+    """ return ids of strava activities which are not saved yet """
+    ids = list(dict.fromkeys(ids))
+    stored = set(StravaActivity.objects.filter(
+        strava_id__in=ids).values_list('strava_id', flat=True))
+    return [id for id in ids if id not in stored]
+
+
 def can_request_be_send(strava_obj: StravaApi) -> bool:
     """ check whether request can be send with available inforamtions """
     return is_token_valid(strava_obj) or has_needed_information_for_request(strava_obj) and get_new_strava_access_token(strava_obj)
@@ -94,6 +187,7 @@ def get_new_strava_access_token(strava_obj: StravaApi) -> bool:
             strava_obj.access_token = res['access_token']
             strava_obj.refresh_token = res['refresh_token']
             strava_obj.expires_at = res['expires_at']
+            strava_obj.refresh_failures = 0
             strava_obj.save()
             return True
         except KeyError:
@@ -101,6 +195,44 @@ def get_new_strava_access_token(strava_obj: StravaApi) -> bool:
     return False
 
 
+def get_strava_connections_to_refresh(horizon: int = None, limit: int = None) -> list[StravaApi]:
+    """ return connections whose access token expires within horizon seconds,
+    soonest first. Connections which failed to refresh too many times are
+    left to inline refresh """
+    horizon = settings.STRAVA_TOKEN_REFRESH_HORIZON if horizon is None else horizon
+    limit = limit or settings.STRAVA_TOKEN_REFRESH_BATCH
+    return list(StravaApi.objects.filter(
+        expires_at__lt=time.time() + horizon,
+        refresh_failures__lt=settings.STRAVA_TOKEN_REFRESH_MAX_FAILURES,
+    ).exclude(refresh_token='').order_by('expires_at')[:limit])
+
+
+def request_strava_token_refresh(refresh_token: str) -> dict:
+    """ exchange refresh token for new tokens, without touching database so
+    it can run in worker threads. Raise ValidationError on failure """
+    try:
+        client_id, client_secret = get_environ_variables()
+    except KeyError:
+        raise ValidationError('Strava client credentials are not configured')
+    payload = {
+        'client_id': client_id,
+        'client_secret': client_secret,
+        'refresh_token': refresh_token,
+        'grant_type': 'refresh_token'
+    }
+    try:
+        response = get_strava_session().post(settings.STRAVA_AUTH_URL, data=payload,
+                                             timeout=settings.STRAVA_REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        raise ValidationError(f'Strava token refresh failed: {e}')
+    if response.status_code != 200:
+        raise ValidationError(f'Strava token refresh failed: {response.status_code}')
+    res = response.json()
+    if not all(attr in res for attr in ('access_token', 'refresh_token', 'expires_at')):
+        raise ValidationError('Strava token refresh response is incomplete')
+    return res
+
+
 def get_environ_variables() -> tuple:
     """ return enviromental variables needed for strava authentication """
     return os.environ['STRAVA_CLIENT_ID'], os.environ['STRAVA_CLIENT_SECRET']
@@ -112,36 +244,88 @@ def process_request(strava_obj: StravaApi, url: str, payload: dict, type: str) -
     strava_obj.last_request_epoc_time = time.time()
     strava_obj.save()
 
-    if type == 'GET':
-        response = send_get_request_to_strava(url, payload)
-    else:
-        response = send_post_request_to_strava(url, payload=payload)
-    if response:
-        if response.status_code == 200:
-            return response.json()
+    try:
+        if type == 'GET':
+            response = send_get_request_to_strava(url, payload)
         else:
-            print(response.json())
+            response = send_post_request_to_strava(url, payload=payload)
+    except requests.RequestException as e:
+        logger.warning('Strava %s request failed: %s', type, e)
+        return None
+    if response.status_code == 200:
+        return response.json()
+    logger.warning('Strava %s request failed: %s %s', type, response.status_code,
+                   response.text)
     return None
 
 
+_session = None
+
+
+def get_strava_session() -> requests.Session:
+    """ return keep-alive session shared by all strava requests, its
+    connection pool is large enough for every fetching worker """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=settings.STRAVA_MAX_WORKERS)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.hooks['response'].append(outbound_response_hook('strava'))
+        _session = session
+    return _session
+
+
+def fetch_strava_activities_details(strava_obj: StravaApi, ids: Iterable[int],
+                                    max_workers: int = None) -> dict[int, dict]:
+    """ fetch details of activities with given strava ids concurrently, on
+    bounded pool of workers. Return details keyed by strava id, activities
+    which could not be fetched are omitted """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return {}
+    strava_obj.last_request_epoc_time = time.time()
+    strava_obj.save(update_fields=['last_request_epoc_time'])
+    header = prepare_authorization_header(strava_obj)
+    session = get_strava_session()
+
+    def fetch(id: int) -> dict:
+        try:
+            response = session.get(prepare_strava_request_url(id=id), headers=header,
+                                   timeout=settings.STRAVA_REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            logger.warning('Fetching strava activity %s failed: %s', id, e)
+            return None
+        if response.status_code == 200:
+            return response.json()
+        logger.warning('Fetching strava activity %s failed: %s', id, response.status_code)
+        return None
+
+    workers = min(max_workers or settings.STRAVA_MAX_WORKERS, len(ids))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        details = dict(zip(ids, executor.map(fetch, ids)))
+    return {id: activity for id, activity in details.items() if activity}
+
+
 def send_get_request_to_strava(url: str, payload: dict) -> requests:
-    """ send request to strava based on parameters """
-    print("GET Request has been sent")
-    return requests.get(url, headers=payload)
+    """ send request to strava based on parameters, on shared session """
+    return get_strava_session().get(url, headers=payload,
+                                    timeout=settings.STRAVA_REQUEST_TIMEOUT)
 
 
 def send_post_request_to_strava(url: str, payload: dict) -> requests:
-    """ send request to strava based on parameters """
-    print("POST Request has been sent")
-    return requests.post(url, payload)
+    """ send request to strava based on parameters, on shared session """
+    return get_strava_session().post(url, payload,
+                                     timeout=settings.STRAVA_REQUEST_TIMEOUT)
 
 
 def prepare_strava_request_url(id: int, params: list = None) -> str:
     """ prepare strava url for request """
     if id:
-        url = f'https://www.strava.com/api/v3/activities/{id}'
+        url = f'{settings.STRAVA_API_URL}/activities/{id}'
     else:
-        url = 'https://www.strava.com/api/v3/athlete/activities?'
+        url = f'{settings.STRAVA_API_URL}/athlete/activities?'
         for param in params:
             url += param + '&'
     return url
@@ -2,10 +2,14 @@ from itertools import chain
 from typing import Iterable
 
 from django.contrib.auth import get_user_model, authenticate
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 
 from users.models import Group
 
+VISIBLE_RECIPE_OWNERS_CACHE_KEY = 'users:visible-recipe-owners:{}:{}'
+VISIBLE_RECIPE_OWNERS_CACHE_TIMEOUT = 60 * 60
+
 
 def user_authenticate(email: str, password: str) -> get_user_model:
     user = authenticate(username=email, password=password)
@@ -48,6 +52,18 @@ def group_get_membership(user: get_user_model) -> Iterable[Group]:
     return user.membership.all().prefetch_related('founder', 'members')
 
 
+def group_get_visible_recipe_owners(user: get_user_model) -> dict[int, int]:
+    """ return founders ids keyed by ids of groups user is member of. Recipes
+    of those founders are visible for user. Result is cached under version
+    of user membership, so change of membership is seen by every process """
+    key = VISIBLE_RECIPE_OWNERS_CACHE_KEY.format(user.id, user.membership_version)
+    owners = cache.get(key)
+    if owners is None:
+        owners = dict(user.membership.values_list('id', 'founder_id'))
+        cache.set(key, owners, VISIBLE_RECIPE_OWNERS_CACHE_TIMEOUT)
+    return owners
+
+
 def group_retrieve_founders(groups: list[Group]) -> int:
     """ retrieve gorups founders """
     return [user for user in groups.values_list('founder', flat=True)]
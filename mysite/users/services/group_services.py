@@ -1,11 +1,26 @@
 from dataclasses import dataclass
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db.models import F
 
 from users import selectors
 
 
+def invalidate_visible_recipe_owners(*users: get_user_model) -> None:
+    """ change membership version of users whose membership changed, recipe
+    owners visible for them are no longer read from cache of any process.
+    Entry of new version is dropped too, it could be left by deleted user
+    whose id was reused """
+    get_user_model().objects.filter(id__in=[user.id for user in users]).update(
+        membership_version=F('membership_version') + 1)
+    for user in users:
+        user.refresh_from_db(fields=['membership_version'])
+    cache.delete_many([selectors.VISIBLE_RECIPE_OWNERS_CACHE_KEY.format(
+        user.id, user.membership_version) for user in users])
+
+
 @dataclass
 class SendGroupInvitationDto:
     user_id: int
@@ -38,6 +53,7 @@ class AcceptGroupInvitation:
                 f'You were not invited to group with id {dto.group_id}')
         user.membership.add(dto.group_id)
         user.pending_membership.remove(dto.group_id)
+        invalidate_visible_recipe_owners(user)
 
 
 @dataclass
@@ -48,6 +64,7 @@ class DenyGroupInvitationDto(AcceptGroupInvitationDto):
 class DenyGroupInvitation:
     def deny(self, user: get_user_model, dto: DenyGroupInvitationDto) -> None:
         user.pending_membership.remove(dto.group_id)
+        invalidate_visible_recipe_owners(user)
 
 
 @dataclass
@@ -60,3 +77,4 @@ class LeaveGroup:
         if user.own_group.id == dto.group_id:
             raise ValidationError('You cannot leave your own group!')
         user.membership.remove(dto.group_id)
+        invalidate_visible_recipe_owners(user)
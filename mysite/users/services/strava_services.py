@@ -1,10 +1,19 @@
-import time
 import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
 
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
 
+from health.services import UpdateDiaryBurnedCalories, UpdateDiaryBurnedCaloriesDto
 from users import selectors
-from users.models import StravaActivity, StravaApi
+from users.models import (
+    StravaActivity, StravaApi, StravaSyncJob, StravaRateBucket, StravaBackfill,
+    StravaActivityFetch
+)
 from mysite import settings
 
 
@@ -29,43 +38,423 @@ def authorize_to_strava(user: get_user_model, strava_code: str) -> bool:
         if all(attr in res for attr in important_auth_data.keys()):
             for data in important_auth_data.keys():
                 setattr(strava_obj, data, res[data])
+            strava_obj.athlete_id = res.get('athlete', {}).get('id')
+            strava_obj.refresh_failures = 0
             strava_obj.save()
+            schedule_strava_history_backfill(user)
             return True
         return False
 
 
-def update_activities(user: get_user_model, date: datetime) -> None:
-    """ get list of activities from strava for given day
-    and add every new activities for db"""
-    now = time.time()
-    hour = 3600
-    raw_strava_activities = []
-    if now - selectors.get_strava_last_request_epoc_time(user=user) > hour:
-        raw_strava_activities = selectors.get_activities_from_strava(
-            user=user, date=date)
-        process_and_save_strava_activities(user, raw_strava_activities)
-    else:
-        print('To many request try again soon. One request per hour is permitted')
-
-
 def process_and_save_strava_activities(user: get_user_model, raw_strava_activities: list) -> None:
     """ convert raw activities into StravaActivity objects
     """
     if raw_strava_activities and isinstance(raw_strava_activities, list):
-        activity_objects = []
-        for activity in raw_strava_activities:
-            strava_id = activity.get('id', None)
-            if not strava_id:
-                continue
-            url = selectors.prepare_strava_request_url(id=strava_id)
-            header = selectors.prepare_authorization_header(
-                strava_obj=user.strava)
-            strava_activity = selectors.process_request(
-                user.strava, url, header, 'GET')
-            if strava_activity:
-                defaults = selectors.get_activity_properties(strava_activity)
-                obj, created = StravaActivity.objects.update_or_create(
-                    strava_id=strava_id, user=user, **defaults)
-                activity_objects.append(obj)
-        return activity_objects
+        ids = [activity.get('id') for activity in raw_strava_activities
+               if activity.get('id')]
+        details = selectors.fetch_strava_activities_details(user.strava, ids)
+        return save_strava_activities(user, details)
     return None
+
+
+def save_strava_activities(user: get_user_model, details: dict[int, dict]) -> list[StravaActivity]:
+    """ insert or update activities, given as details keyed by strava id,
+    with bulk queries. Burned calories of diaries of previous and new days
+    of activities are updated """
+    activities = {id: StravaActivity(user=user, strava_id=id,
+                                     **selectors.get_activity_properties(activity))
+                  for id, activity in details.items()}
+    existing = {strava_id: (id, date) for strava_id, id, date in StravaActivity.objects.filter(
+        strava_id__in=activities.keys()).values_list('strava_id', 'id', 'date')}
+    now = datetime.datetime.now()
+    for strava_id, (id, _) in existing.items():
+        activities[strava_id].id = id
+        activities[strava_id].updated_at = now
+    StravaActivity.objects.bulk_update(
+        [activity for activity in activities.values() if activity.id],
+        selectors.STRAVA_ACTIVITY_PROPERTIES + ('updated_at', ))
+    StravaActivity.objects.bulk_create(
+        [activity for activity in activities.values() if not activity.id])
+    dates = {date.date() for _, date in existing.values()}
+    dates.update(date.date() for date in StravaActivity.objects.filter(
+        strava_id__in=activities.keys()).values_list('date', flat=True))
+    update_diary_burned_calories(user, dates)
+    return list(activities.values())
+
+
+def update_diary_burned_calories(user: get_user_model,
+                                 dates: Iterable[datetime.date]) -> None:
+    """ store sum of calories of activities of given days in health diary """
+    dates = set(dates)
+    burned = selectors.get_activities_calories(user, dates)
+    for date in sorted(dates):
+        UpdateDiaryBurnedCalories().update(UpdateDiaryBurnedCaloriesDto(
+            user=user, date=date, burned_calories=burned.get(date, 0)))
+
+
+def schedule_strava_sync(user: get_user_model, date: datetime.date) -> StravaSyncJob:
+    """ schedule synchronization of user activities for given date. Only one
+    job exists for user and date, finished job is rescheduled when it is older
+    than STRAVA_SYNC_INTERVAL. Job is written only when it is created or
+    rescheduled, so it is cheap to call on every read of diary. Return None
+    if user is not connected to strava or date is in the future """
+    if date > datetime.date.today() or not selectors.is_auth_to_strava(user):
+        return None
+    job = selectors.get_strava_sync_job(user, date)
+    if job is None:
+        try:
+            with transaction.atomic():
+                return StravaSyncJob.objects.create(user=user, date=date)
+        except IntegrityError:
+            job = StravaSyncJob.objects.get(user=user, date=date)
+    if selectors.is_strava_sync_due(job):
+        finished = job.status
+        job.status = StravaSyncJob.PENDING
+        job.attempts = 0
+        job.run_after = datetime.datetime.now()
+        StravaSyncJob.objects.filter(id=job.id, status=finished).update(
+            status=job.status, attempts=job.attempts, run_after=job.run_after)
+    return job
+
+
+def acquire_strava_budget(user: get_user_model, tokens: int = 1,
+                          interactive: bool = True) -> float:
+    """ take tokens from application and user buckets, from all of them or
+    from none. Backfills can not use reserve kept for interactive requests,
+    request bigger than bucket is let through when bucket is full. Return 0
+    if budget was granted, otherwise seconds after which it can be granted """
+    buckets = selectors.get_strava_budget_buckets(user)
+    reserve = 0 if interactive else settings.STRAVA_BUDGET_INTERACTIVE_RESERVE
+    with transaction.atomic():
+        now = time.time()
+        StravaRateBucket.objects.bulk_create(
+            [StravaRateBucket(key=key, tokens=capacity, updated_at=now)
+             for key, (capacity, rate) in buckets.items()],
+            ignore_conflicts=True)
+        stored = StravaRateBucket.objects.select_for_update().filter(
+            key__in=buckets.keys()).order_by('key')
+        wait = 0
+        for bucket in stored:
+            capacity, rate = buckets[bucket.key]
+            bucket.tokens = selectors.get_strava_bucket_tokens(
+                bucket, capacity, rate, now)
+            bucket.updated_at = now
+            needed = min(tokens + capacity * reserve, capacity)
+            if bucket.tokens < needed:
+                wait = max(wait, (needed - bucket.tokens) / rate)
+        if wait:
+            return wait
+        for bucket in stored:
+            bucket.tokens -= tokens
+        StravaRateBucket.objects.bulk_update(stored, ['tokens', 'updated_at'])
+    return 0
+
+
+def check_strava_budget(user: get_user_model, tokens: int, interactive: bool) -> None:
+    """ acquire strava budget or raise ValidationError telling when to retry """
+    wait = acquire_strava_budget(user, tokens, interactive)
+    if wait:
+        raise ValidationError('Strava rate limit budget exceeded',
+                              code='strava_budget', params={'retry_after': wait})
+
+
+def sync_strava_activities(user: get_user_model, date: datetime.date,
+                           interactive: bool = True) -> None:
+    """ download and save user activities for given date, requests are sent
+    only if strava budget allows it """
+    check_strava_budget(user, 1, interactive)
+    raw_strava_activities = selectors.get_activities_from_strava(
+        user=user, date=date)
+    if raw_strava_activities is None:
+        raise ValidationError('Strava activities could not be fetched')
+    if raw_strava_activities:
+        check_strava_budget(user, len(raw_strava_activities), interactive)
+    process_and_save_strava_activities(user, raw_strava_activities)
+
+
+def claim_strava_tasks(model: type, limit: int, ordering: tuple) -> Iterable[int]:
+    """ yield ids of pending sync jobs or backfills which are due, and of
+    running ones whose worker crashed and did not finish them within
+    STRAVA_TASK_LEASE. Every one is claimed with conditional update so many
+    workers can run at the same time """
+    now = datetime.datetime.now()
+    claimable = (
+        Q(status=model.PENDING, run_after__lte=now)
+        | Q(status=model.RUNNING,
+            claimed_at__lt=now - datetime.timedelta(seconds=settings.STRAVA_TASK_LEASE))
+    )
+    due = model.objects.filter(claimable).order_by(*ordering).values_list(
+        'id', flat=True)[:limit]
+    for id in due:
+        if model.objects.filter(claimable, id=id).update(
+                status=model.RUNNING, claimed_at=now):
+            yield id
+
+
+def reschedule_failed_strava_task(task: StravaSyncJob | StravaBackfill | StravaActivityFetch,
+                                  error: Exception) -> None:
+    """ retry task with exponential backoff until STRAVA_SYNC_MAX_ATTEMPTS is
+    reached. Task postponed because of exhausted strava budget does not use
+    its attempts """
+    task.status = task.PENDING
+    if isinstance(error, ValidationError) and error.code == 'strava_budget':
+        delay = error.params['retry_after']
+    else:
+        task.attempts += 1
+        task.last_error = str(error)
+        delay = settings.STRAVA_SYNC_BACKOFF * 2 ** (task.attempts - 1)
+        if task.attempts >= settings.STRAVA_SYNC_MAX_ATTEMPTS:
+            task.status = task.FAILED
+    task.run_after = datetime.datetime.now() + datetime.timedelta(seconds=delay)
+
+
+def run_strava_sync_jobs(limit: int = 10) -> int:
+    """ process pending jobs which are due, return number of processed jobs """
+    processed = 0
+    for id in claim_strava_tasks(StravaSyncJob, limit, ('priority', 'run_after')):
+        process_strava_sync_job(
+            StravaSyncJob.objects.select_related('user__strava').get(id=id))
+        processed += 1
+    return processed
+
+
+def process_strava_sync_job(job: StravaSyncJob) -> None:
+    """ run synchronization and save its result """
+    try:
+        sync_strava_activities(job.user, job.date,
+                               interactive=job.priority == StravaSyncJob.INTERACTIVE)
+    except Exception as e:
+        reschedule_failed_strava_task(job, e)
+    else:
+        job.attempts += 1
+        job.status = StravaSyncJob.DONE
+        job.last_synced_at = datetime.datetime.now()
+        job.last_error = ''
+    job.save()
+
+
+def schedule_strava_backfill(user: get_user_model, start_date: datetime.date,
+                             end_date: datetime.date) -> StravaBackfill:
+    """ schedule import of user activities started between given dates """
+    if start_date > end_date:
+        raise ValidationError('Start date can not be later than end date')
+    if not selectors.is_auth_to_strava(user):
+        raise ValidationError('User is not connected to Strava')
+    return StravaBackfill.objects.create(user=user, start_date=start_date,
+                                         end_date=end_date)
+
+
+def schedule_strava_history_backfill(user: get_user_model) -> StravaBackfill:
+    """ schedule import of user activities of last STRAVA_BACKFILL_DAYS after
+    authorization. Pending or running backfill of user is reused, so
+    re-connecting does not queue overlapping backfills. Its end date is
+    extended to today, start date only when it has not started yet, as
+    activities list is walked from the oldest and earlier start would shift
+    its checkpoint. Range before started backfill is scheduled separately """
+    end_date = datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=settings.STRAVA_BACKFILL_DAYS)
+    with transaction.atomic():
+        backfill = StravaBackfill.objects.select_for_update().filter(
+            user=user, status__in=(StravaBackfill.PENDING, StravaBackfill.RUNNING)
+        ).order_by('-end_date').first()
+        if backfill is None:
+            return schedule_strava_backfill(user, start_date, end_date)
+        if backfill.status == StravaBackfill.PENDING and backfill.page == 1:
+            backfill.start_date = min(backfill.start_date, start_date)
+        elif start_date < backfill.start_date:
+            schedule_strava_backfill(
+                user, start_date, backfill.start_date - datetime.timedelta(days=1))
+        backfill.end_date = max(backfill.end_date, end_date)
+        StravaBackfill.objects.filter(id=backfill.id).update(
+            start_date=backfill.start_date, end_date=backfill.end_date)
+    return backfill
+
+
+def backfill_strava_activities(backfill: StravaBackfill, max_pages: int) -> bool:
+    """ walk athlete activities list page by page, starting from saved
+    checkpoint, and fetch details only of activities which are not stored
+    yet. Return True when the whole date range has been imported """
+    user = backfill.user
+    per_page = settings.STRAVA_BACKFILL_PER_PAGE
+    for _ in range(max_pages):
+        check_strava_budget(user, 1, interactive=False)
+        raw_strava_activities = selectors.get_athlete_activities_from_strava(
+            user, backfill.start_date, backfill.end_date,
+            page=backfill.page, per_page=per_page)
+        if not isinstance(raw_strava_activities, list):
+            raise ValidationError('Strava activities could not be fetched')
+        ids = selectors.get_strava_ids_not_stored(
+            activity['id'] for activity in raw_strava_activities if activity.get('id'))
+        if ids:
+            check_strava_budget(user, len(ids), interactive=False)
+            details = selectors.fetch_strava_activities_details(user.strava, ids)
+            save_strava_activities(user, details)
+            backfill.imported += len(details)
+            if len(details) < len(ids):
+                backfill.save(update_fields=['imported'])
+                raise ValidationError('Some Strava activities could not be fetched')
+        backfill.page += 1
+        backfill.save(update_fields=['page', 'imported'])
+        if len(raw_strava_activities) < per_page:
+            return True
+    return False
+
+
+def run_strava_backfills(limit: int = 1, max_pages: int = None) -> int:
+    """ process pending backfills which are due, every one by at most
+    max_pages pages so backfills take turns. Return number of processed
+    backfills """
+    processed = 0
+    for id in claim_strava_tasks(StravaBackfill, limit, ('run_after',)):
+        backfill = StravaBackfill.objects.select_related('user__strava').get(id=id)
+        try:
+            finished = backfill_strava_activities(
+                backfill, max_pages or settings.STRAVA_BACKFILL_PAGES_PER_RUN)
+        except Exception as e:
+            reschedule_failed_strava_task(backfill, e)
+        else:
+            backfill.attempts = 0
+            backfill.last_error = ''
+            backfill.status = StravaBackfill.DONE if finished else StravaBackfill.PENDING
+        values = {field: getattr(backfill, field)
+                  for field in ('status', 'attempts', 'run_after', 'last_error')}
+        # end date could be extended by re-authorization meanwhile, then the
+        # last page is walked again up to the new end date
+        if not StravaBackfill.objects.filter(
+                id=backfill.id, end_date=backfill.end_date).update(**values):
+            if backfill.status == StravaBackfill.DONE:
+                values.update(status=StravaBackfill.PENDING, page=backfill.page - 1)
+            StravaBackfill.objects.filter(id=backfill.id).update(**values)
+        processed += 1
+    return processed
+
+
+def handle_strava_webhook_event(event: dict) -> None:
+    """ apply strava webhook event. Deleted activities are removed at once,
+    created and updated ones are queued for fetching, deauthorization
+    clears tokens. Events of unknown athletes are ignored, events of other
+    subscriptions are rejected """
+    try:
+        object_type = event['object_type']
+        aspect_type = event['aspect_type']
+        object_id = int(event['object_id'])
+        owner_id = int(event['owner_id'])
+        event_time = int(event.get('event_time', 0))
+    except (KeyError, TypeError, ValueError):
+        raise ValidationError('Invalid Strava event')
+    subscription_id = settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID
+    if not subscription_id or str(event.get('subscription_id')) != str(subscription_id):
+        raise ValidationError('Unknown Strava subscription')
+
+    strava_obj = StravaApi.objects.select_related('user').filter(
+        athlete_id=owner_id).first()
+    if strava_obj is None:
+        return
+    if object_type == 'athlete':
+        if (event.get('updates') or {}).get('authorized') == 'false':
+            strava_obj.access_token = ''
+            strava_obj.refresh_token = ''
+            strava_obj.expires_at = 0
+            strava_obj.save()
+    elif object_type == 'activity':
+        if aspect_type == 'delete':
+            activities = StravaActivity.objects.filter(user=strava_obj.user, strava_id=object_id)
+            dates = [date.date() for date in activities.values_list('date', flat=True)]
+            activities.delete()
+            update_diary_burned_calories(strava_obj.user, dates)
+            StravaActivityFetch.objects.filter(
+                user=strava_obj.user, strava_id=object_id).delete()
+        else:
+            enqueue_strava_activity_fetch(strava_obj.user, object_id, event_time)
+
+
+def enqueue_strava_activity_fetch(user: get_user_model, strava_id: int,
+                                  event_time: int) -> None:
+    """ queue fetch of activity details, redelivered or older event does
+    not queue it again """
+    try:
+        fetch, created = StravaActivityFetch.objects.get_or_create(
+            strava_id=strava_id, defaults={'user': user, 'event_time': event_time})
+    except IntegrityError:
+        fetch, created = StravaActivityFetch.objects.get(strava_id=strava_id), False
+    if not created:
+        StravaActivityFetch.objects.filter(
+            id=fetch.id, event_time__lt=event_time
+        ).update(event_time=event_time, status=StravaActivityFetch.PENDING,
+                 attempts=0, run_after=datetime.datetime.now(), last_error='')
+
+
+def run_strava_activity_fetches(limit: int = 50) -> int:
+    """ fetch details of queued activities, grouped by user, return number
+    of processed fetches. Fetch requeued by newer event while running is
+    left pending """
+    ids = list(claim_strava_tasks(StravaActivityFetch, limit, ('run_after',)))
+    fetches_by_user = {}
+    for fetch in StravaActivityFetch.objects.select_related('user__strava').filter(id__in=ids):
+        fetches_by_user.setdefault(fetch.user_id, []).append(fetch)
+
+    for fetches in fetches_by_user.values():
+        user = fetches[0].user
+        try:
+            check_strava_budget(user, len(fetches), interactive=True)
+            if not selectors.can_request_be_send(user.strava):
+                raise ValidationError('Strava access token could not be refreshed')
+            details = selectors.fetch_strava_activities_details(
+                user.strava, [fetch.strava_id for fetch in fetches])
+            save_strava_activities(user, details)
+        except Exception as e:
+            for fetch in fetches:
+                reschedule_failed_strava_task(fetch, e)
+        else:
+            for fetch in fetches:
+                if fetch.strava_id in details:
+                    fetch.status = StravaActivityFetch.DONE
+                    fetch.last_error = ''
+                else:
+                    reschedule_failed_strava_task(
+                        fetch, ValidationError('Strava activity could not be fetched'))
+        for fetch in fetches:
+            StravaActivityFetch.objects.filter(
+                id=fetch.id, event_time=fetch.event_time
+            ).update(status=fetch.status, attempts=fetch.attempts,
+                     run_after=fetch.run_after, last_error=fetch.last_error)
+    return len(ids)
+
+
+def refresh_expiring_strava_tokens(horizon: int = None, limit: int = None) -> tuple[int, int]:
+    """ refresh tokens expiring within horizon ahead of time, so requests
+    rarely have to refresh them inline. Requests are sent by bounded pool of
+    workers, results are saved only if token was not refreshed meanwhile.
+    Return numbers of refreshed and failed connections """
+    connections = selectors.get_strava_connections_to_refresh(horizon, limit)
+    if not connections:
+        return 0, 0
+
+    def refresh(strava_obj: StravaApi) -> dict | Exception:
+        try:
+            return selectors.request_strava_token_refresh(strava_obj.refresh_token)
+        except ValidationError as e:
+            return e
+
+    workers = min(settings.STRAVA_MAX_WORKERS, len(connections))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(refresh, connections))
+
+    refreshed = failed = 0
+    for strava_obj, res in zip(connections, results):
+        # token could be refreshed meanwhile by request or another worker,
+        # then result of this refresh is stale and is not saved
+        connection = StravaApi.objects.filter(
+            id=strava_obj.id, refresh_token=strava_obj.refresh_token)
+        if isinstance(res, Exception):
+            failed += connection.update(
+                refresh_failures=F('refresh_failures') + 1,
+                last_refresh_error=res.messages[0])
+            continue
+        refreshed += connection.update(
+            access_token=res['access_token'],
+            refresh_token=res['refresh_token'],
+            expires_at=res['expires_at'],
+            refresh_failures=0,
+            last_refresh_error='')
+    return refreshed, failed
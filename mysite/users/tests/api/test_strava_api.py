@@ -8,6 +8,7 @@ from rest_framework import status
 from unittest.mock import patch
 
 from users import selectors
+from users.models import StravaActivityFetch
 
 
 class StravaApiTests(TestCase):
@@ -104,3 +105,79 @@ class StravaApiTests(TestCase):
         self.assertTrue(
             selectors.has_needed_information_for_request(self.auth_user.strava))
         self.assertEqual(res.data['status'], 'Ok')
+
+
+@patch('mysite.settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID', '120475')
+@patch('mysite.settings.STRAVA_WEBHOOK_CALLBACK_TOKEN', 'callback-secret')
+class StravaWebhookApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            name='auth_user',
+            password='testpass'
+        )
+        self.user.strava.athlete_id = 134815
+        self.user.strava.save()
+        self.url = reverse('strava-webhook', kwargs={'token': 'callback-secret'})
+        self.event = {
+            'aspect_type': 'create',
+            'event_time': 1634472000,
+            'object_id': 6123456789,
+            'object_type': 'activity',
+            'owner_id': 134815,
+            'subscription_id': 120475,
+            'updates': {}
+        }
+
+    @patch('mysite.settings.STRAVA_WEBHOOK_VERIFY_TOKEN', 'secret')
+    def test_subscription_validation(self):
+        """ test echoing challenge only for valid verify token """
+        params = {'hub.mode': 'subscribe', 'hub.challenge': '15f7d1a91c1f40f8',
+                  'hub.verify_token': 'secret'}
+        res = self.client.get(self.url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {'hub.challenge': '15f7d1a91c1f40f8'})
+
+        params['hub.verify_token'] = 'wrong'
+        res = self.client.get(self.url, params)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_duplicated_event_queues_single_fetch(self):
+        """ test redelivered event is queued once """
+        for i in range(2):
+            res = self.client.post(self.url, self.event, format='json')
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+        fetch = StravaActivityFetch.objects.get()
+        self.assertEqual(fetch.strava_id, 6123456789)
+        self.assertEqual(fetch.user, self.user)
+
+    def test_event_of_unknown_athlete_is_ignored(self):
+        self.event['owner_id'] = 1
+        res = self.client.post(self.url, self.event, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(StravaActivityFetch.objects.exists())
+
+    def test_event_of_other_subscription_is_rejected(self):
+        self.event['subscription_id'] = 1
+        res = self.client.post(self.url, self.event, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StravaActivityFetch.objects.exists())
+
+    def test_event_with_wrong_callback_token_is_rejected(self):
+        url = reverse('strava-webhook', kwargs={'token': 'guess'})
+        res = self.client.post(url, self.event, format='json')
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(StravaActivityFetch.objects.exists())
+
+    def test_webhook_is_disabled_until_configured(self):
+        for setting in ('STRAVA_WEBHOOK_CALLBACK_TOKEN', 'STRAVA_WEBHOOK_SUBSCRIPTION_ID'):
+            with patch(f'mysite.settings.{setting}', None):
+                res = self.client.post(self.url, self.event, format='json')
+            self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(StravaActivityFetch.objects.exists())
+
+    def test_invalid_event(self):
+        res = self.client.post(self.url, {'object_type': 'activity'}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,4 +1,8 @@
 import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from django.test import TestCase
 from django.contrib.auth import get_user_model
@@ -194,7 +198,7 @@ class ModelTests(TestCase):
         self.assertEqual(selectors.get_activities_from_strava(user),
                          activity)
 
-    @patch('users.selectors.process_request')
+    @patch('users.selectors.fetch_strava_activities_details')
     def test_process_and_save_strava_activities(self, mock):
         """ test process_and_save_strava_activities function """
         user = sample_user()
@@ -212,7 +216,7 @@ class ModelTests(TestCase):
                 'start_date_local': '2019-02-16T06:52:54'
             },
             ]
-        mock.side_effect = [raw_activities[0], raw_activities[1]]
+        mock.return_value = {activity['id']: activity for activity in raw_activities}
         services.process_and_save_strava_activities(user, raw_activities)
         activities = models.StravaActivity.objects.filter(user=user)
         self.assertEqual(activities[0].strava_id,
@@ -235,7 +239,7 @@ class ModelTests(TestCase):
         activities = models.StravaActivity.objects.filter(user=user)
         self.assertEqual(len(activities), 0)
 
-    @patch('users.selectors.process_request')
+    @patch('users.selectors.fetch_strava_activities_details')
     def test_process_and_save_strava_activities_with_key_error(self, mock):
         """ test saving strava acitivities when there is no such key in
         raw_activities, by omiting that value """
@@ -252,8 +256,8 @@ class ModelTests(TestCase):
                 'start_date_local': '2019-02-16T06:52:54'
             },
             ]
-        mock.side_effect = [raw_activities_with_no_calories[0],
-                            raw_activities_with_no_calories[1]]
+        mock.return_value = {activity['id']: activity
+                             for activity in raw_activities_with_no_calories}
         services.process_and_save_strava_activities(
             user, raw_activities_with_no_calories)
         activities = models.StravaActivity.objects.filter(user=user)
@@ -287,3 +291,80 @@ class ModelTests(TestCase):
         activity = models.StravaActivity.objects.create(**payload)
 
         self.assertEqual(str(activity), payload['name'])
+
+
+class FakeStravaHandler(BaseHTTPRequestHandler):
+    """ serve activity details, remembering how many requests were in progress
+    at the same time """
+    lock = threading.Lock()
+    in_progress = 0
+    max_in_progress = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_progress += 1
+            cls.max_in_progress = max(cls.max_in_progress, cls.in_progress)
+        time.sleep(0.05)
+        if self.path.startswith('/athlete/activities'):
+            self.send_response(200)
+            body = [{'id': 1}, {'id': 2}]
+        elif int(self.path.rsplit('/', 1)[-1]) == 404:
+            self.send_response(404)
+            body = {}
+        else:
+            id = int(self.path.rsplit('/', 1)[-1])
+            self.send_response(200)
+            body = {'id': id, 'name': f'activity {id}', 'calories': id * 100,
+                    'start_date_local': '2021-05-01T10:00:00Z'}
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+        with cls.lock:
+            cls.in_progress -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class StravaActivitiesFetchingTests(TestCase):
+
+    def setUp(self) -> None:
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeStravaHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        patcher = patch('mysite.settings.STRAVA_API_URL', url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.user = sample_user()
+
+    def test_fetching_activities_details_concurrently(self) -> None:
+        models.StravaActivity.objects.create(
+            user=self.user, strava_id=1, name='old', calories=1)
+        raw_activities = [{'id': id} for id in (1, 2, 3, 4, 404)]
+
+        with self.assertLogs('users.selectors.strava_selectors', 'WARNING') as logs:
+            services.process_and_save_strava_activities(self.user, raw_activities)
+        self.assertEqual(logs.output, [
+            'WARNING:users.selectors.strava_selectors:'
+            'Fetching strava activity 404 failed: 404'])
+
+        activities = models.StravaActivity.objects.filter(
+            user=self.user).order_by('strava_id')
+        self.assertEqual([activity.strava_id for activity in activities], [1, 2, 3, 4])
+        self.assertEqual(activities[0].name, 'activity 1')
+        self.assertEqual(activities[3].calories, 400)
+        self.assertGreater(FakeStravaHandler.max_in_progress, 1)
+
+    @patch('users.selectors.strava_selectors.is_token_valid')
+    def test_listing_athlete_activities_through_shared_session(self, mock_token) -> None:
+        mock_token.return_value = True
+        session = selectors.get_strava_session()
+
+        with patch.object(session, 'get', wraps=session.get) as get:
+            res = selectors.get_activities_from_strava(self.user)
+
+        self.assertEqual(res, [{'id': 1}, {'id': 2}])
+        get.assert_called_once()
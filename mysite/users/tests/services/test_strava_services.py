@@ -0,0 +1,468 @@
+import datetime
+import os
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+
+from health.models import HealthDiary, HealthAnalytics
+from mysite import settings
+from users.models import (
+    StravaApi, StravaSyncJob, StravaBackfill, StravaActivity, StravaActivityFetch
+)
+from users.selectors import get_strava_remaining_budget, get_strava_connections_to_refresh
+from users.services import (
+    acquire_strava_budget,
+    schedule_strava_sync,
+    run_strava_sync_jobs,
+    schedule_strava_backfill,
+    schedule_strava_history_backfill,
+    run_strava_backfills,
+    handle_strava_webhook_event,
+    run_strava_activity_fetches,
+    refresh_expiring_strava_tokens,
+)
+
+
+class StravaSyncServicesTests(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            name='testname',
+            password='authpass',
+            gender='Male',
+            age=25,
+            height=188,
+            weight=73,
+        )
+        self.today = datetime.date.today()
+
+    def _connect_to_strava(self) -> None:
+        strava = self.user.strava
+        strava.access_token = 'access'
+        strava.refresh_token = 'refresh'
+        strava.expires_at = 123
+        strava.save()
+
+    def test_scheduling_sync_for_user_not_connected_to_strava(self) -> None:
+        self.assertIsNone(schedule_strava_sync(self.user, self.today))
+        self.assertFalse(StravaSyncJob.objects.exists())
+
+    def test_scheduling_sync_twice_creates_single_job(self) -> None:
+        self._connect_to_strava()
+        job = schedule_strava_sync(self.user, self.today)
+        self.assertEqual(schedule_strava_sync(self.user, self.today), job)
+        self.assertEqual(StravaSyncJob.objects.count(), 1)
+        self.assertEqual(job.status, StravaSyncJob.PENDING)
+
+    @patch('users.selectors.get_activities_from_strava')
+    def test_running_sync_jobs_success(self, mock) -> None:
+        self._connect_to_strava()
+        job = schedule_strava_sync(self.user, self.today)
+        mock.return_value = []
+
+        call_command('run_strava_sync', once=True, stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, StravaSyncJob.DONE)
+        self.assertIsNotNone(job.last_synced_at)
+        mock.assert_called_once()
+        self.assertEqual(schedule_strava_sync(self.user, self.today).status,
+                         StravaSyncJob.DONE)
+
+    @patch('users.selectors.get_activities_from_strava')
+    def test_failed_sync_job_is_retried_with_backoff(self, mock) -> None:
+        self._connect_to_strava()
+        job = schedule_strava_sync(self.user, self.today)
+        mock.return_value = None
+
+        self.assertEqual(run_strava_sync_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, StravaSyncJob.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, datetime.datetime.now())
+        self.assertEqual(run_strava_sync_jobs(), 0)
+
+        StravaSyncJob.objects.filter(id=job.id).update(
+            attempts=settings.STRAVA_SYNC_MAX_ATTEMPTS - 1,
+            run_after=datetime.datetime.now())
+        self.assertEqual(run_strava_sync_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, StravaSyncJob.FAILED)
+
+
+    @patch('users.selectors.get_activities_from_strava')
+    def test_running_job_of_crashed_worker_is_claimed_after_lease(self, mock) -> None:
+        self._connect_to_strava()
+        job = schedule_strava_sync(self.user, self.today)
+        mock.return_value = []
+        claimed_at = datetime.datetime.now() - datetime.timedelta(
+            seconds=settings.STRAVA_TASK_LEASE - 60)
+        StravaSyncJob.objects.filter(id=job.id).update(
+            status=StravaSyncJob.RUNNING, claimed_at=claimed_at)
+        self.assertEqual(run_strava_sync_jobs(), 0)
+
+        StravaSyncJob.objects.filter(id=job.id).update(
+            claimed_at=claimed_at - datetime.timedelta(seconds=120))
+        self.assertEqual(run_strava_sync_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, StravaSyncJob.DONE)
+
+    def test_scheduling_sync_for_future_date(self) -> None:
+        self._connect_to_strava()
+        self.assertIsNone(schedule_strava_sync(
+            self.user, self.today + datetime.timedelta(days=1)))
+        self.assertFalse(StravaSyncJob.objects.exists())
+
+
+@patch('mysite.settings.STRAVA_USER_RATE_LIMIT', (20, 900))
+@patch('mysite.settings.STRAVA_RATE_LIMITS', {'app-15min': (100, 900)})
+class StravaBudgetServicesTests(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            name='testname',
+            password='authpass',
+        )
+        self.user_bucket = f'user-{self.user.id}'
+
+    def test_remaining_budget_of_unused_buckets(self) -> None:
+        self.assertEqual(get_strava_remaining_budget(self.user),
+                         {'app-15min': 50, self.user_bucket: 10})
+        self.assertEqual(get_strava_remaining_budget(), {'app-15min': 50})
+
+    def test_acquiring_budget_until_user_bucket_is_empty(self) -> None:
+        self.assertEqual(acquire_strava_budget(self.user, tokens=4), 0)
+        self.assertEqual(acquire_strava_budget(self.user, tokens=6), 0)
+
+        wait = acquire_strava_budget(self.user)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 90)
+        remaining = get_strava_remaining_budget(self.user)
+        self.assertEqual(remaining['app-15min'], 40)
+        self.assertEqual(remaining[self.user_bucket], 0)
+
+    def test_backfill_can_not_use_interactive_reserve(self) -> None:
+        self.assertEqual(acquire_strava_budget(self.user, tokens=8,
+                                               interactive=False), 0)
+        self.assertGreater(acquire_strava_budget(self.user, interactive=False), 0)
+        self.assertEqual(acquire_strava_budget(self.user, tokens=2), 0)
+
+    @patch('users.selectors.get_activities_from_strava')
+    def test_sync_job_postponed_without_budget_keeps_attempts(self, mock) -> None:
+        strava = self.user.strava
+        strava.access_token = 'access'
+        strava.refresh_token = 'refresh'
+        strava.expires_at = 123
+        strava.save()
+        job = schedule_strava_sync(self.user, datetime.date.today())
+        acquire_strava_budget(self.user, tokens=10)
+
+        self.assertEqual(run_strava_sync_jobs(), 1)
+
+        job.refresh_from_db()
+        mock.assert_not_called()
+        self.assertEqual(job.status, StravaSyncJob.PENDING)
+        self.assertEqual(job.attempts, 0)
+        self.assertGreater(job.run_after, datetime.datetime.now())
+
+
+@patch('mysite.settings.STRAVA_BACKFILL_PER_PAGE', 2)
+class StravaBackfillServicesTests(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            name='testname',
+            password='authpass',
+        )
+        strava = self.user.strava
+        strava.access_token = 'access'
+        strava.refresh_token = 'refresh'
+        strava.expires_at = 123
+        strava.save()
+        self.end = datetime.date.today()
+        self.start = self.end - datetime.timedelta(days=365)
+
+    @staticmethod
+    def _details(ids: list) -> dict:
+        return {id: {'id': id, 'name': f'run {id}', 'calories': 100,
+                     'start_date_local': '2021-09-02T10:00:00Z'} for id in ids}
+
+    def test_scheduling_backfill_with_invalid_range(self) -> None:
+        with self.assertRaises(ValidationError):
+            schedule_strava_backfill(self.user, self.end, self.start)
+
+    @patch('users.selectors.fetch_strava_activities_details')
+    @patch('users.selectors.get_athlete_activities_from_strava')
+    def test_backfill_resumes_from_checkpoint_and_skips_stored(self, mock_list,
+                                                               mock_details) -> None:
+        StravaActivity.objects.create(user=self.user, strava_id=2, name='stored')
+        pages = {1: [{'id': 1}, {'id': 2}], 2: [{'id': 3}, {'id': 4}], 3: [{'id': 5}]}
+        mock_list.side_effect = lambda user, start, end, page, per_page: pages[page]
+        mock_details.side_effect = lambda strava, ids: self._details(ids)
+        backfill = schedule_strava_backfill(self.user, self.start, self.end)
+
+        self.assertEqual(run_strava_backfills(max_pages=2), 1)
+        backfill.refresh_from_db()
+        self.assertEqual(backfill.status, StravaBackfill.PENDING)
+        self.assertEqual(backfill.page, 3)
+        self.assertEqual(backfill.imported, 3)
+
+        self.assertEqual(run_strava_backfills(max_pages=2), 1)
+        backfill.refresh_from_db()
+        self.assertEqual(backfill.status, StravaBackfill.DONE)
+        self.assertEqual(backfill.imported, 4)
+        self.assertEqual([call.args[1] for call in mock_details.call_args_list],
+                         [[1], [3, 4], [5]])
+        self.assertEqual(StravaActivity.objects.filter(user=self.user).count(), 5)
+
+    @patch('users.selectors.fetch_strava_activities_details')
+    @patch('users.selectors.get_athlete_activities_from_strava')
+    def test_backfill_failure_keeps_checkpoint(self, mock_list, mock_details) -> None:
+        mock_list.return_value = [{'id': 1}, {'id': 2}]
+        mock_details.return_value = self._details([1])
+        backfill = schedule_strava_backfill(self.user, self.start, self.end)
+
+        run_strava_backfills()
+
+        backfill.refresh_from_db()
+        self.assertEqual(backfill.status, StravaBackfill.PENDING)
+        self.assertEqual(backfill.page, 1)
+        self.assertEqual(backfill.attempts, 1)
+        self.assertTrue(StravaActivity.objects.filter(strava_id=1).exists())
+
+
+    def test_reauthorization_reuses_pending_or_running_backfill(self) -> None:
+        backfill = schedule_strava_backfill(
+            self.user, self.end - datetime.timedelta(days=30),
+            self.end - datetime.timedelta(days=10))
+
+        self.assertEqual(schedule_strava_history_backfill(self.user), backfill)
+        self.assertEqual(schedule_strava_history_backfill(self.user), backfill)
+
+        backfill.refresh_from_db()
+        self.assertEqual((backfill.start_date, backfill.end_date), (self.start, self.end))
+        self.assertEqual(StravaBackfill.objects.count(), 1)
+
+        # started backfill keeps its checkpoint, earlier range is scheduled apart
+        StravaBackfill.objects.filter(id=backfill.id).update(
+            start_date=self.end, status=StravaBackfill.RUNNING, page=3)
+        schedule_strava_history_backfill(self.user)
+
+        self.assertEqual(
+            list(StravaBackfill.objects.order_by('id').values_list('start_date', 'end_date')),
+            [(self.end, self.end), (self.start, self.end - datetime.timedelta(days=1))])
+        StravaBackfill.objects.update(status=StravaBackfill.DONE)
+        self.assertNotEqual(schedule_strava_history_backfill(self.user), backfill)
+
+    @patch('users.selectors.fetch_strava_activities_details')
+    @patch('users.selectors.get_athlete_activities_from_strava')
+    def test_backfill_extended_while_running_walks_last_page_again(self, mock_list,
+                                                                  mock_details) -> None:
+        backfill = schedule_strava_backfill(
+            self.user, self.start, self.end - datetime.timedelta(days=1))
+
+        def list_and_reauthorize(user, start, end, page, per_page):
+            schedule_strava_history_backfill(self.user)
+            return [{'id': 1}]
+        mock_list.side_effect = list_and_reauthorize
+        mock_details.side_effect = lambda strava, ids: self._details(ids)
+
+        run_strava_backfills()
+
+        backfill.refresh_from_db()
+        self.assertEqual(backfill.status, StravaBackfill.PENDING)
+        self.assertEqual(backfill.page, 1)
+        self.assertEqual(backfill.end_date, self.end)
+        self.assertEqual(StravaBackfill.objects.count(), 1)
+
+
+@patch('mysite.settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID', '120475')
+class StravaWebhookServicesTests(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            name='testname',
+            password='authpass',
+        )
+        strava = self.user.strava
+        strava.access_token = 'access'
+        strava.refresh_token = 'refresh'
+        strava.expires_at = 2 ** 31
+        strava.athlete_id = 134815
+        strava.save()
+        self.events = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                                   'fixtures', 'strava_webhook_events.json')
+
+    @staticmethod
+    def _event(aspect_type: str, event_time: int, **kwargs) -> dict:
+        return {'aspect_type': aspect_type, 'event_time': event_time,
+                'object_id': 6123456789, 'object_type': 'activity',
+                'owner_id': 134815, 'subscription_id': 120475, **kwargs}
+
+    @patch('users.selectors.fetch_strava_activities_details')
+    def test_replaying_recorded_events(self, mock) -> None:
+        mock.side_effect = lambda strava, ids: {
+            id: {'id': id, 'name': 'Morning Run', 'calories': 300,
+                 'start_date_local': '2021-10-17T12:00:00Z'} for id in ids}
+
+        call_command('replay_strava_events', self.events, stdout=StringIO())
+        self.assertEqual(run_strava_activity_fetches(), 1)
+
+        mock.assert_called_once_with(self.user.strava, [6123456789])
+        activity = StravaActivity.objects.get()
+        self.assertEqual(activity.strava_id, 6123456789)
+        self.assertEqual(activity.calories, 300)
+        self.assertEqual(StravaActivityFetch.objects.get().status,
+                         StravaActivityFetch.DONE)
+
+    def test_newer_event_requeues_fetched_activity(self) -> None:
+        handle_strava_webhook_event(self._event('create', 100))
+        StravaActivityFetch.objects.update(status=StravaActivityFetch.DONE)
+
+        handle_strava_webhook_event(self._event('create', 100))
+        self.assertEqual(StravaActivityFetch.objects.get().status,
+                         StravaActivityFetch.DONE)
+        handle_strava_webhook_event(self._event('update', 200))
+        fetch = StravaActivityFetch.objects.get()
+        self.assertEqual(fetch.status, StravaActivityFetch.PENDING)
+        self.assertEqual(fetch.event_time, 200)
+
+    @patch('users.selectors.fetch_strava_activities_details')
+    def test_activities_calories_are_burned_calories_of_diary(self, mock) -> None:
+        day = datetime.date.today() - datetime.timedelta(days=3)
+        mock.side_effect = lambda strava, ids: {
+            id: {'id': id, 'name': 'Morning Run', 'calories': 300,
+                 'start_date_local': f'{day}T07:00:00Z'} for id in ids}
+        StravaActivity.objects.create(user=self.user, strava_id=1, name='ride',
+                                      calories=200, date=day)
+
+        handle_strava_webhook_event(self._event('create', 100))
+        run_strava_activity_fetches()
+
+        diary = HealthDiary.objects.get(user=self.user, date=day)
+        self.assertEqual(diary.burned_calories, 500)
+        self.assertEqual(HealthAnalytics.objects.get(
+            user=self.user, date=day).total_burned_calories, 500)
+
+        handle_strava_webhook_event(self._event('delete', 200))
+
+        diary.refresh_from_db()
+        self.assertEqual(diary.burned_calories, 200)
+        self.assertEqual(HealthAnalytics.objects.get(
+            user=self.user, date=day).total_burned_calories, 200)
+
+    def test_delete_event_removes_activity(self) -> None:
+        StravaActivity.objects.create(user=self.user, strava_id=6123456789,
+                                      name='run')
+        handle_strava_webhook_event(self._event('delete', 100))
+        self.assertFalse(StravaActivity.objects.exists())
+
+    def test_delete_event_keeps_activity_of_other_user(self) -> None:
+        other = get_user_model().objects.create_user(
+            email='other@gmail.com',
+            name='other',
+            password='authpass',
+        )
+        StravaActivity.objects.create(user=other, strava_id=6123456789, name='run')
+        StravaActivityFetch.objects.create(user=other, strava_id=6123456789)
+
+        handle_strava_webhook_event(self._event('delete', 100))
+
+        self.assertTrue(StravaActivity.objects.filter(user=other).exists())
+        self.assertTrue(StravaActivityFetch.objects.filter(user=other).exists())
+
+    def test_rejecting_events_without_configured_subscription(self) -> None:
+        with patch('mysite.settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID', None), \
+                self.assertRaises(ValidationError):
+            handle_strava_webhook_event(self._event('delete', 100))
+
+    def test_deauthorization_event_clears_tokens(self) -> None:
+        handle_strava_webhook_event({
+            'aspect_type': 'update', 'event_time': 100, 'object_id': 134815,
+            'object_type': 'athlete', 'owner_id': 134815,
+            'subscription_id': 120475, 'updates': {'authorized': 'false'}})
+        self.user.strava.refresh_from_db()
+        self.assertFalse(self.user.strava.access_token)
+
+
+class StravaTokenRefreshServicesTests(TestCase):
+
+    def _connected_user(self, email: str, expires_in: int):
+        user = get_user_model().objects.create_user(
+            email=email,
+            name=email.split('@')[0],
+            password='authpass',
+        )
+        strava = user.strava
+        strava.access_token = f'{email}-access'
+        strava.refresh_token = f'{email}-refresh'
+        strava.expires_at = int(time.time()) + expires_in
+        strava.save()
+        return strava
+
+    @staticmethod
+    def _refresh(refresh_token: str) -> dict:
+        if refresh_token.startswith('broken'):
+            raise ValidationError('Strava token refresh failed: 400')
+        return {'access_token': 'new-access', 'refresh_token': 'new-refresh',
+                'expires_at': int(time.time()) + 21600}
+
+    @patch('users.selectors.request_strava_token_refresh')
+    def test_refreshing_tokens_expiring_within_horizon(self, mock) -> None:
+        mock.side_effect = self._refresh
+        expiring = self._connected_user('expiring@gmail.com', 60)
+        expired = self._connected_user('expired@gmail.com', -60)
+        broken = self._connected_user('broken@gmail.com', 60)
+        valid = self._connected_user('valid@gmail.com', 7200)
+
+        self.assertEqual(refresh_expiring_strava_tokens(horizon=1800), (2, 1))
+
+        for strava in (expiring, expired):
+            strava.refresh_from_db()
+            self.assertEqual(strava.access_token, 'new-access')
+            self.assertGreater(strava.expires_at, time.time() + 1800)
+        broken.refresh_from_db()
+        self.assertEqual(broken.refresh_failures, 1)
+        self.assertEqual(broken.last_refresh_error, 'Strava token refresh failed: 400')
+        self.assertEqual(broken.access_token, 'broken@gmail.com-access')
+        valid.refresh_from_db()
+        self.assertEqual(valid.access_token, 'valid@gmail.com-access')
+
+    @patch('users.selectors.request_strava_token_refresh')
+    def test_not_overwriting_tokens_refreshed_meanwhile(self, mock) -> None:
+        mock.side_effect = self._refresh
+        refreshed = self._connected_user('refreshed@gmail.com', 60)
+        broken = self._connected_user('broken@gmail.com', 60)
+        connections = get_strava_connections_to_refresh()
+        # request refreshes tokens while worker waits for Strava
+        StravaApi.objects.update(access_token='inline-access',
+                                 refresh_token='inline-refresh')
+
+        with patch('users.selectors.get_strava_connections_to_refresh',
+                   return_value=connections):
+            self.assertEqual(refresh_expiring_strava_tokens(), (0, 0))
+
+        for strava in (refreshed, broken):
+            strava.refresh_from_db()
+            self.assertEqual(strava.access_token, 'inline-access')
+            self.assertEqual(strava.refresh_token, 'inline-refresh')
+            self.assertEqual(strava.refresh_failures, 0)
+
+    @patch('users.selectors.request_strava_token_refresh')
+    def test_connections_failing_too_often_are_skipped(self, mock) -> None:
+        mock.side_effect = self._refresh
+        broken = self._connected_user('broken@gmail.com', 60)
+        for i in range(settings.STRAVA_TOKEN_REFRESH_MAX_FAILURES):
+            refresh_expiring_strava_tokens()
+
+        self.assertEqual(refresh_expiring_strava_tokens(), (0, 0))
+        self.assertEqual(mock.call_count, settings.STRAVA_TOKEN_REFRESH_MAX_FAILURES)
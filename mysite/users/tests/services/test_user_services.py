@@ -1,10 +1,12 @@
 from django.test import TestCase
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from unittest.mock import patch
 from rest_framework.authtoken.models import Token
 
 from users.models import Group
+from users import selectors
 from users.services import (
     CreateUserDto,
     CreateUser,
@@ -351,3 +353,28 @@ class UserServicesTests(TestCase):
         with self.assertRaises(ValidationError):
             service.leave(self.user, dto)
             self.assertTrue(self.user.membership.filter(id=group.id).exists())
+
+    def test_group_membership_changes_invalidate_visible_recipe_owners(self) -> None:
+        user2 = self._create_user()
+        group = self.user.own_group
+        self.assertEqual(
+            set(selectors.group_get_visible_recipe_owners(user2).values()), {user2.id})
+
+        user2.pending_membership.add(group)
+        AcceptGroupInvitation().accept(user2, AcceptGroupInvitationDto(group_id=group.id))
+        owners = selectors.group_get_visible_recipe_owners(user2)
+        self.assertEqual(set(owners.values()), {user2.id, self.user.id})
+        with self.assertNumQueries(0):
+            selectors.group_get_visible_recipe_owners(user2)
+
+        LeaveGroup().leave(user2, LeaveGroupDto(group_id=group.id))
+        self.assertEqual(
+            set(selectors.group_get_visible_recipe_owners(user2).values()), {user2.id})
+        # entry cached before, like in cache of other process, is not read
+        # by request loading user with changed membership version
+        key = selectors.VISIBLE_RECIPE_OWNERS_CACHE_KEY.format(
+            user2.id, user2.membership_version - 1)
+        self.assertEqual(cache.get(key), owners)
+        user2 = get_user_model().objects.get(id=user2.id)
+        self.assertEqual(
+            set(selectors.group_get_visible_recipe_owners(user2).values()), {user2.id})